@@ -0,0 +1,187 @@
+# analytics_views.py (Rollup tables behind the database_analyzer tool)
+#
+# Almost every analytics question is an aggregate over enrollments, grades,
+# students and departments. These rollups keep the answers precomputed, keyed
+# by their primary keys, so the generated SQL reads a few hundred rows instead
+# of scanning the base tables:
+#   analytics_department_students  students per department
+#   analytics_course_enrollment    per course: enrollments, grades, average grade points, fails
+#   analytics_course_grades        per course and grade: number of students
+#   analytics_department_grades    per department: the course rollup summed up
+# Plain tables (not materialized views) so a grade submission can refresh just
+# the affected course and department in its own transaction; everything is
+# rebuilt every ANALYTICS_REFRESH_SECONDS. The DDL runs on PostgreSQL and SQLite.
+
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import inspect, text
+
+import shared_state
+from db_pool import connection
+from response_cache import invalidate_tables
+from tool_registry import resource, run_blocking
+
+log = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "900"))
+
+GRADE_POINTS = {"A+": 4.0, "A": 4.0, "A-": 3.7, "B+": 3.3, "B": 3.0, "B-": 2.7, "C+": 2.3, "C": 2.0,
+                "C-": 1.7, "D+": 1.3, "D": 1.0, "F": 0.0}
+
+ROLLUP_TABLES = ["analytics_department_students", "analytics_course_enrollment", "analytics_course_grades",
+                 "analytics_department_grades"]
+# Rollups that change when grades are submitted
+GRADE_ROLLUPS = ["analytics_course_enrollment", "analytics_course_grades", "analytics_department_grades"]
+
+DDL = [
+    """CREATE TABLE IF NOT EXISTS analytics_grade_points (
+        grade_value TEXT PRIMARY KEY, points DOUBLE PRECISION NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS analytics_department_students (
+        department_id INTEGER PRIMARY KEY, department_name TEXT, student_count INTEGER NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS analytics_course_enrollment (
+        course_id INTEGER PRIMARY KEY, course_name TEXT, department_id INTEGER, department_name TEXT,
+        enrollment_count INTEGER NOT NULL, graded_count INTEGER NOT NULL, grade_points_total DOUBLE PRECISION,
+        points_count INTEGER NOT NULL, average_grade_points DOUBLE PRECISION, fail_count INTEGER NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS ix_analytics_course_enrollment_department ON analytics_course_enrollment (department_id)",
+    "CREATE INDEX IF NOT EXISTS ix_analytics_course_enrollment_count ON analytics_course_enrollment (enrollment_count)",
+    """CREATE TABLE IF NOT EXISTS analytics_course_grades (
+        course_id INTEGER NOT NULL, grade_value TEXT NOT NULL, student_count INTEGER NOT NULL,
+        PRIMARY KEY (course_id, grade_value))""",
+    """CREATE TABLE IF NOT EXISTS analytics_department_grades (
+        department_id INTEGER PRIMARY KEY, department_name TEXT, course_count INTEGER NOT NULL,
+        enrollment_count INTEGER NOT NULL, graded_count INTEGER NOT NULL, average_grade_points DOUBLE PRECISION,
+        fail_count INTEGER NOT NULL)""",
+]
+
+DEPARTMENT_STUDENTS = """
+    INSERT INTO analytics_department_students (department_id, department_name, student_count)
+    SELECT d.department_id, d.name, count(s.student_id)
+    FROM departments d LEFT JOIN students s ON s.department_id = d.department_id
+    GROUP BY d.department_id, d.name"""
+
+COURSE_ENROLLMENT = """
+    INSERT INTO analytics_course_enrollment (course_id, course_name, department_id, department_name, enrollment_count,
+        graded_count, grade_points_total, points_count, average_grade_points, fail_count)
+    SELECT c.course_id, c.course_name, c.department_id, d.name, count(e.enrollment_id), count(g.enrollment_id),
+        sum(p.points), count(p.points), avg(p.points), sum(CASE WHEN p.points = 0 THEN 1 ELSE 0 END)
+    FROM courses c
+    LEFT JOIN departments d ON d.department_id = c.department_id
+    LEFT JOIN enrollments e ON e.course_id = c.course_id
+    LEFT JOIN grades g ON g.enrollment_id = e.enrollment_id
+    LEFT JOIN analytics_grade_points p ON p.grade_value = upper(trim(g.grade_value))
+    {where}
+    GROUP BY c.course_id, c.course_name, c.department_id, d.name"""
+
+COURSE_GRADES = """
+    INSERT INTO analytics_course_grades (course_id, grade_value, student_count)
+    SELECT e.course_id, upper(trim(g.grade_value)), count(*)
+    FROM enrollments e JOIN grades g ON g.enrollment_id = e.enrollment_id
+    {where}
+    GROUP BY e.course_id, upper(trim(g.grade_value))"""
+
+# Derived from the course rollup, so it costs one pass over a few hundred rows
+DEPARTMENT_GRADES = """
+    INSERT INTO analytics_department_grades (department_id, department_name, course_count, enrollment_count,
+        graded_count, average_grade_points, fail_count)
+    SELECT department_id, max(department_name), count(*), sum(enrollment_count), sum(graded_count),
+        sum(grade_points_total) / nullif(sum(points_count), 0), sum(fail_count)
+    FROM analytics_course_enrollment
+    WHERE department_id IS NOT NULL {where}
+    GROUP BY department_id"""
+
+# What the analytics prompt tells the LLM about the rollups
+VIEWS_PROMPT = """Precomputed summary tables (refreshed after every grade submission and every few minutes).
+Prefer them over aggregating the base tables whenever they contain the answer:
+- analytics_department_students(department_id, department_name, student_count)
+- analytics_course_enrollment(course_id, course_name, department_id, department_name, enrollment_count, graded_count,
+  average_grade_points, fail_count)  -- average_grade_points is on a 4.0 scale (A=4, B=3, C=2, D=1, F=0)
+- analytics_course_grades(course_id, grade_value, student_count)  -- grade distribution per course
+- analytics_department_grades(department_id, department_name, course_count, enrollment_count, graded_count,
+  average_grade_points, fail_count)"""
+
+
+def ensure_views(conn):
+    """Creates the rollup tables and the grade-point scale if they do not exist yet."""
+    for statement in DDL:
+        conn.execute(text(statement))
+    conn.execute(text("INSERT INTO analytics_grade_points (grade_value, points) VALUES (:grade, :points) "
+                      "ON CONFLICT (grade_value) DO NOTHING"),
+                 [{"grade": grade, "points": points} for grade, points in GRADE_POINTS.items()])
+
+
+def refresh_all(conn=None):
+    """Rebuilds every rollup in one transaction; readers keep seeing the old rows until it commits."""
+    if conn is None:
+        start = time.perf_counter()
+        with connection() as conn:
+            refresh_all(conn)
+        invalidate_tables(ROLLUP_TABLES)
+        return time.perf_counter() - start
+    ensure_views(conn)
+    for table in ROLLUP_TABLES:
+        conn.execute(text(f"DELETE FROM {table}"))
+    conn.execute(text(DEPARTMENT_STUDENTS))
+    conn.execute(text(COURSE_ENROLLMENT.format(where="")))
+    conn.execute(text(COURSE_GRADES.format(where="")))
+    conn.execute(text(DEPARTMENT_GRADES.format(where="")))
+
+
+def refresh_course(conn, course_id):
+    """Incremental refresh after grades of `course_id` changed: its course rows and its department's row."""
+    params = {"course_id": course_id}
+    conn.execute(text("DELETE FROM analytics_course_enrollment WHERE course_id = :course_id"), params)
+    conn.execute(text(COURSE_ENROLLMENT.format(where="WHERE c.course_id = :course_id")), params)
+    conn.execute(text("DELETE FROM analytics_course_grades WHERE course_id = :course_id"), params)
+    conn.execute(text(COURSE_GRADES.format(where="WHERE e.course_id = :course_id")), params)
+    department_id = conn.execute(text("SELECT department_id FROM courses WHERE course_id = :course_id"), params).scalar()
+    if department_id is not None:
+        department = {"department_id": department_id}
+        conn.execute(text("DELETE FROM analytics_department_grades WHERE department_id = :department_id"), department)
+        conn.execute(text(DEPARTMENT_GRADES.format(where="AND department_id = :department_id")), department)
+
+
+def refresh_after_grades(conn, course_id):
+    """Called inside the grade submission transaction. A failure only leaves the rollups stale until the
+    next scheduled refresh; it never rolls back the grades."""
+    try:
+        with conn.begin_nested():
+            if not has_views(conn):
+                return
+            refresh_course(conn, course_id)
+    except Exception as e:
+        log.warning("Analytics rollups not refreshed for course %s (next scheduled refresh will): %s", course_id, e)
+
+
+def has_views(conn):
+    return inspect(conn).has_table("analytics_course_enrollment")
+
+
+@resource("analytics_views")
+def get_analytics_views():
+    """Makes sure the rollups exist and are populated before the first analytics question."""
+    with connection() as conn:
+        empty = not has_views(conn) or conn.execute(text("SELECT count(*) FROM analytics_department_students")).scalar() == 0
+    if empty:
+        seconds = refresh_all()
+        log.info("Analytics rollups built in %.2fs", seconds)
+        # The new tables must show up in the schema the SQL tools see
+        from schema_cache import schema_cache
+        schema_cache.invalidate(reflect=True)
+    return True
+
+
+async def refresh_periodically(interval=ANALYTICS_REFRESH_SECONDS):
+    """Background task for the API server: rebuilds the rollups every `interval` seconds (in one worker process)."""
+    while True:
+        await asyncio.sleep(interval)
+        if not shared_state.leader.acquire():
+            continue  # another worker process of this machine refreshes them
+        try:
+            seconds = await run_blocking(refresh_all)
+            log.info("Analytics rollups refreshed in %.2fs", seconds)
+        except Exception as e:
+            log.warning("Scheduled analytics refresh failed: %s", e)
@@ -1,52 +1,233 @@
 # api_server.py (Final Corrected Version)
 
-from fastapi import FastAPI, WebSocket, Request
-from fastapi.responses import HTMLResponse
+import asyncio
+import io
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, WebSocket, Request, HTTPException
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
 # Import your LangGraph app from the orchestrator file
-from main_orchestrator import app as langgraph_app
+from main_orchestrator import app as langgraph_app, compile_app, router
+from conversation_memory import async_sqlite_checkpointer, prune_checkpoints
 from langchain_core.messages import HumanMessage
+from db_pool import pool_stats
+from tool_registry import get_embedding_model, is_initialized, run_blocking
+from schema_cache import schema_cache
+import response_cache
+import query_library
+import metrics
+import sql_executor
+import analytics_views
+import generate_timetable_pdf
+import shared_state
+from notification_dispatcher import dispatcher
+from job_queue import job_queue, current_session
+import tracing
+
+log = logging.getLogger(__name__)
 
-api = FastAPI()
+@asynccontextmanager
+async def lifespan(api):
+    # Sessions live in the SQLite checkpointer for the lifetime of the server
+    global langgraph_app
+    # With several worker processes only the leader prunes (and never VACUUMs a file the others have open)
+    if shared_state.leader.acquire():
+        prune_checkpoints(vacuum=shared_state.WEB_CONCURRENCY == 1)
+    # The analytics rollups are rebuilt on a schedule (grade submissions refresh their course right away)
+    refresher = asyncio.create_task(analytics_views.refresh_periodically())
+    try:
+        async with async_sqlite_checkpointer() as checkpointer:
+            langgraph_app = compile_app(checkpointer)
+            yield
+    finally:
+        refresher.cancel()
+
+api = FastAPI(lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 
 @api.get("/", response_class=HTMLResponse)
 async def get_chat_page(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+@api.get("/pool-stats")
+async def get_pool_stats():
+    # Live size / checked-out / overflow numbers for the shared database pools
+    return pool_stats()
+
+@api.get("/cache-stats")
+async def get_cache_stats():
+    # Hit rate and latency saved by the caches in front of the SQL tools
+    stats = {"schema": schema_cache.stats(), "responses": response_cache.stats(), "query_library": query_library.stats()}
+    stats["timetable_pdfs"] = generate_timetable_pdf.render_cache.stats()
+    if is_initialized("embedding_model") and hasattr(get_embedding_model(), "stats"):
+        stats["query_embeddings"] = get_embedding_model().stats()
+    return stats
+
+@api.get("/latency-stats")
+async def get_latency_stats():
+    # Time to first byte, first token and whole turn over the last turns
+    return metrics.summary()
+
+@api.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus scrape target: per-stage span histograms, LLM tokens, turn latency and live gauges
+    gauges = {}
+    for kind, status in pool_stats().items():
+        gauges[f"db_pool_checked_out_{kind}"] = status.get("checkedout", 0)
+    jobs = job_queue.stats()
+    gauges["jobs_queued"], gauges["jobs_running"] = jobs["queued"], jobs["running"]
+    return metrics.prometheus(gauges)
+
+@api.get("/router-stats")
+async def get_router_stats():
+    # Questions answered on the fast path (per intent), fallbacks to the agent and LLM calls skipped
+    return router.stats()
+
+@api.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    # Status, progress and result of a background job (the same data the "job" frames carry)
+    job = await run_blocking(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job.to_dict()
+
+@api.get("/job-stats")
+async def get_job_stats():
+    return job_queue.stats()
+
+@api.get("/notifications/{batch_id}")
+async def get_notification_batch(batch_id: str):
+    # One row per recipient of a bulk_notifier batch: status, attempts, Twilio SID or error
+    deliveries = await run_blocking(dispatcher.log.batch, batch_id)
+    if not deliveries:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+    return {"batch": batch_id, "deliveries": deliveries}
+
+@api.get("/notification-stats")
+async def get_notification_stats():
+    return await run_blocking(dispatcher.stats)
+
+def _download(file_name, data, media_type):
+    # Rendered in memory and streamed from the buffer; nothing is written to disk
+    return StreamingResponse(io.BytesIO(data), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{file_name}"'})
+
+@api.get("/timetables/{semester_name}/export")
+async def export_timetables(semester_name: str, by: str = "department", format: str = "pdf"):
+    # Every department (or teacher) timetable of the semester: one multi-page PDF or a ZIP
+    try:
+        output = await run_blocking(generate_timetable_pdf.export_timetables, semester_name, by, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if output is None:
+        raise HTTPException(status_code=404, detail=f"No timetable for {semester_name}.")
+    return _download(*output, "application/pdf" if format == "pdf" else "application/zip")
+
+@api.get("/timetables/{semester_name}/{department_name}.pdf")
+async def get_timetable_pdf(semester_name: str, department_name: str):
+    output = await run_blocking(generate_timetable_pdf.timetable_pdf_bytes, semester_name, department_name)
+    if output is None:
+        raise HTTPException(status_code=404, detail=f"No timetable for {department_name}, {semester_name}.")
+    return _download(*output, "application/pdf")
+
+@api.get("/artifacts/{artifact_id}")
+async def get_artifact(artifact_id: str, format: str = "csv"):
+    # Full results of large SQL queries; the agent only saw a summary and this link
+    path = sql_executor.artifact_path(artifact_id, "csv")
+    if path is None or not os.path.exists(path) or format not in ("csv", "parquet"):
+        raise HTTPException(status_code=404, detail="Artifact not found or expired.")
+    if format == "parquet":
+        try:
+            path = await run_blocking(sql_executor.to_parquet, artifact_id)
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export needs pyarrow; download the CSV instead.")
+    media_type = "text/csv" if format == "csv" else "application/vnd.apache.parquet"
+    return FileResponse(path, media_type=media_type, filename=f"query_result_{artifact_id[:8]}.{format}")
+
+# Tool inputs/outputs can be large (SQL rows); the UI only needs a preview
+TOOL_PREVIEW_CHARS = 500
+
+def _preview(value):
+    text = getattr(value, "content", value)
+    text = text if isinstance(text, str) else str(text)
+    return text if len(text) <= TOOL_PREVIEW_CHARS else text[:TOOL_PREVIEW_CHARS] + "..."
+
+async def stream_turn(websocket: WebSocket, question: str, session_id: str):
+    """Runs one turn of session `session_id` and streams typed frames: token, tool_start, tool_end and final."""
+    timer = metrics.TurnTimer()
+
+    async def send(kind, data):
+        timer.frame(kind)
+        await send_frame(websocket, kind, data)
+
+    final_content = None
+    config = {"configurable": {"thread_id": session_id}}
+    # Jobs started by this turn's tools report their progress to this session
+    current_session.set(session_id)
+    # The root span of the turn: nodes, tools and their DB / LLM / embedding calls nest under it
+    with tracing.span("request", "turn", session=session_id):
+        async for event in langgraph_app.astream_events({"messages": [HumanMessage(content=question)]}, config, version="v2"):
+            kind = event["event"]
+            node = event.get("metadata", {}).get("langgraph_node")
+            if kind == "on_chat_model_stream" and node == "agent":
+                # Only the agent's own LLM calls are the answer; LLM calls inside tools (SQL generation) are not
+                token = event["data"]["chunk"].content
+                if token and isinstance(token, str):
+                    await send("token", token)
+            elif kind == "on_chain_start" and event["name"] == "action" and node == "action":
+                # The tool node starts: one frame per tool call of the agent's message
+                for call in event["data"]["input"]["messages"][-1].tool_calls:
+                    await send("tool_start", {"id": call["id"], "name": call["name"], "input": _preview(call["args"])})
+            elif kind == "on_chain_end" and event["name"] == "action" and node == "action":
+                # Tool results, including errors and timeouts (which never emit on_tool_end)
+                for message in event["data"]["output"]["messages"]:
+                    await send("tool_end", {"id": message.tool_call_id, "name": message.name,
+                                            "status": message.status, "output": _preview(message)})
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                # End of the whole graph run: the last message is the final answer
+                messages = event["data"]["output"].get("messages", [])
+                if messages:
+                    final_content = messages[-1].content
+
+    await send("final", final_content or "")
+    timer.done()
+
+async def send_frame(websocket: WebSocket, kind, data):
+    # Turn frames and job frames are sent from different tasks; one send at a time per socket
+    async with websocket.state.send_lock:
+        await websocket.send_json({"type": kind, "data": data})
+
+async def forward_jobs(websocket: WebSocket, updates):
+    """Pushes the session's job updates (queued, progress, finished) as "job" frames, during and between turns."""
+    while True:
+        await send_frame(websocket, "job", await updates.get())
+
 @api.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    websocket.state.send_lock = asyncio.Lock()
+    # ?session_id=... continues an earlier conversation (e.g. after a page reload)
+    session_id = websocket.query_params.get("session_id") or uuid.uuid4().hex
+    await send_frame(websocket, "session", session_id)
+    updates = job_queue.subscribe(session_id)
+    forwarder = asyncio.create_task(forward_jobs(websocket, updates))
     try:
         while True:
             data = await websocket.receive_text()
-            
-            # --- THIS IS THE CORRECTED LOGIC ---
-            async for event in langgraph_app.astream({"messages": [HumanMessage(content=data)]}):
-                # We iterate through the events as they happen
-                for key, value in event.items():
-                    if key == "agent":
-                        # If the event is from the agent, check if it's the final answer
-                        msg = value["messages"][-1]
-                        if not (hasattr(msg, "tool_calls") and msg.tool_calls):
-                            # It's the final answer! Clean it up.
-                            raw_content = msg.content
-                            clean_content = raw_content.split(', additional_kwargs=')[0]
-                            if clean_content.startswith("'"):
-                                clean_content = clean_content[1:]
-                            # Send the clean answer to the UI
-                            await websocket.send_json({"type": "final_answer", "data": clean_content})
-                    else:
-                        # For intermediate steps (like tool calls), send them for "Thinking..." state
-                        await websocket.send_json({"type": key, "data": str(value)})
-            
+            await stream_turn(websocket, data, session_id)
             # Send a final "done" message to let the UI know the process is complete
-            await websocket.send_json({"type": "done", "data": "Workflow complete."})
+            await send_frame(websocket, "done", "Workflow complete.")
 
     except Exception as e:
-        print(f"WebSocket Error: {e}")
+        log.warning("WebSocket error: %s", e)
     finally:
+        forwarder.cancel()
+        job_queue.unsubscribe(session_id, updates)
         await websocket.close()
 # To run this server, use the command in your terminal:
 # uvicorn api_server:api --reload
\ No newline at end of file
@@ -0,0 +1,125 @@
+# benchmarks/bench_analytics_views.py (Base-table aggregates vs. the analytics rollups)
+#
+# Usage: python -m benchmarks.bench_analytics_views [--students 100000] [--courses 600] [--repeat 5]
+#
+# Fills the local SQLite stand-in with a synthetic university (each student takes
+# --per-student courses, most of them graded; the usual foreign-key indexes exist),
+# then times the questions database_analyzer gets most often both ways: aggregated
+# from the base tables, as the old few-shot examples did, and read from the rollups.
+# Also reports the cost of a full refresh and of the incremental refresh that now
+# runs inside every grade submission.
+
+import argparse
+import random
+import sqlite3
+import time
+
+from benchmarks.standins import use_local_standins
+
+DEPARTMENTS = ["Computer Science", "Physics", "Chemistry", "Mathematics", "Biology", "Economics",
+               "History", "Philosophy", "Civil Engineering", "Electrical Engineering", "Psychology", "Law"]
+GRADES = ["A", "A-", "B+", "B", "B-", "C+", "C", "D", "F"]
+
+GRADE_POINTS_CASE = ("CASE g.grade_value WHEN 'A' THEN 4.0 WHEN 'A-' THEN 3.7 WHEN 'B+' THEN 3.3 WHEN 'B' THEN 3.0 "
+                     "WHEN 'B-' THEN 2.7 WHEN 'C+' THEN 2.3 WHEN 'C' THEN 2.0 WHEN 'D' THEN 1.0 WHEN 'F' THEN 0.0 END")
+
+# (question, base-table SQL, rollup SQL)
+QUESTIONS = [
+    ("students per department",
+     "SELECT d.name, count(s.student_id) FROM students s JOIN departments d ON s.department_id = d.department_id "
+     "GROUP BY d.name",
+     "SELECT department_name, student_count FROM analytics_department_students"),
+    ("top 10 courses by enrollment",
+     "SELECT c.course_name, count(e.student_id) AS n FROM enrollments e JOIN courses c ON e.course_id = c.course_id "
+     "GROUP BY c.course_name ORDER BY n DESC LIMIT 10",
+     "SELECT course_name, enrollment_count FROM analytics_course_enrollment ORDER BY enrollment_count DESC LIMIT 10"),
+    ("average grade per department",
+     f"SELECT d.name, avg({GRADE_POINTS_CASE}) FROM grades g JOIN enrollments e ON g.enrollment_id = e.enrollment_id "
+     "JOIN courses c ON e.course_id = c.course_id JOIN departments d ON c.department_id = d.department_id GROUP BY d.name",
+     "SELECT department_name, average_grade_points FROM analytics_department_grades"),
+    ("grade distribution of one course",
+     "SELECT g.grade_value, count(*) FROM grades g JOIN enrollments e ON g.enrollment_id = e.enrollment_id "
+     "WHERE e.course_id = 7 GROUP BY g.grade_value",
+     "SELECT grade_value, student_count FROM analytics_course_grades WHERE course_id = 7"),
+]
+
+
+def seed(db_path, students, courses, per_student, graded_share, rng):
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO departments (department_id, name) VALUES (?, ?)", enumerate(DEPARTMENTS, 1))
+    conn.executemany("INSERT INTO courses (course_id, course_name, department_id) VALUES (?, ?, ?)",
+                     ((c, f"Course {c}", c % len(DEPARTMENTS) + 1) for c in range(1, courses + 1)))
+    conn.executemany("INSERT INTO students (student_id, first_name, last_name, email, department_id) VALUES (?, ?, ?, ?, ?)",
+                     ((s, f"First{s}", f"Last{s}", f"student{s}@uni.edu", rng.randint(1, len(DEPARTMENTS)))
+                      for s in range(1, students + 1)))
+    enrollments = ((s, c) for s in range(1, students + 1) for c in rng.sample(range(1, courses + 1), per_student))
+    conn.executemany("INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)", enrollments)
+    conn.executemany("INSERT INTO grades (enrollment_id, grade_value) VALUES (?, ?)",
+                     ((e, rng.choice(GRADES)) for (e,) in conn.execute("SELECT enrollment_id FROM enrollments")
+                      if rng.random() < graded_share))
+    conn.executescript("""
+        CREATE INDEX ix_students_department ON students (department_id);
+        CREATE INDEX ix_enrollments_course ON enrollments (course_id, student_id);
+        CREATE INDEX ix_courses_department ON courses (department_id);
+        ANALYZE;
+    """)
+    conn.commit()
+    conn.close()
+
+
+def timed(repeat, func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=100000)
+    parser.add_argument("--courses", type=int, default=600)
+    parser.add_argument("--per-student", type=int, default=5, help="Courses each student is enrolled in.")
+    parser.add_argument("--graded-share", type=float, default=0.9)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = use_local_standins()
+    from sqlalchemy import text
+    import analytics_views
+    import db_pool
+    from grade_submitter import submit_grades_bulk
+
+    start = time.perf_counter()
+    seed(f"{workdir}/university.sqlite3", args.students, args.courses, args.per_student, args.graded_share, random.Random(7))
+    print(f"Seeded {args.students} students, {args.courses} courses, {args.students * args.per_student} enrollments "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    refresh = timed(1, analytics_views.refresh_all)
+    print(f"Full refresh of the rollups: {refresh * 1000:.0f} ms\n")
+
+    def run(sql):
+        with db_pool.connection() as conn:
+            return conn.execute(text(sql)).fetchall()
+
+    print(f"{'question':<34} {'base ms':>9} {'rollup ms':>10} {'speed-up':>9}")
+    for question, base_sql, rollup_sql in QUESTIONS:
+        assert len(run(base_sql)) == len(run(rollup_sql)), question
+        base = timed(args.repeat, lambda: run(base_sql))
+        rollup = timed(args.repeat, lambda: run(rollup_sql))
+        print(f"{question:<34} {base * 1000:>9.2f} {rollup * 1000:>10.3f} {base / rollup:>8.0f}x")
+
+    # Incremental refresh: what a grade submission for one course pays on top of the upsert
+    with db_pool.connection() as conn:
+        roster = [s for (s,) in conn.execute(text("SELECT student_id FROM enrollments WHERE course_id = 7"))]
+    grades = [(s, random.choice(GRADES)) for s in roster]
+    with_refresh = timed(args.repeat, lambda: submit_grades_bulk(7, grades))
+    with db_pool.connection() as conn:
+        course = timed(args.repeat, lambda: analytics_views.refresh_course(conn, 7))
+    print(f"\nGrade submission for course 7 ({len(roster)} students): {with_refresh * 1000:.1f} ms, "
+          f"of which the incremental refresh {course * 1000:.1f} ms (full refresh {refresh * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
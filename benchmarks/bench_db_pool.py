@@ -0,0 +1,90 @@
+# benchmarks/bench_db_pool.py (Connection counts under a growing number of concurrent sessions)
+#
+# Usage: python -m benchmarks.bench_db_pool [--sessions 1 8 32 128] [--queries 20] [--standins]
+#
+# Each simulated session issues the same mix of calls the agent makes during a
+# turn (SQL tool, scheduler helper, PDF query) from its own thread, and then the
+# async engine is exercised the same way with asyncio tasks. On Postgres the
+# server-side connection count comes from pg_stat_activity; on any backend the
+# pool's own counters show how many physical connections were ever opened.
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.standins import use_local_standins
+
+
+def server_connections(db_pool):
+    if db_pool.get_engine().dialect.name != "postgresql":
+        return None
+    return db_pool.run_query("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database();", fetch="one")[0]
+
+
+def one_session(queries, sleep_sql):
+    import db_pool
+    import scheduler
+    from tool_registry import get_sql_database
+    for i in range(queries):
+        if i % 3 == 0:
+            get_sql_database().run(sleep_sql)          # SQL / analytics tools
+        elif i % 3 == 1:
+            scheduler.run_query(sleep_sql, fetch="one")  # scheduler helper
+        else:
+            db_pool.run_query(sleep_sql, fetch="all")    # PDF generator
+
+
+async def async_sessions(sessions, queries, sleep_sql):
+    import db_pool
+
+    async def session():
+        for _ in range(queries):
+            await db_pool.arun_query(sleep_sql, fetch="one")
+
+    await asyncio.gather(*(session() for _ in range(sessions)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--queries", type=int, default=20, help="Queries per session.")
+    parser.add_argument("--standins", action="store_true", help="Run against a local SQLite file instead of DATABASE_URL.")
+    args = parser.parse_args()
+
+    if args.standins:
+        use_local_standins()
+
+    import db_pool
+    dialect = db_pool.get_engine().dialect.name
+    sleep_sql = "SELECT pg_sleep(0.005);" if dialect == "postgresql" else "SELECT 1;"
+    print(f"Backend: {dialect}  pool_size={db_pool.DB_POOL_SIZE} max_overflow={db_pool.DB_MAX_OVERFLOW}")
+    print(f"{'mode':<6}{'sessions':>9}{'calls':>8}{'seconds':>9}{'opened':>8}{'peak out':>10}{'server conns':>14}")
+
+    for sessions in args.sessions:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            list(pool.map(lambda _: one_session(args.queries, sleep_sql), range(sessions)))
+        elapsed = time.perf_counter() - start
+        stats = db_pool.pool_stats()["sync"]
+        print(f"{'sync':<6}{sessions:>9}{sessions * args.queries:>8}{elapsed:>9.2f}{stats['connects']:>8}"
+              f"{stats['peak_checked_out']:>10}{str(server_connections(db_pool)):>14}")
+
+    opened_before = 0
+    for sessions in args.sessions:
+        start = time.perf_counter()
+        asyncio.run(async_sessions(sessions, args.queries, sleep_sql))
+        elapsed = time.perf_counter() - start
+        stats = db_pool.pool_stats()["async"]
+        opened, opened_before = stats["connects"] - opened_before, stats["connects"]
+        print(f"{'async':<6}{sessions:>9}{sessions * args.queries:>8}{elapsed:>9.2f}{opened:>8}"
+              f"{stats['peak_checked_out']:>10}{str(server_connections(db_pool)):>14}")
+        # Each asyncio.run() gets a new loop; pooled asyncpg connections are bound to the old one.
+        asyncio.run(db_pool.get_async_engine().dispose())
+
+    print("\n'peak out' (connections held at once) never exceeds pool_size + max_overflow, however many sessions run.")
+    print("'opened' (cumulative for sync, per run for async) only grows past pool_size when overflow connections are recycled.")
+
+
+if __name__ == "__main__":
+    main()
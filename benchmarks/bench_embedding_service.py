@@ -0,0 +1,117 @@
+# benchmarks/bench_embedding_service.py (Query-encode latency and throughput under concurrent sessions)
+#
+# Usage: python -m benchmarks.bench_embedding_service [--sessions 1 16 64] [--queries 50] [--torch-threads 4]
+#                                                      [--fake-embeddings [--pass-ms 8 --item-ms 0.4]]
+#
+# Every session is a thread that encodes questions back to back, the way
+# concurrent RAG tool calls do. Three encoders are compared:
+#   direct        one embed_query (one forward pass) per question, as before
+#   batched       EmbeddingService with the cache off: concurrent questions share forward passes
+#   batched+cache EmbeddingService on a realistic mix where popular questions repeat
+# --fake-embeddings replaces the model with one that costs `pass-ms` per
+# forward pass plus `item-ms` per text and runs one pass at a time, like a CPU-bound model.
+
+import argparse
+import random
+import threading
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from benchmarks.bench_ingestion import SUBJECTS, percentile
+from embedding_service import EmbeddingService, configure_torch_threads
+
+
+class SimulatedEncoder(Embeddings):
+    """Deterministic vectors with the cost profile of a CPU-bound forward pass."""
+
+    def __init__(self, pass_ms, item_ms, size=384):
+        self.pass_ms, self.item_ms = pass_ms, item_ms
+        self.fake = DeterministicFakeEmbedding(size=size)
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock:
+            time.sleep((self.pass_ms + self.item_ms * len(texts)) / 1000)
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def unique_questions(session, count):
+    return [f"Session {session}: what does clause {i}.2 say about {SUBJECTS[i % len(SUBJECTS)]}?" for i in range(count)]
+
+
+def popular_questions(session, count, pool=200):
+    # Roughly Zipfian: a few questions ("attendance policy?") are asked by everyone
+    rng = random.Random(session)
+    weights = [1 / (rank + 1) for rank in range(pool)]
+    picks = rng.choices(range(pool), weights=weights, k=count)
+    return [f"What is the {SUBJECTS[i % len(SUBJECTS)]} policy for case {i}?" for i in picks]
+
+
+def run(encoder, sessions, questions_for):
+    latencies, lock = [], threading.Lock()
+
+    def session(index):
+        local = []
+        for question in questions_for(index):
+            start = time.perf_counter()
+            encoder.embed_query(question)
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--queries", type=int, default=50, help="Questions per session.")
+    parser.add_argument("--torch-threads", type=int, default=0, help="torch.set_num_threads for the real model (0 = default).")
+    parser.add_argument("--wait-ms", type=float, default=5.0, help="Micro-batch window.")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--fake-embeddings", action="store_true", help="Use the simulated encoder instead of all-MiniLM-L6-v2.")
+    parser.add_argument("--pass-ms", type=float, default=8.0, help="Simulated fixed cost per forward pass.")
+    parser.add_argument("--item-ms", type=float, default=0.4, help="Simulated cost per text in a pass.")
+    args = parser.parse_args()
+
+    if args.fake_embeddings:
+        model = SimulatedEncoder(args.pass_ms, args.item_ms)
+    else:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from tool_registry import EMBEDDING_MODEL_NAME
+        configure_torch_threads(args.torch_threads)
+        model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+        model.embed_query("warm up")
+
+    print(f"{'encoder':<14} {'sessions':>8} {'p50 ms':>9} {'p99 ms':>9} {'queries/s':>10} {'mean batch':>11} {'hit rate':>9}")
+    for sessions in args.sessions:
+        def unique(index):
+            return unique_questions(index, args.queries)
+
+        def popular(index):
+            return popular_questions(index, args.queries)
+
+        encoders = [
+            ("direct", model, unique),
+            ("batched", EmbeddingService(model, cache_size=0, wait_ms=args.wait_ms, max_batch=args.max_batch), unique),
+            ("batched+cache", EmbeddingService(model, wait_ms=args.wait_ms, max_batch=args.max_batch), popular),
+        ]
+        for name, encoder, questions_for in encoders:
+            latencies, seconds = run(encoder, sessions, questions_for)
+            stats = encoder.stats() if isinstance(encoder, EmbeddingService) else {"mean_batch": 1.0, "hit_rate": 0.0}
+            print(f"{name:<14} {sessions:>8} {percentile(latencies, 50):>9.2f} {percentile(latencies, 99):>9.2f} "
+                  f"{len(latencies) / seconds:>10.0f} {stats['mean_batch']:>11.2f} {stats['hit_rate']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
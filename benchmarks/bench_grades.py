@@ -0,0 +1,87 @@
+# benchmarks/bench_grades.py (Row-by-row vs. set-based grade submission)
+#
+# Usage: python -m benchmarks.bench_grades [--sizes 10 100 1000] [--latency-ms 0.5] [--repeat 3]
+#
+# Runs against the local SQLite stand-in. The legacy path is the old tool body:
+# one CTE + UPSERT per student through SQLDatabase.run (one round trip and one
+# transaction each). SQLite is in-process, so --latency-ms adds a simulated
+# network round trip to every statement to approximate a remote Postgres.
+
+import argparse
+import time
+
+from benchmarks.standins import use_local_standins
+
+LEGACY_QUERY = """
+    WITH TargetEnrollment AS (
+        SELECT enrollment_id FROM enrollments WHERE student_id = :student_id AND course_id = :course_id
+    )
+    INSERT INTO grades (enrollment_id, grade_value)
+    SELECT enrollment_id, :grade_value FROM TargetEnrollment WHERE true
+    ON CONFLICT (enrollment_id) DO UPDATE SET grade_value = EXCLUDED.grade_value;
+"""
+
+
+def legacy_submit(course_id, grades):
+    from tool_registry import get_sql_database
+    updated = 0
+    for student_id, grade_value in grades:
+        get_sql_database().run(LEGACY_QUERY, parameters={'student_id': student_id, 'course_id': course_id, 'grade_value': grade_value})
+        updated += 1
+    return updated
+
+
+def seed_course(course_id, students):
+    from sqlalchemy import text
+    import db_pool
+    with db_pool.connection() as conn:
+        db_pool.run_query("DELETE FROM grades;", conn=conn)
+        db_pool.run_query("DELETE FROM enrollments;", conn=conn)
+        conn.execute(text("INSERT INTO enrollments (student_id, course_id) VALUES (:student_id, :course_id)"),
+                     [{"student_id": s, "course_id": course_id} for s in range(1, students + 1)])
+
+
+def add_latency(seconds):
+    from sqlalchemy import event
+    import db_pool
+
+    @event.listens_for(db_pool.get_engine(), "before_cursor_execute")
+    def round_trip(*args):
+        time.sleep(seconds)
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency-ms", type=float, default=0.5, help="Simulated round trip per statement.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    use_local_standins()
+    from grade_submitter import submit_grades_bulk
+    from tool_registry import get_sql_database
+    get_sql_database()  # reflect the schema before timing anything
+    if args.latency_ms:
+        add_latency(args.latency_ms / 1000)
+
+    print(f"{'grades':>7} {'row-by-row s':>13} {'bulk s':>9} {'speed-up':>9}")
+    for size in args.sizes:
+        seed_course(1, size)
+        grades = [(s, "AB"[s % 2]) for s in range(1, size + 1)]
+        legacy = best_of(args.repeat, legacy_submit, 1, grades)
+        bulk = best_of(args.repeat, submit_grades_bulk, 1, grades)
+        print(f"{size:>7} {legacy:>13.4f} {bulk:>9.4f} {legacy / bulk:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# benchmarks/bench_load.py (Offline load test of api_server: throughput and per-tool / per-node latency)
+#
+# Usage: python -m benchmarks.bench_load [--sessions 16] [--turns 7] [--students 2000] [--llm-latency 0.05]
+#        python -m benchmarks.bench_load --save-baseline bench_baseline.json
+#        python -m benchmarks.bench_load --baseline bench_baseline.json [--tolerance 0.3]
+#
+# Nothing live is needed: the database is a SQLite synthetic university
+# (standins.seed_university, sized by --departments/--courses/--students), the
+# LLM is a ScriptedChatModel that answers each workload question with a fixed
+# tool call, Twilio is a FakeTwilioClient and the embeddings are deterministic
+# fakes. api_server runs in-process on a local port and --sessions WebSocket
+# clients each send --turns questions, cycling through workload() from a different
+# starting point. The intent router and the response cache are off (so every
+# turn runs the graph) unless --router / --cache are given.
+#
+# Client side it reports turns/s and turn latency; server side it reads the span
+# trace (tracing.TRACE_FILE) and reports count and p50/p95/p99 per graph node,
+# tool, background job (scheduler, PDF), LLM, embedding and DB statement.
+# --baseline compares the p95s of the turn and of every --gate span kind (node,
+# tool and job by default; single DB statements are too noisy) with a saved run
+# and exits with status 1 when one grew by more than --tolerance and by at least
+# --min-slack-ms, for CI.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from benchmarks.bench_ws_concurrency import free_port, start_server
+from benchmarks.fakes import use_fake_twilio, use_scripted_llm
+from benchmarks.standins import seed_university, use_fake_embeddings, use_local_standins
+
+# Span kinds reported, in this order (the "request" span is the whole turn, server side)
+KINDS = ("request", "node", "tool", "job", "llm", "embedding", "db")
+
+
+def workload(facts):
+    """(question, tool, args) per workload item; args None = the tool gets the question as its input."""
+    department, semester = facts["departments"][0], facts["semester"]
+    return [
+        ("How many students are enrolled in each department?", "student_database_query", None),
+        ("What does the department policy say about attendance?", "policy_and_course_retriever", None),
+        ("What is the average grade in every course?", "database_analyzer", None),
+        ("Send a WhatsApp reminder to the class representative.", "whatsapp_sender",
+         {"to": "whatsapp:+15550000001", "message": "Your timetable has been published."}),
+        (f"Submit the final grades for course {facts['course_id']}.", "grade_submitter",
+         {"course_id": facts["course_id"], "grades": [{"student_id": s, "grade": "B+"} for s in facts["course_students"]]}),
+        (f"Generate the {facts['empty_semester']} timetable for {department}.", "generate_schedule_logic",
+         {"semester_name": facts["empty_semester"], "department_name": department}),
+        (f"Make a PDF of the {semester} timetable for {department}.", "timetable_pdf_generator",
+         {"semester_name": semester, "department_name": department}),
+    ]
+
+
+def scripted_calls(items):
+    """The ScriptedChatModel script: each full question (lower-cased) maps to its tool call."""
+    return {question.lower(): (tool, args if args is not None else {"tool_input": question})
+            for question, tool, args in items if tool}
+
+
+# --- LOAD GENERATOR ---
+
+async def run_session(port, questions, turns, results):
+    import websockets
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws", max_size=None) as ws:
+        for question in questions:
+            start = time.perf_counter()
+            first_token, tool_errors = None, 0
+            await ws.send(question)
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame["type"] == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif frame["type"] == "tool_end" and frame["data"]["status"] == "error":
+                    tool_errors += 1
+                elif frame["type"] == "done":
+                    break
+            turns.observe(time.perf_counter() - start)
+            results.append({"question": question, "first_token": first_token, "tool_errors": tool_errors})
+
+
+async def run_load(port, items, sessions, turns_per_session):
+    from metrics import LatencyRecorder
+    turns, results = LatencyRecorder(window=None), []
+    questions = [item[0] for item in items]
+    plans = [[questions[(s + t) % len(questions)] for t in range(turns_per_session)] for s in range(sessions)]
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(run_session(port, plan, turns, results) for plan in plans), return_exceptions=True)
+    wall = time.perf_counter() - start
+    failed = [o for o in outcomes if isinstance(o, BaseException)]
+    return wall, turns, results, failed
+
+
+def wait_for_jobs(timeout):
+    """Background jobs (schedules, PDFs) outlive their turns; their spans are only written when they finish."""
+    from job_queue import job_queue, QUEUED, RUNNING
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = job_queue.stats()
+        if not stats[QUEUED] and not stats[RUNNING]:
+            return stats
+        time.sleep(0.1)
+    return job_queue.stats()
+
+
+# --- REPORT ---
+
+def span_latencies(trace_file):
+    """LatencyRecorder per "kind/name" from the JSON-lines span trace, plus error counts."""
+    from metrics import LatencyRecorder
+    recorders, errors = {}, {}
+    with open(trace_file, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            key = f"{span['kind']}/{span['name']}"
+            recorders.setdefault(key, LatencyRecorder(window=None)).observe(span["seconds"])
+            if span["status"] != "ok":
+                errors[key] = errors.get(key, 0) + 1
+    order = {kind: i for i, kind in enumerate(KINDS)}
+    keys = sorted(recorders, key=lambda k: (order.get(k.split("/", 1)[0], len(KINDS)), k))
+    return {key: {**recorders[key].summary(), "errors": errors.get(key, 0)} for key in keys}
+
+
+def print_report(report):
+    turn = report["turns"]
+    print(f"\n{report['sessions']} sessions x {report['turns_per_session']} turns in {report['wall_seconds']:.2f}s: "
+          f"{report['throughput']:.2f} turns/s, {report['failed_sessions']} failed session(s), "
+          f"{report['tool_errors']} tool error(s)")
+    print(f"turn latency (client) p50 {turn['p50']:.3f}s  p95 {turn['p95']:.3f}s  p99 {turn['p99']:.3f}s  max {turn['max']:.3f}s")
+    print(f"\n{'span':<44}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'mean ms':>9}{'errors':>8}")
+    for key, s in report["spans"].items():
+        print(f"{key[:43]:<44}{s['count']:>7}{s['p50'] * 1000:>9.1f}{s['p95'] * 1000:>9.1f}"
+              f"{s['p99'] * 1000:>9.1f}{s['mean'] * 1000:>9.1f}{s['errors']:>8}")
+
+
+def compare(report, baseline, tolerance, min_slack, kinds):
+    """p95 regressions against a saved report: (key, baseline s, now s) for each one over the tolerance."""
+    regressions = []
+    pairs = [("turns", baseline.get("turns", {}), report["turns"])]
+    pairs += [(key, baseline.get("spans", {}).get(key, {}), now) for key, now in report["spans"].items()
+              if key.split("/", 1)[0] in kinds]
+    for key, before, now in pairs:
+        if "p95" not in before or "p95" not in now:
+            continue
+        if now["p95"] > before["p95"] * (1 + tolerance) and now["p95"] - before["p95"] > min_slack:
+            regressions.append((key, before["p95"], now["p95"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=7, help="Questions per session (the workload has 7).")
+    parser.add_argument("--departments", type=int, default=4)
+    parser.add_argument("--courses", type=int, default=20, help="Courses per department.")
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per scripted LLM call.")
+    parser.add_argument("--twilio-latency", type=float, default=0.05, help="Seconds per fake Twilio send.")
+    parser.add_argument("--router", action="store_true", help="Leave the intent router on.")
+    parser.add_argument("--cache", action="store_true", help="Leave the response cache on.")
+    parser.add_argument("--job-timeout", type=float, default=120, help="Seconds to wait for background jobs after the load.")
+    parser.add_argument("--json", help="Also write the report to this file.")
+    parser.add_argument("--save-baseline", help="Write the report here as the new baseline.")
+    parser.add_argument("--baseline", help="Compare p95s with this report; exit 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed p95 growth over the baseline (0.3 = 30%%).")
+    parser.add_argument("--min-slack-ms", type=float, default=25, help="p95 growth below this is never a regression.")
+    parser.add_argument("--gate", nargs="+", default=["request", "node", "tool", "job"], choices=KINDS,
+                        help="Span kinds compared with the baseline.")
+    args = parser.parse_args()
+
+    # Before anything imports tracing: its spans are the per-node / per-tool source
+    workdir = use_local_standins()
+    trace_file = os.path.join(workdir, "traces.jsonl")
+    os.environ["TRACE_FILE"] = trace_file
+    os.environ["PDF_OUTPUT_DIR"] = os.path.join(workdir, "timetable_pdfs")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if not args.router:
+        os.environ["ROUTER_ENABLED"] = "0"
+    if not args.cache:
+        os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+
+    facts = seed_university(os.path.join(workdir, "university.sqlite3"), args.departments, args.courses,
+                            args.students, seed=args.seed)
+    items = workload(facts)
+    use_fake_embeddings()
+    twilio = use_fake_twilio(latency=args.twilio_latency)
+    use_scripted_llm(latency=args.llm_latency, script=scripted_calls(items))
+    print(f"Synthetic university: {len(facts['departments'])} departments, {facts['rows']['students']} students, "
+          f"{facts['rows']['enrollments']} enrollments ({workdir})")
+
+    port = free_port()
+    server = start_server(port)
+    # Warm-up: one turn of each question, so imports and lazy resources are not in the numbers
+    asyncio.run(run_load(port, items, 1, len(items)))
+    wait_for_jobs(args.job_timeout)
+    open(trace_file, "w").close()
+
+    wall, turns, results, failed = asyncio.run(run_load(port, items, args.sessions, args.turns))
+    jobs = wait_for_jobs(args.job_timeout)
+    server.should_exit = True
+
+    report = {
+        "sessions": args.sessions, "turns_per_session": args.turns, "students": facts["rows"]["students"],
+        "llm_latency": args.llm_latency, "wall_seconds": round(wall, 3),
+        "throughput": round(len(results) / wall, 3) if wall else 0.0,
+        "failed_sessions": len(failed), "tool_errors": sum(r["tool_errors"] for r in results),
+        "messages_sent": sum(1 for m in twilio.messages.sent if m is not None), "jobs": jobs,
+        "turns": turns.summary(), "spans": span_latencies(trace_file),
+    }
+    print_report(report)
+    for error in failed[:3]:
+        print(f"session failed: {error!r}")
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_slack_ms / 1000, args.gate)
+        for key, before, now in regressions:
+            print(f"REGRESSION {key}: p95 {before * 1000:.1f}ms -> {now * 1000:.1f}ms")
+        if regressions or failed:
+            sys.exit(1)
+        print(f"\nNo p95 regressions over {args.tolerance:.0%} against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# benchmarks/bench_notifications.py (Bulk notifications against a local stub of the Twilio API)
+#
+# Usage: python -m benchmarks.bench_notifications [--students 1600] [--rate 50] [--latency 0.1] [--throttle-every 25]
+#
+# Starts an HTTP stub of Twilio's Messages endpoint on a local port and points
+# TWILIO_API_BASE_URL at it, so the real Twilio SDK, the token bucket, the
+# retries and the delivery log are all exercised with nothing leaving the machine.
+# The stub answers after --latency seconds, returns a 429 for every
+# --throttle-every-th request and a 400 (invalid number) for numbers ending in 96.
+# One department of the synthetic university (students/departments students, 1%
+# without a number) is notified twice: the second run must send nothing, because
+# every message is already in the delivery log. Reports sends per second, the
+# busiest one-second window seen by the stub (it must stay within rate + burst),
+# retries and outcomes, and exits with status 1 when either check fails.
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from benchmarks.standins import seed_university, use_local_standins
+
+
+class TwilioStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency, throttle_every):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self.accepted = []  # arrival times of 201s
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def busiest_second(self):
+        times = sorted(self.accepted)
+        busiest, start = 0, 0
+        for end, t in enumerate(times):
+            while t - times[start] >= 1.0:
+                start += 1
+            busiest = max(busiest, end - start + 1)
+        return busiest
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        stub = self.server
+        arrived = time.monotonic()  # before the simulated latency, which only adds jitter to the window check
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode()).items()}
+        time.sleep(stub.latency)
+        with stub.lock:
+            stub.requests += 1
+            throttle = stub.throttle_every and stub.requests % stub.throttle_every == 0
+            if throttle:
+                stub.throttled += 1
+        if not self.path.endswith("/Messages.json"):
+            return self.reply(404, {"code": 20404, "message": "Not found", "status": 404})
+        if throttle:
+            return self.reply(429, {"code": 20429, "message": "Too Many Requests", "status": 429})
+        if form.get("To", "").endswith("96"):
+            return self.reply(400, {"code": 21211, "message": f"The 'To' number {form['To']} is not valid.", "status": 400})
+        with stub.lock:
+            stub.accepted.append(arrived)
+        self.reply(201, {"sid": f"SM{uuid.uuid4().hex}", "status": "queued", "to": form.get("To"),
+                         "from": form.get("From"), "body": form.get("Body")})
+
+
+def add_phone_numbers(db_path, missing_every=100):
+    """A phone_number column on students (the stand-in schema has none); every missing_every-th student has no number."""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("ALTER TABLE students ADD COLUMN phone_number TEXT")
+        conn.execute("UPDATE students SET phone_number = CASE WHEN student_id % ? = 0 THEN NULL "
+                     "ELSE '+1555' || printf('%07d', student_id) END", (missing_every,))
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=1600)
+    parser.add_argument("--departments", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=50, help="NOTIFY_RATE_PER_SECOND")
+    parser.add_argument("--burst", type=int, default=10, help="NOTIFY_BURST")
+    parser.add_argument("--concurrency", type=int, default=8, help="NOTIFY_CONCURRENCY")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds the stub takes per request.")
+    parser.add_argument("--throttle-every", type=int, default=25, help="Every n-th request gets a 429 (0 = never).")
+    args = parser.parse_args()
+
+    workdir = use_local_standins()
+    db_path = os.path.join(workdir, "university.sqlite3")
+    facts = seed_university(db_path, departments=args.departments, students=args.students)
+    add_phone_numbers(db_path)
+
+    stub = TwilioStub(args.latency, args.throttle_every)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    # Read when notification_dispatcher / tool_registry are imported
+    os.environ.update(TWILIO_API_BASE_URL=stub.url, NOTIFY_LOG_PATH=os.path.join(workdir, "notification_log.sqlite3"),
+                      NOTIFY_RATE_PER_SECOND=str(args.rate), NOTIFY_BURST=str(args.burst),
+                      NOTIFY_CONCURRENCY=str(args.concurrency), NOTIFY_BACKOFF_SECONDS="0.2", LOG_LEVEL="WARNING")
+    from notification_dispatcher import dispatcher, notify_audience
+
+    department = facts["departments"][0]
+    template = "Hello $first_name, the $department_name timetable has changed. Please check the portal."
+    print(f"Notifying the students of {department} (stub at {stub.url}, rate {args.rate:g}/s, burst {args.burst})")
+    print(f"{'run':>4}{'seconds':>9}{'sends/s':>9}{'requests':>10}{'429s':>6}{'busiest 1s':>12}  result")
+    sent = {}
+    for run in (1, 2):
+        requests_before, accepted_before, throttled_before = stub.requests, len(stub.accepted), stub.throttled
+        start = time.perf_counter()
+        result = notify_audience("department", template, department_name=department)
+        seconds = time.perf_counter() - start
+        accepted = sent[run] = len(stub.accepted) - accepted_before
+        print(f"{run:>4}{seconds:>9.2f}{accepted / seconds:>9.1f}{stub.requests - requests_before:>10}"
+              f"{stub.throttled - throttled_before:>6}{stub.busiest_second():>12}  {result}")
+    print(f"\ndispatcher: {dispatcher.stats()}")
+    stub.shutdown()
+
+    problems = []
+    if sent[2]:
+        problems.append(f"the second run sent {sent[2]} message(s); every one was already delivered")
+    if args.rate > 0 and stub.busiest_second() > args.rate + args.burst:
+        problems.append(f"{stub.busiest_second()} messages were accepted within one second, over rate + burst "
+                        f"({args.rate:g} + {args.burst})")
+    if problems:
+        raise SystemExit("FAILED: " + "; ".join(problems))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# benchmarks/bench_startup.py (Cold-start cost of the API server and each shared resource)
+#
+# Usage: python -m benchmarks.bench_startup [--fake-embeddings]
+#
+# Imports `api_server` against local stand-ins, then builds each resource in the
+# tool registry once and reports how long (and how much memory) each one costs.
+
+import argparse
+import resource
+import sys
+import time
+
+from benchmarks.standins import use_local_standins, use_fake_embeddings
+
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="Use a deterministic fake instead of downloading all-MiniLM-L6-v2.")
+    args = parser.parse_args()
+
+    workdir = use_local_standins()
+    print(f"Stand-ins created in {workdir}")
+    rss_before = max_rss_mb()
+
+    start = time.perf_counter()
+    import api_server  # noqa: F401
+    import_seconds = time.perf_counter() - start
+    rss_after_import = max_rss_mb()
+
+    import tool_registry
+    if args.fake_embeddings:
+        use_fake_embeddings()
+
+    print("\n--- COLD START ---")
+    print(f"import api_server: {import_seconds:8.3f}s   max RSS {rss_after_import:7.1f} MB (+{rss_after_import - rss_before:.1f})")
+    print(f"resources built during import: {sorted(tool_registry.INIT_TIMINGS) or 'none'}")
+
+    print("\n--- FIRST USE (per resource) ---")
+    for name in ["llm", "sql_database", "twilio_client", "embedding_model", "vectorstore"]:
+        rss_prev = max_rss_mb()
+        start = time.perf_counter()
+        tool_registry.get(name)
+        wall = time.perf_counter() - start
+        own = tool_registry.INIT_TIMINGS[name]
+        print(f"{name:<16} {wall:8.3f}s (factory {own:.3f}s)   max RSS +{max_rss_mb() - rss_prev:7.1f} MB")
+
+    start = time.perf_counter()
+    for name in tool_registry.INIT_TIMINGS:
+        tool_registry.get(name)
+    print(f"\nsecond lookup of every resource: {(time.perf_counter() - start) * 1e6:.1f}us total (shared, not rebuilt)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# benchmarks/bench_timetable_engine.py (Timetable engine vs. the old first-fit scan on synthetic departments)
+#
+# Usage: python -m benchmarks.bench_timetable_engine [--courses 20 100 300 800] [--seed 42] [--legacy]
+#        python -m benchmarks.bench_timetable_engine --departments 24 --courses 60 [--workers 1 4]
+#
+# Each synthetic department has courses/3 teachers, courses/6 student cohorts
+# (a fifth of the courses are shared by two cohorts), course sizes of 15-110
+# and rooms of 40/60/80/120 seats. No database is needed: the engine is fed
+# directly. Every result is checked with timetable_engine.validate, so a
+# "placed" count always means clash-free and within room capacity.
+#
+# --departments times scheduler.generate_schedule_batch's solve step for a whole
+# university (departments sharing one room pool): serial vs. a process pool,
+# including the cross-department room reconciliation.
+
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from timetable_engine import Lecture, Room, TimetableEngine, validate
+
+DAYS, PERIODS = 5, 5  # the scheduler's DAYS_OF_WEEK x TIME_SLOTS
+LECTURES_PER_COURSE = 2
+
+
+def synthetic_department(num_courses, seed, courses_per_room=6):
+    rng = random.Random(seed)
+    teachers = max(2, num_courses // 3)
+    cohorts = max(1, num_courses // 6)
+    rooms = [Room(i, [40, 60, 80, 120][i % 4]) for i in range(max(4, num_courses // courses_per_room))]
+    lectures = []
+    for course_id in range(num_courses):
+        teacher_id = rng.randrange(teachers)
+        groups = {rng.randrange(cohorts)}
+        if rng.random() < 0.2:
+            groups.add(rng.randrange(cohorts))
+        size = rng.randint(15, 110)
+        for _ in range(LECTURES_PER_COURSE):
+            lectures.append(Lecture(len(lectures), course_id, teacher_id, tuple(sorted(groups)), size))
+    return lectures, rooms
+
+
+def legacy_first_fit(lectures, rooms, seed):
+    """The pre-engine algorithm: shuffle, then scan a list of (day, period, room) for the first free triple."""
+    rng = random.Random(seed)
+    order = list(lectures)
+    rng.shuffle(order)
+    available_slots = [(d, p, r.room_id) for d in range(DAYS) for p in range(PERIODS) for r in rooms]
+    capacity = {r.room_id: r.capacity for r in rooms}
+    teacher_busy, cohort_busy, placements = set(), set(), {}
+    for lecture in order:
+        for i, (day, period, room_id) in enumerate(available_slots):
+            slot = day * PERIODS + period
+            if (lecture.teacher_id, slot) in teacher_busy or any((c, slot) in cohort_busy for c in lecture.cohort_ids):
+                continue
+            if capacity[room_id] and lecture.size > capacity[room_id]:
+                continue
+            placements[lecture.lecture_id] = (slot, room_id)
+            teacher_busy.add((lecture.teacher_id, slot))
+            cohort_busy.update((c, slot) for c in lecture.cohort_ids)
+            available_slots.pop(i)
+            break
+    return placements
+
+
+def synthetic_university(num_departments, num_courses, seed):
+    """Scheduler-level inputs (courses, teachers, enrollments) per department, plus a shared room pool."""
+    from scheduler import department_seed
+    rng = random.Random(seed)
+    rooms = [Room(i, [40, 60, 80, 120][i % 4]) for i in range(max(4, num_departments * num_courses // 5))]
+    departments, next_id = {}, 0
+    for d in range(num_departments):
+        courses = list(range(next_id, next_id + num_courses))
+        teachers = list(range(next_id, next_id + max(2, num_courses // 3)))
+        next_id += num_courses
+        # Students follow a programme year of 5 courses and take 4 of them
+        years = [courses[i:i + 5] for i in range(0, num_courses, 5)]
+        enrollments = []
+        for s in range(num_courses * 10):
+            year = years[s % len(years)]
+            enrollments += [(next_id * 1000 + s, c) for c in rng.sample(year, min(4, len(year)))]
+        departments[f"Department {d}"] = (courses, teachers, enrollments, rooms, {}, department_seed(seed, f"Department {d}"))
+    return departments, rooms
+
+
+def run_batch(num_departments, num_courses, workers, seed):
+    from scheduler import _plan_task, plan_department, reconcile_rooms
+    tasks, rooms = synthetic_university(num_departments, num_courses, seed)
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            plans = dict(zip(tasks, pool.map(_plan_task, tasks.values())))
+    else:
+        plans = {name: plan_department(*task) for name, task in tasks.items()}
+    moved, resolved = reconcile_rooms(plans, tasks, rooms, {})
+    seconds = time.perf_counter() - start
+    placed = sum(len(rows) for rows, _ in plans.values())
+    unplaced = sum(len(missing) for _, missing in plans.values())
+    print(f"{num_departments:>6} {num_departments * num_courses:>8} {len(rooms):>6} {workers:>8} {placed:>8} "
+          f"{unplaced:>9} {moved:>11} {len(resolved):>9} {seconds:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--courses", type=int, nargs="+", default=[20, 100, 300, 800])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--legacy", action="store_true", help="Also time the old first-fit list scan.")
+    parser.add_argument("--departments", type=int, help="Benchmark batch scheduling of this many departments instead.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="Process counts for --departments.")
+    args = parser.parse_args()
+
+    if args.departments:
+        print(f"{'depts':>6} {'courses':>8} {'rooms':>6} {'workers':>8} {'placed':>8} {'unplaced':>9} "
+              f"{'room moves':>11} {'re-solved':>9} {'seconds':>9}")
+        for num_courses in args.courses:
+            for workers in args.workers:
+                run_batch(args.departments, num_courses, workers, args.seed)
+        return
+
+    header = f"{'courses':>8} {'lectures':>9} {'rooms':>6} {'placed':>8} {'unplaced':>9} {'repaired':>9} {'seconds':>9}"
+    if args.legacy:
+        header += f" {'legacy placed':>14} {'legacy s':>9}"
+    print(header)
+    for num_courses in args.courses:
+        lectures, rooms = synthetic_department(num_courses, args.seed)
+        start = time.perf_counter()
+        result = TimetableEngine(DAYS, PERIODS, rooms, seed=args.seed).solve(lectures)
+        seconds = time.perf_counter() - start
+        problems = validate(result, lectures, rooms)
+        if problems:
+            raise SystemExit(f"Engine produced {len(problems)} violation(s), e.g. {problems[0]}")
+
+        line = (f"{num_courses:>8} {len(lectures):>9} {len(rooms):>6} {len(result.placements):>8} "
+                f"{len(result.unplaced):>9} {result.repaired:>9} {seconds:>9.3f}")
+        if args.legacy:
+            start = time.perf_counter()
+            legacy = legacy_first_fit(lectures, rooms, args.seed)
+            line += f" {len(legacy):>14} {time.perf_counter() - start:>9.3f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
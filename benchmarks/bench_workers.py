@@ -0,0 +1,118 @@
+# benchmarks/bench_workers.py (Throughput of api_server with 1, 2, 4 ... worker processes on one machine)
+#
+# Usage: python -m benchmarks.bench_workers [--workers 1 2 4] [--sessions 16] [--turns 7] [--llm-latency 0.05]
+#
+# For each worker count it starts gunicorn with gunicorn.conf.py (or, where
+# gunicorn is not installed, `uvicorn --workers N`) on benchmarks.serve_standins:api,
+# so every worker runs the bench_load stand-ins against one shared synthetic
+# university and the shared session / cache / job files of shared_state.py. The
+# same bench_load workload is then sent over --sessions WebSocket sessions and
+# turns/s, p50/p95 turn latency and the speed-up over the first worker count are
+# reported. Each session keeps one connection, so it stays on one worker.
+# Throughput can only grow with workers while there are idle CPU cores: compare
+# the speed-up with the core count printed at the top.
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.bench_load import run_load, workload
+from benchmarks.bench_ws_concurrency import free_port
+from benchmarks.standins import seed_university, use_local_standins
+
+
+def start_workers(workers, port, env):
+    env = {**env, "WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{port}"}
+    if shutil.which("gunicorn"):
+        command = ["gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning", "benchmarks.serve_standins:api"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "benchmarks.serve_standins:api", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    process = subprocess.Popen(command, env=env)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{command[0]} exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/job-stats", timeout=1).close()
+            return process, command[0] if command[0] == "gunicorn" else "uvicorn"
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The workers did not start within 120s")
+
+
+def stop_workers(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=7, help="Questions per session (the workload has 7).")
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per scripted LLM call.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    workdir = use_local_standins()
+    db_path = os.path.join(workdir, "university.sqlite3")
+    facts = seed_university(db_path, students=args.students)
+    # Several processes write the university (grades, timetables); Postgres would not need this
+    sqlite3.connect(db_path).execute("PRAGMA journal_mode=WAL").connection.close()
+    facts_path = os.path.join(workdir, "facts.json")
+    with open(facts_path, "w", encoding="utf-8") as f:
+        json.dump(facts, f)
+    env = {**os.environ, "BENCH_FACTS": facts_path, "BENCH_LLM_LATENCY": str(args.llm_latency),
+           "PDF_OUTPUT_DIR": os.path.join(workdir, "timetable_pdfs"),
+           "RESPONSE_CACHE_PATH": os.path.join(workdir, "response_cache.sqlite3"),
+           "JOB_STORE_PATH": os.path.join(workdir, "job_store.sqlite3"),
+           "NOTIFY_LOG_PATH": os.path.join(workdir, "notification_log.sqlite3"),
+           "LEADER_LOCK_PATH": os.path.join(workdir, "uniautomate.leader.lock"),
+           "ROUTER_ENABLED": "0", "RESPONSE_CACHE_ENABLED": "0", "LOG_LEVEL": "WARNING"}
+    items = workload(facts)
+    print(f"{os.cpu_count()} CPU core(s); {args.sessions} sessions x {args.turns} turns, LLM latency {args.llm_latency}s "
+          f"({workdir})")
+    print(f"{'workers':>8}{'server':>9}{'seconds':>9}{'turns/s':>9}{'p50 s':>8}{'p95 s':>8}{'speed-up':>10}{'failed':>8}")
+
+    results = []
+    for workers in args.workers:
+        port = free_port()
+        process, server = start_workers(workers, port, env)
+        try:
+            # Warm-up: every worker has to build its lazy resources once
+            asyncio.run(run_load(port, items, workers * 2, len(items)))
+            wall, turns, done, failed = asyncio.run(run_load(port, items, args.sessions, args.turns))
+        finally:
+            stop_workers(process)
+        summary = turns.summary()
+        throughput = len(done) / wall if wall else 0.0
+        speedup = throughput / results[0]["throughput"] if results and results[0]["throughput"] else 1.0
+        results.append({"workers": workers, "server": server, "wall_seconds": round(wall, 3),
+                        "throughput": round(throughput, 3), "p50": summary.get("p50"), "p95": summary.get("p95"),
+                        "speedup": round(speedup, 2), "failed_sessions": len(failed)})
+        print(f"{workers:>8}{server:>9}{wall:>9.2f}{throughput:>9.2f}{summary.get('p50', 0):>8.3f}"
+              f"{summary.get('p95', 0):>8.3f}{speedup:>9.2f}x{len(failed):>8}")
+        for error in failed[:3]:
+            print(f"    session failed: {error!r}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": os.cpu_count(), "sessions": args.sessions, "turns_per_session": args.turns,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
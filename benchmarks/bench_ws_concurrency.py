@@ -0,0 +1,92 @@
+# benchmarks/bench_ws_concurrency.py (Many WebSocket sessions making progress together)
+#
+# Usage: python -m benchmarks.bench_ws_concurrency [--sessions 1 8 32 64] [--llm-latency 0.2]
+#
+# Starts api_server in-process on a local port with a scripted LLM and a SQLite
+# database, opens N WebSocket sessions at once and sends one question on each.
+# Every turn makes three LLM calls (agent -> SQL generation -> agent) plus a
+# query, so one session takes ~3 x llm-latency. If the event loop were blocked
+# by any of them, wall time would grow linearly with N; with the async paths it
+# stays close to a single session's latency.
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+
+from benchmarks.standins import use_local_standins
+from benchmarks.fakes import use_scripted_llm
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port):
+    import uvicorn
+    import api_server
+    server = uvicorn.Server(uvicorn.Config(api_server.api, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def one_session(port, question, started_at, timeline):
+    import websockets
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws") as ws:
+        await ws.send(question)
+        first_frame = None
+        while True:
+            frame = json.loads(await ws.recv())
+            now = time.perf_counter() - started_at
+            if frame["type"] == "session":
+                continue
+            if first_frame is None:
+                first_frame = now
+            if frame["type"] == "done":
+                timeline.append((first_frame, now))
+                return now
+
+
+async def run_round(port, sessions):
+    timeline = []
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one_session(port, "How many students are there?", started_at, timeline)
+                           for _ in range(sessions)))
+    return time.perf_counter() - started_at, timeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    use_local_standins()
+    use_scripted_llm(latency=args.llm_latency)
+    # The question is one the intent router answers without the LLM; this benchmark measures the LLM path
+    os.environ["ROUTER_ENABLED"] = "0"
+    port = free_port()
+    server = start_server(port)
+
+    print(f"{'sessions':>8}{'wall s':>9}{'mean s':>9}{'max s':>9}{'first frame (max) s':>22}{'overlap':>9}")
+    for sessions in args.sessions:
+        wall, timeline = asyncio.run(run_round(port, sessions))
+        totals = [done for _, done in timeline]
+        # overlap = summed session time / wall time; ~N means all sessions ran concurrently
+        overlap = sum(totals) / wall
+        print(f"{sessions:>8}{wall:>9.2f}{statistics.mean(totals):>9.2f}{max(totals):>9.2f}"
+              f"{max(first for first, _ in timeline):>22.2f}{overlap:>9.1f}")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
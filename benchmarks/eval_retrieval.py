@@ -0,0 +1,98 @@
+# benchmarks/eval_retrieval.py (Recall and latency of dense, BM25 and hybrid retrieval)
+#
+# Usage: python -m benchmarks.eval_retrieval [--k 2] [--synthetic 500] [--rerank] [--fake-embeddings]
+#
+# Ingests ./knowledge_base (plus optional synthetic policy documents) into a
+# temporary store, then asks a fixed question set. A question counts as
+# recalled when one of the top-k chunks contains its expected text. Exact
+# lookups (course codes, section and clause numbers) are where dense-only
+# retrieval loses and BM25 + RRF is expected to win.
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_ingestion import SUBJECTS, percentile, write_document
+
+# (question, text the retrieved chunk must contain)
+QUESTIONS = [
+    ("What are the prerequisites for CS210?", "CS210"),
+    ("How many credits is CS202 worth?", "CS202"),
+    ("Which course teaches neural networks and reinforcement learning?", "AI405"),
+    ("What is covered in SE350?", "SE350"),
+    ("Is Python used in the intro programming course?", "CS101"),
+    ("What happens on a second plagiarism offense?", "Second Offense"),
+    ("What is the minimum attendance requirement?", "80%"),
+    ("What does Section 3 of the policy say?", "Section 3"),
+    ("What percentage is a B grade?", "B: 80-89%"),
+    ("Is there a curve on grades?", "no curve"),
+    ("When must a medical certificate be submitted?", "medical certificate"),
+    ("Which tool is used to detect plagiarism in code?", "MOSS"),
+]
+
+
+def synthetic_questions(count, documents, rng):
+    """Clause lookups into the synthetic documents written by bench_ingestion.write_document."""
+    questions = []
+    for _ in range(count):
+        index = rng.randrange(documents)
+        questions.append((f"What does clause {index}.1 say about {SUBJECTS[index % len(SUBJECTS)]}?", f"clause {index}.1 "))
+    return questions
+
+
+def evaluate(name, search, questions, k):
+    hits, latencies = 0, []
+    for question, expected in questions:
+        start = time.perf_counter()
+        documents = search(question)[:k]
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += any(expected in doc.page_content for doc in documents)
+    print(f"{name:<16} {hits / len(questions):>9.2f} {statistics.median(latencies):>10.2f} {percentile(latencies, 95):>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--k", type=int, default=2, help="Chunks handed to the LLM (the tool's RAG_TOP_K).")
+    parser.add_argument("--synthetic", type=int, default=0, help="Add this many synthetic policy documents.")
+    parser.add_argument("--rerank", action="store_true", help="Also evaluate hybrid + cross-encoder rerank.")
+    parser.add_argument("--fake-embeddings", action="store_true", help="Deterministic fake embeddings (dense results become meaningless).")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="uniautomate_eval_")
+    knowledge_base = os.path.join(workdir, "knowledge_base")
+    shutil.copytree("knowledge_base", knowledge_base)
+    rng = random.Random(11)
+    for index in range(args.synthetic):
+        write_document(knowledge_base, index, rng)
+    os.environ["CHROMA_PERSIST_DIRECTORY"] = os.path.join(workdir, "chroma_db")
+    if args.fake_embeddings:
+        from benchmarks.standins import use_fake_embeddings
+        use_fake_embeddings()
+
+    import ingest_knowledge_base
+    from hybrid_retriever import HybridRetriever
+    stats = ingest_knowledge_base.ingest(knowledge_base)
+    print(f"Ingested {stats['chunks']} chunks from {stats['files']} files in {stats['seconds']:.1f}s")
+
+    questions = list(QUESTIONS)
+    if args.synthetic:
+        questions += synthetic_questions(40, args.synthetic, random.Random(3))
+
+    retriever = HybridRetriever(top_k=args.k)
+    retriever.invoke("warm up")  # loads the embedding model and the BM25 index
+    print(f"{'retriever':<16} {'recall@' + str(args.k):>9} {'p50 ms':>10} {'p95 ms':>10}")
+    evaluate("dense", retriever.dense, questions, args.k)
+    evaluate("bm25", retriever.lexical, questions, args.k)
+    evaluate("hybrid rrf", retriever.invoke, questions, args.k)
+    if args.rerank:
+        reranked = HybridRetriever(top_k=args.k, rerank=True)
+        reranked.invoke("warm up")
+        evaluate("hybrid + rerank", reranked.invoke, questions, args.k)
+
+
+if __name__ == "__main__":
+    main()
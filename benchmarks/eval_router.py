@@ -0,0 +1,137 @@
+# benchmarks/eval_router.py (Accuracy of the intent router and the latency its fast path saves)
+#
+# Usage: python -m benchmarks.eval_router [--llm-latency 0.8] [--fake-embeddings]
+#
+# 1. Classifies a labelled question set (paraphrases that are not router
+#    examples, plus questions that must go to the agent) and reports accuracy,
+#    fast-path precision, coverage of routable questions and router latency.
+# 2. Runs every question through the orchestrator on a small SQLite university
+#    with a scripted LLM taking --llm-latency per call, once with the router
+#    and once without, and reports the turn time saved.
+# With --fake-embeddings only the pattern rules can fire (k-NN similarities are noise).
+
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.bench_ingestion import percentile
+from benchmarks.fakes import use_scripted_llm
+from benchmarks.standins import use_local_standins
+
+# (question, expected intent or None for "the agent must answer")
+LABELLED = [
+    ("How many students are there?", "count_students"),
+    ("how many students do we have", "count_students"),
+    ("What's the total number of students at the university?", "count_students"),
+    ("Give me the overall student headcount", "count_students"),
+    ("How many teachers are there?", "count_teachers"),
+    ("How many instructors does the university employ?", "count_teachers"),
+    ("How many courses are offered?", "count_courses"),
+    ("How many departments do we have?", "count_departments"),
+    ("Who is the head of the Physics department?", "department_head"),
+    ("who is the HOD of computer science", "department_head"),
+    ("Who heads Mathematics?", "department_head"),
+    ("What are the grades for student ali.khan@student.edu?", "student_grades"),
+    ("Show me the courses and grades of student sara.ahmed@student.edu", "student_grades"),
+    ("How many students are in each department?", "students_per_department"),
+    ("Number of students per department", "students_per_department"),
+    ("What are the top 5 courses with the most students?", "top_courses"),
+    ("What is the plagiarism policy?", "policy"),
+    ("What are the prerequisites for CS210?", "policy"),
+    ("How much do I need to attend to avoid failing?", "policy"),
+    ("What happens if I cheat on an exam twice?", "policy"),
+    ("How many students are in the Computer Science department?", None),
+    ("How many students got an A in Databases?", None),
+    ("Which students are failing CS101?", None),
+    ("What is the average grade per course?", None),
+    ("Send a WhatsApp to +923001234567 saying the exam moved to Friday", None),
+    ("Submit these grades for course 4: student 1 A, student 2 B", None),
+    ("Generate the Fall 2025 timetable for Physics", None),
+    ("Make a PDF of the Mathematics schedule for Spring 2026", None),
+    ("And what about the teachers?", None),
+    ("Which room is CS202 in on Monday?", None),
+]
+
+
+def seed(database_url):
+    from sqlalchemy import create_engine, text
+    engine = create_engine(database_url)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO departments VALUES (1, 'Computer Science', 1), (2, 'Physics', 2), (3, 'Mathematics', 3)"))
+        conn.execute(text("INSERT INTO teachers VALUES (1, 'Imran', 'Shah', 1), (2, 'Nadia', 'Rauf', 2), (3, 'Omar', 'Butt', 3)"))
+        conn.execute(text("INSERT INTO courses VALUES (1, 'Databases', 1), (2, 'Mechanics', 2), (3, 'Algebra', 3)"))
+        for i in range(1, 61):
+            conn.execute(text("INSERT INTO students VALUES (:i, 'S', :last, :email, :dept)"),
+                         {"i": i, "last": f"N{i}", "email": f"s{i}@student.edu", "dept": i % 3 + 1})
+            conn.execute(text("INSERT INTO enrollments VALUES (:i, :i, :course)"), {"i": i, "course": i % 3 + 1})
+            conn.execute(text("INSERT INTO grades VALUES (:i, 'B')"), {"i": i})
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="Seconds per scripted LLM call (GPT-4o is ~0.5-2s).")
+    parser.add_argument("--fake-embeddings", action="store_true", help="Skip loading all-MiniLM-L6-v2.")
+    args = parser.parse_args()
+
+    use_local_standins()
+    seed(os.environ["DATABASE_URL"])
+    use_scripted_llm(latency=args.llm_latency)
+    if args.fake_embeddings:
+        from benchmarks.standins import use_fake_embeddings
+        use_fake_embeddings()
+
+    import main_orchestrator
+    from langchain_core.messages import HumanMessage
+    router = main_orchestrator.router
+
+    # --- 1. CLASSIFICATION ---
+    router.classify("warm up")  # builds the example index
+    correct = routed = routed_correct = routable = covered = 0
+    latencies, mistakes = [], []
+    for question, expected in LABELLED:
+        start = time.perf_counter()
+        route = router.classify(question)
+        latencies.append((time.perf_counter() - start) * 1000)
+        got = route.intent if route else None
+        correct += got == expected
+        routed += got is not None
+        routed_correct += got is not None and got == expected
+        routable += expected is not None
+        covered += expected is not None and got == expected
+        if got != expected:
+            mistakes.append(f"  {question!r}: expected {expected}, got {got}" + (f" ({route.via}, {route.confidence})" if route else ""))
+
+    print(f"Questions: {len(LABELLED)} ({routable} routable)")
+    print(f"Accuracy:            {correct / len(LABELLED):.2f}")
+    print(f"Fast-path precision: {routed_correct / routed if routed else 0:.2f} ({routed} routed)")
+    print(f"Coverage:            {covered / routable:.2f} of routable questions answered without the agent")
+    print(f"Router latency:      p50 {statistics.median(latencies):.2f} ms, p99 {percentile(latencies, 99):.2f} ms")
+    if mistakes:
+        print("Misclassified:\n" + "\n".join(mistakes))
+
+    # --- 2. LATENCY SAVED ---
+    from response_cache import caches
+
+    def turn_seconds(enabled):
+        router.enabled = enabled
+        for cache in caches.values():
+            cache.clear()  # every pass starts cold, so repeated questions are not answered from the cache
+        seconds = []
+        for question, _ in LABELLED:
+            start = time.perf_counter()
+            main_orchestrator.app.invoke({"messages": [HumanMessage(content=question)]})
+            seconds.append(time.perf_counter() - start)
+        return seconds
+
+    turn_seconds(True)  # warm-up: builds the vector store, BM25 index and DB pools
+    with_router, without_router = turn_seconds(True), turn_seconds(False)
+    saved = sum(without_router) - sum(with_router)
+    print(f"\nTurn time with a {args.llm_latency}s LLM: "
+          f"mean {statistics.mean(without_router):.2f}s -> {statistics.mean(with_router):.2f}s without/with the router")
+    print(f"Saved {saved:.1f}s over {len(LABELLED)} turns; {router.stats()['llm_calls_skipped']} LLM calls skipped in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# benchmarks/fakes.py (Scripted stand-ins for the OpenAI chat model and the Twilio client)
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class ScriptedChatModel(BaseChatModel):
+    """A deterministic chat model that behaves like GPT-4o does in this app.
+
+    - As the agent (tools bound, last message from the user): calls the tool of the first `script`
+      keyword found in the question (lower-cased) with that entry's arguments, or else `tool_name`
+      with the question. The same question always gives the same call, including its ID.
+    - As the agent after a tool result: answers with the tool output.
+    - Inside a SQL chain (prompt ends with "SQL Query:"): returns `sql` in a ```sql block.
+    - Anywhere else (e.g. the RAG chain): returns a short canned answer.
+    `latency` seconds are spent per call, with time.sleep or asyncio.sleep. When streamed,
+    half of it passes before the first token and the rest is spread over the words.
+    """
+
+    latency: float = 0.2
+    tool_name: str = "student_database_query"
+    sql: str = "SELECT count(*) FROM students;"
+    script: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    bound_tools: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [getattr(t, "name", str(t)) for t in tools]
+        return self.model_copy(update={"bound_tools": names})
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+        text = last.content if isinstance(last.content, str) else str(last.content)
+        if self.bound_tools and isinstance(last, HumanMessage):
+            name, args = self.scripted_call(text)
+            call_id = hashlib.sha1(f"{len(messages)}:{text}".encode()).hexdigest()[:12]
+            return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{call_id}"}])
+        if self.bound_tools and isinstance(last, ToolMessage):
+            return AIMessage(content=f"Here is what I found: {last.content}")
+        if text.rstrip().endswith("SQL Query:"):
+            return AIMessage(content=f"```sql\n{self.sql}\n```")
+        return AIMessage(content="According to the department documents, the answer is in Section 2.")
+
+    def scripted_call(self, text):
+        lowered = text.lower()
+        for keyword, (name, args) in self.script.items():
+            if keyword in lowered:
+                return name, args
+        return self.tool_name, {"tool_input": text}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _chunks(self, messages):
+        message = self._respond(messages)
+        if message.tool_calls:
+            chunk = AIMessageChunk(content="", tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)])
+            return [ChatGenerationChunk(message=chunk)]
+        words = message.content.split(" ")
+        return [ChatGenerationChunk(message=AIMessageChunk(content=w if i == 0 else " " + w)) for i, w in enumerate(words)]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        chunks = self._chunks(messages)
+        time.sleep(self.latency / 2)
+        for chunk in chunks:
+            time.sleep(self.latency / 2 / len(chunks))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        chunks = self._chunks(messages)
+        await asyncio.sleep(self.latency / 2)
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / 2 / len(chunks))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def use_scripted_llm(latency=0.2, tool_name="student_database_query", sql="SELECT count(*) FROM students;", script=None):
+    """Installs a ScriptedChatModel as the shared LLM (call before importing the orchestrator)."""
+    import tool_registry
+    from tracing import llm_tracer
+    tool_registry.override("llm", lambda: ScriptedChatModel(latency=latency, tool_name=tool_name, sql=sql,
+                                                            script=script or {}, callbacks=[llm_tracer]))
+
+
+# --- TWILIO ---
+
+class FakeMessage:
+    def __init__(self, from_, to, body):
+        self.sid = f"SM{uuid.uuid4().hex}"
+        self.from_, self.to, self.body = from_, to, body
+        self.status = "queued"
+
+
+class FakeMessages:
+    """`client.messages` of the Twilio SDK: `create` / `create_async` take `latency` seconds and record the message."""
+
+    def __init__(self, latency, fail_every):
+        self.latency = latency
+        self.fail_every = fail_every  # every n-th send raises, like a 429 from the API (0 = never)
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def _record(self, from_, to, body):
+        with self._lock:
+            attempt = len(self.sent) + 1
+            if self.fail_every and attempt % self.fail_every == 0:
+                from twilio.base.exceptions import TwilioRestException
+                self.sent.append(None)
+                raise TwilioRestException(429, "/Messages.json", "Too Many Requests (fake)", code=20429, method="POST")
+            message = FakeMessage(from_, to, body)
+            self.sent.append(message)
+            return message
+
+    def create(self, from_=None, to=None, body=None, **kwargs):
+        time.sleep(self.latency)
+        return self._record(from_, to, body)
+
+    async def create_async(self, from_=None, to=None, body=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._record(from_, to, body)
+
+
+class FakeTwilioClient:
+    def __init__(self, latency=0.05, fail_every=0):
+        self.messages = FakeMessages(latency, fail_every)
+
+
+def use_fake_twilio(latency=0.05, fail_every=0):
+    """Installs one FakeTwilioClient as both Twilio clients and returns it (its `messages.sent` lists every send)."""
+    import tool_registry
+    client = FakeTwilioClient(latency, fail_every)
+    tool_registry.override("twilio_client", lambda: client)
+    tool_registry.override("async_twilio_client", lambda: client)
+    return client
@@ -0,0 +1,28 @@
+# benchmarks/serve_standins.py (api_server with the benchmark stand-ins, for multi-process runs)
+#
+# Usage: BENCH_FACTS=/tmp/.../facts.json gunicorn -c gunicorn.conf.py benchmarks.serve_standins:api
+#
+# Each worker process imports this module on its own, so the stand-ins that
+# bench_load installs in-process (fake embeddings, fake Twilio, the scripted LLM)
+# are installed here in every worker. Everything else (the SQLite university,
+# session memory, caches, job store) comes from the environment that
+# bench_workers.py prepared with use_local_standins.
+
+import datetime
+import json
+import os
+import sqlite3
+
+from benchmarks.bench_load import scripted_calls, workload
+from benchmarks.fakes import use_fake_twilio, use_scripted_llm
+from benchmarks.standins import use_fake_embeddings
+
+with open(os.environ["BENCH_FACTS"], encoding="utf-8") as f:
+    facts = json.load(f)
+
+sqlite3.register_adapter(datetime.time, datetime.time.isoformat)
+use_fake_embeddings()
+use_fake_twilio(latency=float(os.getenv("BENCH_TWILIO_LATENCY", "0.05")))
+use_scripted_llm(latency=float(os.getenv("BENCH_LLM_LATENCY", "0.05")), script=scripted_calls(workload(facts)))
+
+from api_server import api  # noqa: E402  (after the overrides, like bench_load)
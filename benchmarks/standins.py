@@ -0,0 +1,145 @@
+# benchmarks/standins.py (Local stand-ins so benchmarks run without live services)
+
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+
+
+def make_sqlite_university(path):
+    """Creates an empty SQLite copy of the university schema."""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS departments (department_id INTEGER PRIMARY KEY, name TEXT, hod_id INTEGER);
+        CREATE TABLE IF NOT EXISTS teachers (teacher_id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, department_id INTEGER);
+        CREATE TABLE IF NOT EXISTS students (student_id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, email TEXT, department_id INTEGER);
+        CREATE TABLE IF NOT EXISTS courses (course_id INTEGER PRIMARY KEY, course_name TEXT, department_id INTEGER);
+        CREATE TABLE IF NOT EXISTS enrollments (enrollment_id INTEGER PRIMARY KEY, student_id INTEGER, course_id INTEGER);
+        CREATE TABLE IF NOT EXISTS grades (enrollment_id INTEGER PRIMARY KEY, grade_value TEXT);
+        CREATE TABLE IF NOT EXISTS rooms (room_id INTEGER PRIMARY KEY, room_number TEXT, capacity INTEGER);
+        CREATE TABLE IF NOT EXISTS semesters (semester_id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE IF NOT EXISTS timetable (timetable_id INTEGER PRIMARY KEY, course_id INTEGER, teacher_id INTEGER, room_id INTEGER,
+                                              semester_id INTEGER, day_of_week TEXT, start_time TEXT, end_time TEXT);
+    """)
+    conn.commit()
+    conn.close()
+
+
+# --- SYNTHETIC UNIVERSITY ---
+DEPARTMENT_NAMES = ["Computer Science", "Physics", "Mathematics", "Chemistry", "Biology", "Economics", "History", "Philosophy"]
+FIRST_NAMES = ["Ayesha", "Bilal", "Sara", "Omar", "Hina", "Usman", "Zara", "Ali", "Fatima", "Hamza"]
+LAST_NAMES = ["Khan", "Ahmed", "Shah", "Malik", "Butt", "Rauf", "Qureshi", "Siddiqui", "Iqbal", "Chaudhry"]
+GRADES = ["A", "A-", "B+", "B", "B-", "C+", "C", "D", "F"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+PERIODS = [("09:00:00", "10:30:00"), ("10:30:00", "12:00:00"), ("12:00:00", "13:30:00"), ("13:30:00", "15:00:00"), ("15:00:00", "16:30:00")]
+SEEDED_SEMESTER = "Fall 2025"   # has a timetable (PDF, export and re-plan paths)
+EMPTY_SEMESTER = "Spring 2026"  # has none (the scheduler path writes it)
+
+
+def seed_university(path, departments=4, courses=20, students=1000, courses_per_student=4, graded=0.8, seed=42):
+    """Fills an empty stand-in database with a synthetic university and returns IDs a workload can ask about.
+
+    Per department: `courses` courses, courses/3 teachers and students/departments students, each
+    enrolled in `courses_per_student` of their department's courses (a `graded` share with a grade).
+    Rooms of 40-120 seats cover every course, and SEEDED_SEMESTER already has two lectures per course.
+    The same arguments always give the same rows.
+    """
+    rng = random.Random(seed)
+    names = [DEPARTMENT_NAMES[d] if d < len(DEPARTMENT_NAMES) else f"Department {d + 1}" for d in range(departments)]
+    teachers_per_department = max(2, courses // 3)
+    dept_rows, teacher_rows, course_rows = [], [], []
+    dept_courses, dept_teachers = {}, {}
+    for d, name in enumerate(names, start=1):
+        teacher_ids = list(range(len(teacher_rows) + 1, len(teacher_rows) + teachers_per_department + 1))
+        teacher_rows += [(t, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), d) for t in teacher_ids]
+        course_ids = list(range(len(course_rows) + 1, len(course_rows) + courses + 1))
+        course_rows += [(c, f"{name} {100 + i}", d) for i, c in enumerate(course_ids)]
+        dept_rows.append((d, name, teacher_ids[0]))
+        dept_courses[d], dept_teachers[d] = course_ids, teacher_ids
+
+    student_rows, enrollment_rows, grade_rows = [], [], []
+    for s in range(1, students + 1):
+        d = s % departments + 1
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        student_rows.append((s, first, last, f"{first.lower()}.{last.lower()}{s}@student.edu", d))
+        for course_id in rng.sample(dept_courses[d], min(courses_per_student, courses)):
+            enrollment_id = len(enrollment_rows) + 1
+            enrollment_rows.append((enrollment_id, s, course_id))
+            if rng.random() < graded:
+                grade_rows.append((enrollment_id, rng.choice(GRADES)))
+
+    room_rows = [(r, f"R-{100 + r}", [40, 60, 80, 120][r % 4]) for r in range(1, max(4, departments * courses // 5) + 1)]
+    timetable_rows = []
+    for d, course_ids in dept_courses.items():
+        teachers = dept_teachers[d]
+        for i, course_id in enumerate(course_ids):
+            for lecture in range(2):
+                n = len(timetable_rows)
+                slot = n % (len(DAYS) * len(PERIODS))
+                start, end = PERIODS[slot % len(PERIODS)]
+                room_id = room_rows[(n // (len(DAYS) * len(PERIODS))) % len(room_rows)][0]
+                timetable_rows.append((n + 1, course_id, teachers[i % len(teachers)], room_id, 1,
+                                       DAYS[slot // len(PERIODS)], start, end))
+
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany("INSERT INTO departments VALUES (?, ?, ?)", dept_rows)
+        conn.executemany("INSERT INTO teachers VALUES (?, ?, ?, ?)", teacher_rows)
+        conn.executemany("INSERT INTO courses VALUES (?, ?, ?)", course_rows)
+        conn.executemany("INSERT INTO students VALUES (?, ?, ?, ?, ?)", student_rows)
+        conn.executemany("INSERT INTO enrollments VALUES (?, ?, ?)", enrollment_rows)
+        conn.executemany("INSERT INTO grades VALUES (?, ?)", grade_rows)
+        conn.executemany("INSERT INTO rooms VALUES (?, ?, ?)", room_rows)
+        conn.executemany("INSERT INTO semesters VALUES (?, ?)", [(1, SEEDED_SEMESTER), (2, EMPTY_SEMESTER)])
+        conn.executemany("INSERT INTO timetable VALUES (?, ?, ?, ?, ?, ?, ?, ?)", timetable_rows)
+    conn.close()
+
+    first_course = course_rows[0][0]
+    return {
+        "departments": names,
+        "semester": SEEDED_SEMESTER,
+        "empty_semester": EMPTY_SEMESTER,
+        "course_id": first_course,
+        "course_students": [s for _, s, c in enrollment_rows if c == first_course][:5],
+        "teacher_id": teacher_rows[0][0],
+        "rows": {"students": len(student_rows), "enrollments": len(enrollment_rows), "timetable": len(timetable_rows)},
+    }
+
+
+def use_local_standins(workdir=None):
+    """Points every external dependency at something local and returns the work directory.
+
+    - Postgres -> a throwaway SQLite file
+    - OpenAI / Twilio -> dummy credentials (clients are constructed but never called)
+    - Chroma -> a temporary copy of ./chroma_db so the original is never touched
+    - session memory, query library, SQL artifacts -> files in the work directory
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="uniautomate_bench_")
+    db_path = os.path.join(workdir, "university.sqlite3")
+    make_sqlite_university(db_path)
+    chroma_dir = os.path.join(workdir, "chroma_db")
+    if os.path.isdir("chroma_db") and not os.path.isdir(chroma_dir):
+        shutil.copytree("chroma_db", chroma_dir)
+
+    # The scheduler binds datetime.time values (Postgres TIME columns); store them as "HH:MM:SS" text
+    sqlite3.register_adapter(datetime.time, datetime.time.isoformat)
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["CHROMA_PERSIST_DIRECTORY"] = chroma_dir
+    os.environ["MEMORY_DB_PATH"] = os.path.join(workdir, "session_memory.sqlite3")
+    os.environ["QUERY_LIBRARY_PATH"] = os.path.join(workdir, "query_library.sqlite3")
+    os.environ["ARTIFACT_DIR"] = os.path.join(workdir, "artifacts")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-local-standin")
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACstandin")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "standin")
+    os.environ.setdefault("TWILIO_FROM_NUMBER", "whatsapp:+10000000000")
+    return workdir
+
+
+def use_fake_embeddings(size=384):
+    """Swaps the HuggingFace model for a deterministic fake (no download, no torch), behind the same EmbeddingService."""
+    import tool_registry
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from embedding_service import EmbeddingService
+    tool_registry.override("embedding_model", lambda: EmbeddingService(DeterministicFakeEmbedding(size=size)))
@@ -0,0 +1,207 @@
+# conversation_memory.py (Per-session conversation memory with a bounded, summarized context)
+#
+# Sessions are LangGraph threads: a SQLite checkpointer stores each thread's
+# state, so a follow-up question sees the earlier turns. Before every turn the
+# "memory" node keeps that state inside CONTEXT_TOKEN_BUDGET:
+#   - ToolMessages of finished turns are cut to TOOL_RESULT_KEEP_CHARS (raw SQL
+#     result strings are what blow up the prompt; the agent's answer already
+#     carries what mattered),
+#   - if the thread is still over budget, the oldest whole turns are folded into
+#     a running summary by the LLM and removed from the state.
+# Turns are only ever split at HumanMessages, so no ToolMessage loses its tool call.
+
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+
+import shared_state
+
+log = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", "./session_memory.sqlite3")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))    # history (summary + messages) sent to the LLM
+RECENT_TOKEN_SHARE = float(os.getenv("RECENT_TOKEN_SHARE", "0.5"))      # part of the budget kept verbatim after summarizing
+TOOL_RESULT_KEEP_CHARS = int(os.getenv("TOOL_RESULT_KEEP_CHARS", "1200"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+
+SUMMARY_PROMPT = """You maintain the memory of a university administration assistant.
+Update the summary of the conversation with the new messages below. Keep every name, ID,
+course code, department, semester, date and decision the user may refer back to; drop raw
+tables and tool output that the assistant already answered from. At most {max_tokens} tokens.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+
+
+# --- TOKEN ACCOUNTING ---
+
+def count_tokens(message):
+    """Cheap token estimate (~4 characters per token); no tokenizer download on the request path."""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    size = len(content) + sum(len(str(call.get("args", ""))) for call in getattr(message, "tool_calls", None) or [])
+    return size // 4 + 4
+
+
+def split_turns(messages):
+    """Groups messages into turns, each starting at a HumanMessage."""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def trim_tool_message(message, keep=TOOL_RESULT_KEEP_CHARS):
+    """Returns a shortened copy with the same ID (so it replaces the stored one), or None if already small."""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    if len(content) <= keep:
+        return None
+    note = f"\n[... {len(content) - keep} characters of tool output dropped from memory; re-run the tool if they are needed]"
+    return ToolMessage(content=content[:keep] + note, tool_call_id=message.tool_call_id, name=message.name,
+                       id=message.id, status=message.status)
+
+
+def _transcript(messages):
+    lines = []
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        if isinstance(message, ToolMessage):
+            lines.append(f"[{message.name} result] {content[:TOOL_RESULT_KEEP_CHARS]}")
+        elif getattr(message, "tool_calls", None):
+            lines.append("assistant called " + ", ".join(f"{c['name']}({c['args']})" for c in message.tool_calls))
+        elif content:
+            lines.append(f"{message.type}: {content}")
+    return "\n".join(lines)
+
+
+# --- COMPACTION ---
+
+def plan_compaction(messages, summary, budget=CONTEXT_TOKEN_BUDGET, recent_share=RECENT_TOKEN_SHARE):
+    """Works out what to change before a turn.
+
+    Returns (replacements, older): trimmed copies of bulky ToolMessages from
+    finished turns, and the messages of the oldest turns that must be folded
+    into the summary (empty when the thread fits the budget).
+    """
+    turns = split_turns(messages)
+    replacements, sizes = [], []
+    for index, turn in enumerate(turns):
+        size = 0
+        for message in turn:
+            trimmed = trim_tool_message(message) if isinstance(message, ToolMessage) and index < len(turns) - 1 else None
+            if trimmed is not None:
+                replacements.append(trimmed)
+                message = trimmed
+            size += count_tokens(message)
+        sizes.append(size)
+
+    total = sum(sizes) + len(summary) // 4
+    if total <= budget or len(turns) < 2:
+        return replacements, []
+    # Keep the newest turns that fit in the recent share (always the current one)
+    kept, used = 1, sizes[-1]
+    while kept < len(turns) and used + sizes[-kept - 1] <= budget * recent_share:
+        used += sizes[-kept - 1]
+        kept += 1
+    older = [message for turn in turns[:-kept] for message in turn]
+    return replacements, older
+
+
+def _summary_messages(summary, older):
+    prompt = SUMMARY_PROMPT.format(max_tokens=SUMMARY_MAX_TOKENS, summary=summary or "(none)", transcript=_transcript(older))
+    return [HumanMessage(content=prompt)]
+
+
+def _update(replacements, older, summary):
+    dropped = {message.id for message in older}
+    update = {"messages": [m for m in replacements if m.id not in dropped] + [RemoveMessage(id=i) for i in dropped]}
+    if older:
+        update["summary"] = summary
+    return update
+
+
+def make_memory_node(llm):
+    """Returns (sync, async) node functions that compact the thread before the agent runs."""
+    summarizer = llm.bind(max_tokens=SUMMARY_MAX_TOKENS)
+
+    def memory_node(state):
+        summary = state.get("summary", "")
+        replacements, older = plan_compaction(state["messages"], summary)
+        if older:
+            log.info("Memory: summarizing %d older messages", len(older))
+            summary = summarizer.invoke(_summary_messages(summary, older)).content
+        return _update(replacements, older, summary)
+
+    async def amemory_node(state):
+        summary = state.get("summary", "")
+        replacements, older = plan_compaction(state["messages"], summary)
+        if older:
+            log.info("Memory: summarizing %d older messages", len(older))
+            summary = (await summarizer.ainvoke(_summary_messages(summary, older))).content
+        return _update(replacements, older, summary)
+
+    return memory_node, amemory_node
+
+
+def with_summary(state):
+    """The messages to send to the LLM: the running summary (if any) followed by the kept turns."""
+    summary = state.get("summary")
+    if not summary:
+        return state["messages"]
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + state["messages"]
+
+
+# --- CHECKPOINTERS ---
+
+def prune_checkpoints(path=MEMORY_DB_PATH, vacuum=True):
+    """Deletes every checkpoint but the latest of each thread; the history is never read back.
+
+    VACUUM needs the file to itself, so pass vacuum=False while other worker processes may have it open.
+    """
+    if not os.path.exists(path):
+        return 0
+    conn = shared_state.connect(path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "checkpoints" not in tables:
+            return 0
+        latest = "SELECT thread_id, checkpoint_ns, max(checkpoint_id) FROM checkpoints GROUP BY thread_id, checkpoint_ns"
+        deleted = conn.execute(f"DELETE FROM checkpoints WHERE (thread_id, checkpoint_ns, checkpoint_id) NOT IN ({latest})").rowcount
+        if "writes" in tables:
+            conn.execute(f"DELETE FROM writes WHERE (thread_id, checkpoint_ns, checkpoint_id) NOT IN ({latest})")
+        conn.commit()
+        if vacuum:
+            conn.execute("VACUUM")
+        return deleted
+    finally:
+        conn.close()
+
+
+def sqlite_checkpointer(path=MEMORY_DB_PATH):
+    """Synchronous SQLite checkpointer for the CLI."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    return SqliteSaver(shared_state.connect(path, check_same_thread=False))
+
+
+@asynccontextmanager
+async def async_sqlite_checkpointer(path=MEMORY_DB_PATH):
+    """Async SQLite checkpointer for the API server (astream_events needs the async methods).
+
+    Opened like shared_state.connect (WAL journal, busy timeout), since every worker process writes checkpoints.
+    """
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    async with aiosqlite.connect(path, timeout=shared_state.SQLITE_BUSY_TIMEOUT) as conn:
+        if path != ":memory:":
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")
+        yield AsyncSqliteSaver(conn)
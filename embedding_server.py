@@ -0,0 +1,67 @@
+# embedding_server.py (One embedding model for every API worker process on the machine)
+#
+# Usage: uvicorn embedding_server:api --port 8001   (gunicorn.conf.py starts it when EMBEDDING_SIDECAR_PORT is set)
+#
+# Each worker process would otherwise load its own copy of all-MiniLM-L6-v2 and
+# run its own forward passes. Here the model is loaded once; workers reach it
+# through RemoteEmbeddings (EMBEDDING_SERVICE_URL). Query texts from all workers
+# go through one EmbeddingService, so they share its cache and are encoded
+# together in micro-batches; large document batches (ingestion) pass straight
+# through to the model.
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from embedding_service import EMBED_MAX_BATCH, EmbeddingService
+from tool_registry import load_local_embeddings, run_blocking
+
+log = logging.getLogger(__name__)
+
+service = None
+
+
+def get_service():
+    global service
+    if service is None:
+        service = EmbeddingService(load_local_embeddings())
+        log.info("Embedding sidecar loaded its model (pid %s)", os.getpid())
+    return service
+
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+
+@asynccontextmanager
+async def lifespan(api):
+    # Loaded before the first request, so /health only answers once the model is ready
+    await run_blocking(get_service)
+    yield
+
+
+api = FastAPI(lifespan=lifespan)
+
+
+@api.post("/embed")
+async def embed(request: EmbedRequest):
+    if len(request.texts) <= EMBED_MAX_BATCH:
+        vectors = await asyncio.gather(*(get_service().aembed_query(text) for text in request.texts))
+    else:
+        vectors = await run_blocking(get_service().embed_documents, request.texts)
+    return {"vectors": [list(map(float, vector)) for vector in vectors]}
+
+
+@api.get("/health")
+async def health():
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@api.get("/stats")
+async def stats():
+    return get_service().stats()
@@ -0,0 +1,196 @@
+# embedding_service.py (Cached, micro-batched query encoder in front of the embedding model)
+#
+# Query encoding happens on the request path (RAG retrieval, semantic response
+# cache, intent routing). One-item forward passes from many sessions fight over
+# the same cores, so queries go through three layers:
+#   1. a bounded LRU cache keyed by normalised text,
+#   2. a micro-batcher that merges requests arriving within EMBED_BATCH_WAIT_MS
+#      into one `embed_documents` call (one forward pass),
+#   3. a fixed torch thread count (EMBED_TORCH_THREADS) so forward passes do not oversubscribe the CPU.
+# Several worker processes share one model through embedding_server.py: each worker
+# keeps its own cache and batcher in front of a RemoteEmbeddings client, and the
+# sidecar batches the requests of all workers again before its forward pass.
+
+import asyncio
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+import tracing
+
+# --- CONFIGURATION ---
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))       # cached query vectors (0 disables the cache)
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))  # how long a batch stays open for more queries
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))    # 0 = leave torch's default
+EMBEDDING_SERVICE_TIMEOUT = float(os.getenv("EMBEDDING_SERVICE_TIMEOUT", "30"))  # seconds per sidecar request
+
+
+def configure_torch_threads(threads=EMBED_TORCH_THREADS):
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def normalize(text):
+    # all-MiniLM-L6-v2 uses an uncased tokenizer, so case and spacing never change the vector
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+class EmbeddingService(Embeddings):
+    """Wraps an Embeddings model: cached, micro-batched `embed_query`; `embed_documents` passes through."""
+
+    def __init__(self, model, cache_size=EMBED_CACHE_SIZE, wait_ms=EMBED_BATCH_WAIT_MS, max_batch=EMBED_MAX_BATCH):
+        self.model = model
+        self.cache_size = cache_size
+        self.wait = wait_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._waiting = 0  # callers whose query is queued or being encoded
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_queries = 0
+        self.largest_batch = 0
+        self.encode_seconds = 0.0
+
+    # --- CACHE ---
+
+    def _cached(self, key):
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return vector
+
+    def _remember(self, key, vector):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- MICRO-BATCHER ---
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.wait
+            # Only wait for queries that are actually on their way: a lone caller is encoded at once
+            while len(batch) < min(self.max_batch, self._waiting):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._encode(batch)
+
+    def _encode(self, batch):
+        # Identical texts in one batch are encoded once
+        texts = list(dict.fromkeys(key for key, _ in batch))
+        start = time.perf_counter()
+        try:
+            vectors = dict(zip(texts, self.model.embed_documents(texts)))
+        except Exception as e:
+            self._done(len(batch))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        seconds = time.perf_counter() - start
+        self.encode_seconds += seconds
+        tracing.record("embedding", "encode_batch", seconds, batch=len(batch))
+        self.batches += 1
+        self.batched_queries += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self._done(len(batch))
+        for key, future in batch:
+            self._remember(key, vectors[key])
+            future.set_result(vectors[key])
+
+    def _done(self, count):
+        with self._worker_lock:
+            self._waiting -= count
+
+    def submit(self, text):
+        """Returns a Future with the query vector (already resolved on a cache hit)."""
+        key = normalize(text)
+        future = Future()
+        vector = self._cached(key)
+        if vector is not None:
+            future.set_result(vector)
+            return future
+        self._ensure_worker()
+        with self._worker_lock:
+            self._waiting += 1
+        self._queue.put((key, future))
+        return future
+
+    # --- EMBEDDINGS API ---
+
+    def embed_query(self, text: str) -> List[float]:
+        with tracing.span("embedding", "query"):
+            return self.submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # Waits on the batcher without holding a thread of the tool pool
+        with tracing.span("embedding", "query"):
+            return await asyncio.wrap_future(self.submit(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Ingestion already sends large batches
+        return self.model.embed_documents(texts)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "batches": self.batches,
+            "mean_batch": round(self.batched_queries / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "encode_seconds": round(self.encode_seconds, 3),
+        }
+
+
+class RemoteEmbeddings(Embeddings):
+    """The model of an embedding_server.py sidecar, called over HTTP."""
+
+    def __init__(self, url, timeout=EMBEDDING_SERVICE_TIMEOUT):
+        import httpx
+        self.url = url.rstrip("/")
+        self._client = httpx.Client(timeout=timeout)  # keeps the connection open between calls
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        response = self._client.post(f"{self.url}/embed", json={"texts": list(texts)})
+        response.raise_for_status()
+        return response.json()["vectors"]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
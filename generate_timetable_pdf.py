@@ -1,59 +1,116 @@
 # pdf_generator.py (Complete Version)
+#
+# Rendering is cached by a content hash of the timetable rows: an unchanged
+# timetable is served from the cache without touching reportlab. PDFs are drawn
+# into memory (BytesIO), so api_server can stream them without writing files;
+# the tool writes to PDF_OUTPUT_DIR under a name that includes the hash, so
+# concurrent requests never overwrite each other's files. Bulk export renders
+# every department (or teacher) timetable of a semester in worker processes,
+# into one multi-page PDF or a ZIP of PDFs.
+
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-import psycopg2
 from datetime import time
 
-DB_CONNECTION_STRING = "dbname='university' user='postgres' password='password' host='localhost'"
+# Connections come from the shared pool in db_pool
+from db_pool import run_query
+from job_queue import report_progress
+
 TIME_SLOTS = [time(9, 0), time(10, 30), time(12, 0), time(13, 30), time(15, 0)]
 DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
 
-def get_db_connection():
-    return psycopg2.connect(DB_CONNECTION_STRING)
+log = logging.getLogger(__name__)
 
-def create_timetable_pdf(semester_name: str, department_name: str) -> str:
-    """Fetches timetable data for a specific semester/dept and generates a PDF."""
-    print(f"--- Generating PDF for {semester_name}, {department_name} ---")
-
-    query = """
-        SELECT c.course_name, t.first_name || ' ' || t.last_name AS teacher_name,
-               r.room_number AS location, tt.day_of_week, tt.start_time
-        FROM timetable tt
-        JOIN courses c ON tt.course_id = c.course_id
-        JOIN teachers t ON tt.teacher_id = t.teacher_id
-        JOIN rooms r ON tt.room_id = r.room_id
-        JOIN semesters s ON tt.semester_id = s.semester_id
-        JOIN departments d ON c.department_id = d.department_id
-        WHERE s.name = %s AND d.name = %s
-        ORDER BY tt.day_of_week, tt.start_time;
-    """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(query, (semester_name, department_name))
-    schedule_data = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    if not schedule_data:
-        return f"No schedule data found for {semester_name}, {department_name}."
+# --- CONFIGURATION ---
+PDF_OUTPUT_DIR = os.getenv("PDF_OUTPUT_DIR", "./timetable_pdfs")
+PDF_CACHE_SIZE = int(os.getenv("PDF_CACHE_SIZE", "256"))          # rendered PDFs kept in memory
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "0"))    # processes for bulk export (0 = one per CPU)
+# Bump when the drawing code changes, so cached PDFs of unchanged rows are redrawn
+RENDER_VERSION = "3"
+
+TIMETABLE_QUERY = """
+    SELECT d.name AS department_name, t.teacher_id, t.first_name || ' ' || t.last_name AS teacher_name,
+           c.course_name, r.room_number AS location, tt.day_of_week, tt.start_time
+    FROM timetable tt
+    JOIN courses c ON tt.course_id = c.course_id
+    JOIN teachers t ON tt.teacher_id = t.teacher_id
+    JOIN rooms r ON tt.room_id = r.room_id
+    JOIN semesters s ON tt.semester_id = s.semester_id
+    JOIN departments d ON c.department_id = d.department_id
+    WHERE s.name = :semester_name {department_filter}
+    ORDER BY tt.day_of_week, tt.start_time, c.course_name;
+"""
+
+
+# --- DATA ---
+
+def fetch_timetable(semester_name, department_name=None):
+    """(department, teacher_id, teacher, course, room, day, start_time) rows of a semester, or of one department."""
+    params = {"semester_name": semester_name}
+    department_filter = ""
+    if department_name is not None:
+        department_filter = "AND d.name = :department_name"
+        params["department_name"] = department_name
+    # Borrow a connection from the shared pool instead of opening a new one per PDF
+    rows = run_query(TIMETABLE_QUERY.format(department_filter=department_filter), params, fetch="all")
+    return [tuple(row) for row in rows]
+
+
+def group_timetables(rows, by="department"):
+    """{owner: (title, cell rows)} with one timetable per department or per teacher (keyed by teacher_id,
+    so two teachers with the same name get a page each), in title order."""
+    groups = {}
+    for department, teacher_id, teacher, course, room, day, start_time in rows:
+        owner, title = (department, department) if by == "department" else (teacher_id, f"Prof. {teacher}")
+        groups.setdefault(owner, (title, []))[1].append((course, teacher, room, day, start_time))
+    return dict(sorted(groups.items(), key=lambda item: (item[1][0], str(item[0]))))
+
+
+def content_hash(title, rows):
+    digest = hashlib.sha256(f"{RENDER_VERSION}\n{title}\n".encode())
+    for row in rows:
+        digest.update(repr(tuple(str(value) for value in row)).encode())
+    return digest.hexdigest()
 
+
+def slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_")
+
+
+# --- DRAWING ---
+
+def _as_time(value):
+    if isinstance(value, str):
+        hour, minute = value.split(":")[:2]
+        return time(int(hour), int(minute))
+    return value
+
+
+def draw_page(c, title, rows):
+    """Draws one timetable page: a day x time-slot grid with course, teacher and room of every lecture in each cell."""
     processed_data = {}
-    for row in schedule_data:
-        course, teacher, room, day, start_time = row
-        processed_data[(day.strip(), start_time)] = {"course": course, "teacher": teacher, "room": room}
-
-    file_name = f"timetable_{department_name.replace(' ', '_')}_{semester_name.replace(' ', '_')}.pdf"
-    
-    # --- START OF MISSING PDF DRAWING LOGIC ---
-    c = canvas.Canvas(file_name, pagesize=landscape(letter))
+    # Parallel lectures (different cohorts, different rooms) share a cell
+    for course, teacher, room, day, start_time in rows:
+        processed_data.setdefault((day.strip(), _as_time(start_time)), []).append(
+            {"course": course, "teacher": teacher, "room": room})
+
     width, height = landscape(letter)
     margin = 0.75 * inch
 
     c.setFont("Helvetica-Bold", 18)
-    c.drawCentredString(width / 2.0, height - 0.75 * inch, f"Timetable for {department_name} - {semester_name}")
+    c.drawCentredString(width / 2.0, height - 0.75 * inch, title)
 
     x_start = margin
     y_start = height - 1.75 * inch
@@ -76,18 +133,12 @@ def create_timetable_pdf(semester_name: str, department_name: str) -> str:
         y = y_start - (i * row_height)
         c.setFont("Helvetica-Bold", 12)
         c.drawCentredString(x_start - (margin / 2), y - (row_height / 2), day)
-        
+
         for j, start_time in enumerate(TIME_SLOTS):
             x = x_start + (j * col_width)
-            class_info = processed_data.get((day, start_time))
-            if class_info:
-                text_object = c.beginText(x + 5, y - 20)
-                text_object.setFont("Helvetica-Bold", 9)
-                text_object.textLine(class_info['course'])
-                text_object.setFont("Helvetica", 8)
-                text_object.textLine(f"Prof. {class_info['teacher']}")
-                text_object.textLine(f"Room: {class_info['room']}")
-                c.drawText(text_object)
+            lectures = processed_data.get((day, start_time))
+            if lectures:
+                draw_cell(c, x + 5, y - 20, row_height - 15, lectures)
 
     # Draw Grid Lines
     c.setStrokeColor(colors.lightgrey)
@@ -100,11 +151,191 @@ def create_timetable_pdf(semester_name: str, department_name: str) -> str:
         y = y_start - (i * row_height)
         c.line(x_start, y, width - margin, y)
 
+
+def draw_cell(c, x, y, height, lectures):
+    """Three lines per lecture when they fit in the cell, otherwise one line each in a font small enough for all."""
+    text_object = c.beginText(x, y)
+    if len(lectures) * 3 * 10 <= height:
+        for class_info in lectures:
+            text_object.setFont("Helvetica-Bold", 9)
+            text_object.textLine(class_info['course'])
+            text_object.setFont("Helvetica", 8)
+            text_object.textLine(f"Prof. {class_info['teacher']}")
+            text_object.textLine(f"Room: {class_info['room']}")
+    else:
+        leading = min(8.0, height / len(lectures))
+        text_object.setFont("Helvetica", leading * 0.85, leading=leading)
+        for class_info in lectures:
+            text_object.textLine(f"{class_info['course']} ({class_info['room']}, Prof. {class_info['teacher']})")
+    c.drawText(text_object)
+
+
+def render_pages(pages):
+    """[(title, rows)] -> bytes of one PDF with a page per timetable, drawn in memory."""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=landscape(letter))
+    for title, rows in pages:
+        draw_page(c, title, rows)
+        c.showPage()
     c.save()
-    # --- END OF MISSING PDF DRAWING LOGIC ---
+    return buffer.getvalue()
+
+
+def _render_one(page):
+    # Top-level so worker processes can unpickle it
+    return render_pages([page])
+
+
+# --- RENDER CACHE ---
+
+class RenderCache:
+    """LRU of rendered PDFs keyed by content hash."""
+
+    def __init__(self, size=PDF_CACHE_SIZE):
+        self.size = size
+        self._pdfs = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            pdf = self._pdfs.get(key)
+            if pdf is None:
+                self.misses += 1
+                return None
+            self._pdfs.move_to_end(key)
+            self.hits += 1
+            return pdf
+
+    def put(self, key, pdf):
+        with self._lock:
+            self._pdfs[key] = pdf
+            self._pdfs.move_to_end(key)
+            while len(self._pdfs) > self.size:
+                self._pdfs.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"entries": len(self._pdfs), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+render_cache = RenderCache()
+
+
+def render_cached(pages, workers=1):
+    """[(title, rows)] -> [pdf bytes], rendering only the pages whose content changed (in parallel when workers > 1)."""
+    keys = [content_hash(title, rows) for title, rows in pages]
+    pdfs = [render_cache.get(key) for key in keys]
+    missing = [i for i, pdf in enumerate(pdfs) if pdf is None]
+    if workers > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+            rendered = pool.map(_render_one, [pages[i] for i in missing])
+            for done, (i, pdf) in enumerate(zip(missing, rendered), 1):
+                pdfs[i] = pdf
+                report_progress(0.1 + 0.8 * done / len(missing), f"Rendered {done}/{len(missing)} timetables")
+    else:
+        for done, i in enumerate(missing, 1):
+            pdfs[i] = _render_one(pages[i])
+            report_progress(0.1 + 0.8 * done / len(missing), f"Rendered {done}/{len(missing)} timetables")
+    for i in missing:
+        render_cache.put(keys[i], pdfs[i])
+    return pdfs
+
+
+# --- PUBLIC API ---
+
+def timetable_pdf_bytes(semester_name: str, department_name: str):
+    """(file name, PDF bytes) of one department's timetable, or None when it has no lectures. Nothing is written to disk."""
+    rows = fetch_timetable(semester_name, department_name)
+    if not rows:
+        return None
+    title = f"Timetable for {department_name} - {semester_name}"
+    _, cells = group_timetables(rows)[department_name]
+    report_progress(0.3, f"Drawing {len(rows)} lectures")
+    pdf = render_cached([(title, cells)])[0]
+    return f"timetable_{slug(department_name)}_{slug(semester_name)}.pdf", pdf
+
+
+def export_timetables(semester_name: str, by: str = "department", fmt: str = "pdf", workers: int = None):
+    """(file name, bytes) of every department (or teacher) timetable of a semester, as one
+    multi-page PDF or a ZIP of PDFs; None when the semester has no timetable.
+
+    Each timetable is rendered (in worker processes) only if its rows changed since it was
+    last rendered. The multi-page PDF is assembled from the cached pages with pypdf when it is
+    installed; without it the pages are drawn into one document in this process.
+    """
+    if by not in ("department", "teacher") or fmt not in ("pdf", "zip"):
+        raise ValueError("by must be 'department' or 'teacher', and fmt 'pdf' or 'zip'.")
+    rows = fetch_timetable(semester_name)
+    if not rows:
+        return None
+    report_progress(0.1, f"Rendering {by} timetables")
+    groups = group_timetables(rows, by)
+    pages = [(f"Timetable for {title} - {semester_name}", cells) for title, cells in groups.values()]
+    name = f"timetables_by_{by}_{slug(semester_name)}"
+    workers = workers or PDF_RENDER_WORKERS or os.cpu_count() or 1
+
+    if fmt == "pdf":
+        key = content_hash(name, [(title,) + tuple(cells) for title, cells in pages])
+        document = render_cache.get(key)
+        if document is None:
+            try:
+                from pypdf import PdfWriter
+            except ImportError:
+                document = render_pages(pages)
+            else:
+                writer = PdfWriter()
+                for pdf in render_cached(pages, workers):
+                    writer.append(io.BytesIO(pdf))
+                buffer = io.BytesIO()
+                writer.write(buffer)
+                document = buffer.getvalue()
+            render_cache.put(key, document)
+        return f"{name}.pdf", document
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for owner, (title, _), pdf in zip(groups, pages, render_cached(pages, workers)):
+            # Teacher names are not unique; their ID keeps the file names apart
+            suffix = f"_{owner}" if by == "teacher" else ""
+            archive.writestr(f"{slug(title.removeprefix('Timetable for '))}{suffix}.pdf", pdf)
+    return f"{name}.zip", buffer.getvalue()
+
+
+def save_output(file_name, data):
+    """Writes to PDF_OUTPUT_DIR through a temporary file, so readers never see a half-written PDF."""
+    os.makedirs(PDF_OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(PDF_OUTPUT_DIR, file_name)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def create_timetable_pdf(semester_name: str, department_name: str) -> str:
+    """Fetches timetable data for a specific semester/dept and generates a PDF."""
+    log.info("Generating PDF for %s, %s", semester_name, department_name)
+    output = timetable_pdf_bytes(semester_name, department_name)
+    if output is None:
+        return f"No schedule data found for {semester_name}, {department_name}."
+    file_name, pdf = output
+    # The content hash in the name: a changed timetable never overwrites a PDF someone is downloading
+    stem, _ = os.path.splitext(file_name)
+    path = save_output(f"{stem}_{hashlib.sha256(pdf).hexdigest()[:12]}.pdf", pdf)
+    return f"Successfully generated PDF: {path}"
+
+
+def create_timetable_export(semester_name: str, by: str = "department", fmt: str = "pdf") -> str:
+    """Bulk export of a semester's timetables to PDF_OUTPUT_DIR (see export_timetables)."""
+    log.info("Exporting %s timetables for %s as %s", by, semester_name, fmt)
+    output = export_timetables(semester_name, by, fmt)
+    if output is None:
+        return f"No schedule data found for {semester_name}."
+    return f"Successfully exported timetables: {save_output(*output)}"
 
-    return f"Successfully generated PDF: {file_name}"
 
 if __name__ == "__main__":
     result = create_timetable_pdf(semester_name="Fall 2025", department_name="Computer Science")
-    print(result)
\ No newline at end of file
+    print(result)
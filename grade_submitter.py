@@ -0,0 +1,56 @@
+# grade_submitter.py (Set-based grade submission used by the grade_submitter tool)
+
+from sqlalchemy import bindparam, text
+
+from analytics_views import GRADE_ROLLUPS, refresh_after_grades
+from db_pool import connection
+from response_cache import invalidate_tables
+
+# Rows per multi-row statement; keeps the bind-parameter count well under driver limits
+GRADE_BATCH_SIZE = 1000
+
+
+def submit_grades_bulk(course_id, grades):
+    """Upserts `grades` ({student_id: grade_value} or (student_id, grade_value) pairs) for one course.
+
+    All enrollments are resolved with a single query and all grades are written with
+    multi-row INSERT ... ON CONFLICT statements, in one transaction.
+    Returns (updated student IDs, student IDs with no enrollment in the course).
+    """
+    # The last grade given for a student wins, as it would in the row-by-row version
+    grades = dict(grades.items() if isinstance(grades, dict) else grades)
+    if not grades:
+        return [], []
+
+    lookup = text(
+        "SELECT student_id, enrollment_id FROM enrollments WHERE course_id = :course_id AND student_id IN :student_ids"
+    ).bindparams(bindparam("student_ids", expanding=True))
+
+    with connection() as conn:
+        enrollment_of = {}
+        student_ids = list(grades)
+        for i in range(0, len(student_ids), GRADE_BATCH_SIZE):
+            rows = conn.execute(lookup, {"course_id": course_id, "student_ids": student_ids[i:i + GRADE_BATCH_SIZE]})
+            enrollment_of.update((student_id, enrollment_id) for student_id, enrollment_id in rows)
+
+        updated = [student_id for student_id in grades if student_id in enrollment_of]
+        for i in range(0, len(updated), GRADE_BATCH_SIZE):
+            chunk = updated[i:i + GRADE_BATCH_SIZE]
+            values = ", ".join(f"(:e{n}, :g{n})" for n in range(len(chunk)))
+            params = {}
+            for n, student_id in enumerate(chunk):
+                params[f"e{n}"] = enrollment_of[student_id]
+                params[f"g{n}"] = grades[student_id]
+            conn.execute(text(
+                f"INSERT INTO grades (enrollment_id, grade_value) VALUES {values} "
+                "ON CONFLICT (enrollment_id) DO UPDATE SET grade_value = EXCLUDED.grade_value"
+            ), params)
+
+        # Same transaction: the course's rollup rows never disagree with its grades
+        if updated:
+            refresh_after_grades(conn, course_id)
+
+    # Cached answers computed from the grades table (or its rollups) are stale now
+    if updated:
+        invalidate_tables(["grades"] + GRADE_ROLLUPS)
+    return updated, [student_id for student_id in grades if student_id not in enrollment_of]
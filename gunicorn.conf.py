@@ -0,0 +1,63 @@
+# gunicorn.conf.py (Several API worker processes on one machine)
+#
+# Usage: gunicorn -c gunicorn.conf.py api_server:api
+#
+# WEB_CONCURRENCY uvicorn workers share the port; shared_state.py lists what they
+# share and how. With EMBEDDING_SIDECAR_PORT set, the master starts
+# embedding_server.py once before forking and points every worker at it, so the
+# embedding model is in memory once instead of once per worker.
+# A WebSocket session stays on the worker it connected to. A reconnect may land on
+# another worker, which still finds the conversation, caches and finished jobs in
+# the shared files, but not the progress frames of a job still running elsewhere;
+# deploy/nginx.conf shows the one-process-per-port setup with sticky sessions.
+
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import shared_state
+
+# --- CONFIGURATION ---
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = shared_state.WEB_CONCURRENCY
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+# Every worker imports the app itself: torch threads, the embedding batcher thread and the
+# database pools do not survive a fork, so a preloaded (copy-on-write) app cannot be shared
+preload_app = False
+
+EMBEDDING_SIDECAR_PORT = os.getenv("EMBEDDING_SIDECAR_PORT")  # e.g. 8001; unset = every worker loads the model
+EMBEDDING_SIDECAR_START_SECONDS = float(os.getenv("EMBEDDING_SIDECAR_START_SECONDS", "120"))
+
+_sidecar = None
+
+
+def on_starting(server):
+    global _sidecar
+    if not EMBEDDING_SIDECAR_PORT or os.getenv("EMBEDDING_SERVICE_URL"):
+        return
+    url = f"http://127.0.0.1:{EMBEDDING_SIDECAR_PORT}"
+    env = {k: v for k, v in os.environ.items() if k != "EMBEDDING_SERVICE_URL"}
+    _sidecar = subprocess.Popen([sys.executable, "-m", "uvicorn", "embedding_server:api",
+                                 "--host", "127.0.0.1", "--port", EMBEDDING_SIDECAR_PORT], env=env)
+    deadline = time.monotonic() + EMBEDDING_SIDECAR_START_SECONDS
+    while True:
+        try:
+            urllib.request.urlopen(f"{url}/health", timeout=1).close()
+            break
+        except OSError:
+            if _sidecar.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"The embedding sidecar did not start on {url}")
+            time.sleep(0.5)
+    # Read by tool_registry when each worker imports it
+    os.environ["EMBEDDING_SERVICE_URL"] = url
+    server.log.info("Embedding sidecar ready at %s (pid %s)", url, _sidecar.pid)
+
+
+def on_exit(server):
+    if _sidecar is not None and _sidecar.poll() is None:
+        _sidecar.terminate()
+        _sidecar.wait(timeout=10)
@@ -0,0 +1,161 @@
+# hybrid_retriever.py (BM25 + vector retrieval with reciprocal-rank fusion for the policy tool)
+#
+# Dense all-MiniLM-L6-v2 similarity is good at paraphrases but misses exact
+# tokens such as course codes ("CS202") and section numbers ("Section 2").
+# A small in-process BM25 index over the same chunks catches those; the two
+# rankings are merged with reciprocal-rank fusion and can optionally be
+# reranked by a local cross-encoder. The BM25 index is built by
+# ingest_knowledge_base.py and loaded once per process.
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from langchain_core.documents import Document
+
+from tool_registry import CHROMA_PERSIST_DIRECTORY, get_vectorstore, resource
+
+# --- CONFIGURATION ---
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "2"))                      # chunks handed to the LLM
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "10"))           # taken from each retriever before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+RAG_RERANK = os.getenv("RAG_RERANK", "0") not in ("0", "false", "False")
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+BM25_INDEX_NAME = "bm25_index.json"
+
+# Keeps "cs202", "2.1" and "80%" as single tokens
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.%][a-z0-9]+)*%?")
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "i", "in", "is", "it", "of",
+             "on", "or", "that", "the", "to", "was", "what", "when", "which", "who", "with", "do", "does", "my"}
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of chunks, with an inverted index so a query only touches its terms' postings."""
+
+    def __init__(self, texts, metadatas=None, k1=1.5, b=0.75):
+        self.texts = list(texts)
+        self.metadatas = list(metadatas or [{} for _ in self.texts])
+        self.k1, self.b = k1, b
+        self.lengths = []
+        self.postings = {}  # term -> [(doc index, term frequency)]
+        for i, text in enumerate(self.texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((i, tf))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def _idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.texts) - df + 0.5) / (df + 0.5))
+
+    def search(self, query, k=RAG_CANDIDATES):
+        """Returns [(doc index, score)] for the `k` best chunks."""
+        scores = Counter()
+        for term in set(tokenize(query)):
+            idf = self._idf(term)
+            for i, tf in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.average_length or 1))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+    # --- PERSISTENCE ---
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "texts": self.texts, "metadatas": self.metadatas}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["texts"], data["metadatas"], k1=data["k1"], b=data["b"])
+
+
+def index_path():
+    return os.path.join(CHROMA_PERSIST_DIRECTORY, BM25_INDEX_NAME)
+
+
+def build_bm25_index(vectorstore=None, page_size=1000):
+    """Rebuilds the BM25 index from every chunk in the Chroma collection and saves it next to the store."""
+    vectorstore = vectorstore or get_vectorstore()
+    texts, metadatas, offset = [], [], 0
+    while True:
+        page = vectorstore.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        texts += page["documents"]
+        metadatas += [m or {} for m in page["metadatas"]]
+        offset += len(page["ids"])
+    index = BM25Index(texts, metadatas)
+    index.save(index_path())
+    return index
+
+
+@resource("bm25_index")
+def get_bm25_index():
+    """The BM25 index written at ingestion time (built from the collection if it is missing)."""
+    if os.path.exists(index_path()):
+        return BM25Index.load(index_path())
+    return build_bm25_index()
+
+
+@resource("reranker")
+def get_reranker():
+    """Optional local cross-encoder used to reorder the fused candidates (RAG_RERANK=1)."""
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL_NAME)
+
+
+# --- FUSION ---
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merges ranked lists of keys: score(key) = sum over lists of 1 / (k + rank)."""
+    scores = Counter()
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] += 1.0 / (k + rank)
+    return [key for key, _ in scores.most_common()]
+
+
+class HybridRetriever:
+    """question -> top Documents from BM25 and Chroma, fused with RRF and optionally reranked."""
+
+    def __init__(self, top_k=RAG_TOP_K, candidates=RAG_CANDIDATES, rerank=RAG_RERANK):
+        self.top_k = top_k
+        self.candidates = candidates
+        self.rerank = rerank
+        self._lock = threading.Lock()
+
+    def dense(self, question):
+        return get_vectorstore().similarity_search(question, k=self.candidates)
+
+    def lexical(self, question):
+        index = get_bm25_index()
+        return [Document(page_content=index.texts[i], metadata=index.metadatas[i])
+                for i, _ in index.search(question, k=self.candidates)]
+
+    def invoke(self, question):
+        question = str(question)
+        by_text = {}
+        rankings = []
+        for documents in (self.lexical(question), self.dense(question)):
+            rankings.append([doc.page_content for doc in documents])
+            for doc in documents:
+                by_text.setdefault(doc.page_content, doc)
+        fused = [by_text[text] for text in reciprocal_rank_fusion(rankings)]
+        if self.rerank and len(fused) > 1:
+            candidates = fused[:self.candidates]
+            with self._lock:  # CrossEncoder.predict is not thread-safe on all backends
+                scores = get_reranker().predict([(question, doc.page_content) for doc in candidates])
+            fused = [doc for _, doc in sorted(zip(scores, candidates), key=lambda pair: -pair[0])]
+        return fused[:self.top_k]
@@ -0,0 +1,241 @@
+# ingest_knowledge_base.py (Incremental ingestion of knowledge_base/ into the Chroma store)
+#
+# Usage: python ingest_knowledge_base.py [--path knowledge_base] [--rebuild]
+#
+# Files are streamed line by line into chunks, chunks are embedded in batches
+# with the shared HuggingFace model and upserted into the same collection the
+# policy tool reads. A manifest next to the store remembers each file's content
+# hash and chunk IDs, so a re-run only re-embeds the chunks of files that
+# changed and deletes chunks that changed or whose file disappeared. Chroma
+# persists its HNSW index and the BM25 index of hybrid_retriever.py is written
+# next to it, so nothing is rebuilt when the API server starts.
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+import hybrid_retriever
+import tool_registry
+from tool_registry import CHROMA_PERSIST_DIRECTORY, get_vectorstore
+
+# --- CONFIGURATION ---
+load_dotenv()
+KNOWLEDGE_BASE_DIR = os.getenv("KNOWLEDGE_BASE_DIR", "./knowledge_base")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))          # characters per chunk (soft limit)
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))     # characters repeated between chunks of one section
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+DOCUMENT_EXTENSIONS = (".txt", ".md")
+MANIFEST_NAME = "ingest_manifest.json"
+
+
+# --- CHUNKING ---
+
+def iter_chunks(lines, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Yields chunks of about `chunk_size` characters from an iterable of lines.
+
+    Only one chunk is held in memory. Chunks break before markdown headings
+    ("# ...", "## Section 2 ...") so a section is not split across unrelated
+    text, and consecutive chunks of one section share `overlap` characters.
+    """
+    buffer, size, fresh = [], 0, False
+
+    def flush(keep_overlap):
+        nonlocal buffer, size, fresh
+        text = "".join(buffer).strip()
+        tail = text[-overlap:] if keep_overlap and overlap and text else ""
+        buffer, size, fresh = ([tail] if tail else []), len(tail), False
+        return text
+
+    for line in lines:
+        if line.lstrip().startswith("#") and fresh:
+            text = flush(keep_overlap=False)
+            if text:
+                yield text
+        while len(line) > chunk_size:
+            # One very long line (no newlines in the source): hard split it
+            room = max(chunk_size - size, 1)
+            buffer.append(line[:room])
+            fresh = True
+            line = line[room:]
+            text = flush(keep_overlap=True)
+            if text:
+                yield text
+        if fresh and size + len(line) > chunk_size:
+            text = flush(keep_overlap=True)
+            if text:
+                yield text
+        buffer.append(line)
+        size += len(line)
+        # A heading alone is not worth a chunk: it stays with the text that follows it
+        fresh = fresh or (bool(line.strip()) and not line.lstrip().startswith("#"))
+
+    if fresh:
+        text = flush(keep_overlap=False)
+        if text:
+            yield text
+
+
+def iter_documents(directory):
+    """Yields the knowledge base files under `directory`, in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(DOCUMENT_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source, index, text):
+    return hashlib.sha256(f"{source}\0{index}\0{text}".encode()).hexdigest()[:32]
+
+
+# --- MANIFEST ---
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    # Written after every file, atomically, so an interrupted run resumes where it stopped
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# --- INGESTION ---
+
+MANIFEST_SAVE_SECONDS = 5.0
+
+
+def _delete(vectorstore, ids):
+    for i in range(0, len(ids), 1000):
+        vectorstore.delete(ids=ids[i:i + 1000])
+
+
+class _Batcher:
+    """Collects chunks across files and embeds + upserts them `batch_size` at a time.
+
+    A file's manifest entry is only committed once all of its chunks are in the store.
+    """
+
+    def __init__(self, vectorstore, manifest, manifest_path, batch_size):
+        self.vectorstore = vectorstore
+        self.manifest = manifest
+        self.manifest_path = manifest_path
+        self.batch_size = batch_size
+        self.ids, self.texts, self.metadatas = [], [], []
+        self.pending = []  # (source, entry, stale ids) waiting for the current batch
+        self.embedded = 0
+        self.saved_at = time.monotonic()
+
+    def add(self, chunk_id_, text, metadata):
+        self.ids.append(chunk_id_)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+        if len(self.texts) >= self.batch_size:
+            self.flush()
+
+    def finish_file(self, source, entry, stale):
+        self.pending.append((source, entry, stale))
+        if not self.texts:
+            self.flush()
+
+    def flush(self, save=False):
+        if self.texts:
+            # add_texts embeds the whole batch in one call and upserts by ID
+            self.vectorstore.add_texts(self.texts, metadatas=self.metadatas, ids=self.ids)
+            self.embedded += len(self.texts)
+            self.ids, self.texts, self.metadatas = [], [], []
+        for source, entry, stale in self.pending:
+            _delete(self.vectorstore, stale)
+            self.manifest[source] = entry
+        self.pending = []
+        # Saved every few seconds rather than per file; chunk IDs are deterministic, so
+        # work lost to an interruption is simply upserted again on the next run
+        if save or time.monotonic() - self.saved_at > MANIFEST_SAVE_SECONDS:
+            save_manifest(self.manifest_path, self.manifest)
+            self.saved_at = time.monotonic()
+
+
+def ingest(directory=KNOWLEDGE_BASE_DIR, rebuild=False, batch_size=EMBED_BATCH_SIZE, vectorstore=None):
+    """Brings the Chroma collection in line with `directory`. Returns a stats dict."""
+    vectorstore = vectorstore or get_vectorstore()
+    manifest_path = os.path.join(CHROMA_PERSIST_DIRECTORY, MANIFEST_NAME)
+    manifest = None if rebuild else load_manifest(manifest_path)
+    if manifest is None:
+        # First run (or --rebuild): drop whatever was loaded by hand, including duplicates
+        _delete(vectorstore, vectorstore.get(include=[])["ids"])
+        manifest = {}
+
+    stats = {"files": 0, "changed": 0, "removed": 0, "chunks": 0, "deleted_chunks": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    batcher = _Batcher(vectorstore, manifest, manifest_path, batch_size)
+    seen = set()
+    for path in iter_documents(directory):
+        source = os.path.relpath(path, os.path.dirname(os.path.abspath(directory)) or ".").replace(os.sep, "/")
+        seen.add(source)
+        stats["files"] += 1
+        digest = file_hash(path)
+        previous = manifest.get(source)
+        if previous and previous["sha256"] == digest:
+            continue
+
+        # Chunks whose text (and position) did not change keep their ID and are not re-embedded
+        known = set(previous["ids"]) if previous else set()
+        ids = []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for index, text in enumerate(iter_chunks(f)):
+                ids.append(chunk_id(source, index, text))
+                if ids[-1] not in known:
+                    batcher.add(ids[-1], text, {"source": source, "chunk": index})
+        stale = sorted(known - set(ids))
+        batcher.finish_file(source, {"sha256": digest, "ids": ids}, stale)
+        stats["changed"] += 1
+        stats["deleted_chunks"] += len(stale)
+
+    batcher.flush()
+    for source in sorted(set(manifest) - seen):
+        _delete(vectorstore, manifest.pop(source)["ids"])
+        stats["removed"] += 1
+    batcher.flush(save=True)
+    stats["chunks"] = batcher.embedded
+
+    if stats["changed"] or stats["removed"] or not os.path.exists(hybrid_retriever.index_path()):
+        # The lexical index is rebuilt here so queries never pay for it
+        hybrid_retriever.build_bm25_index(vectorstore)
+        tool_registry.reset("bm25_index")
+    if stats["changed"] or stats["removed"]:
+        # Cached policy answers may quote the old text
+        from response_cache import caches
+        caches["policy_and_course_retriever"].clear()
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally ingests the knowledge base into Chroma.")
+    parser.add_argument("--path", default=KNOWLEDGE_BASE_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the manifest and re-embed everything.")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    args = parser.parse_args()
+
+    result = ingest(args.path, rebuild=args.rebuild, batch_size=args.batch_size)
+    print(f"Ingested {result['changed']} changed file(s) of {result['files']} ({result['chunks']} chunks embedded), "
+          f"removed {result['removed']} file(s), deleted {result['deleted_chunks']} stale chunk(s) "
+          f"in {result['seconds']}s.")
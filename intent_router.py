@@ -0,0 +1,328 @@
+# intent_router.py (Deterministic fast path in front of the LLM agent)
+#
+# Common questions ("how many students are there?", "who is the head of
+# Physics?", "what is the attendance policy?") do not need GPT-4o to pick a
+# tool and then write SQL. The router classifies the new question before the
+# agent runs:
+#   1. pattern rules on the normalised question (confidence 1.0, parameters
+#      come from named groups),
+#   2. otherwise a k-nearest-neighbour vote over embedded example questions,
+#      including counter-examples that must stay with the agent.
+# A confident SQL intent runs its parameterized template and formats the rows;
+# a confident retrieval intent calls the policy tool with the question. Anything
+# else (low confidence, missing parameters, no rows, an error) falls through to
+# the agent unchanged.
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage
+
+import metrics
+from query_library import libraries as query_libraries
+from response_cache import literals, normalize
+from tool_registry import get_embedding_model, resource, run_blocking
+
+log = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") not in ("0", "false", "False")
+ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.80"))   # nearest example must be at least this close
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.75"))   # share of the k-NN vote for the winning intent
+ROUTER_NEIGHBOURS = int(os.getenv("ROUTER_NEIGHBOURS", "5"))
+
+Route = namedtuple("Route", "intent params confidence via")
+
+
+class Intent:
+    """A question type answered without the agent: a SQL template or a tool taking the question as is.
+
+    `render(rows, params)` turns the rows into the answer, or returns None to hand the
+    question back to the agent. `llm_calls` is how many LLM round trips the agent path
+    would have made (agent -> tool -> agent, plus SQL generation).
+    """
+
+    def __init__(self, name, examples, patterns=(), sql=None, render=None, tool=None, params=(), llm_calls=3):
+        self.name = name
+        self.examples = list(examples)
+        self.patterns = [re.compile(p) for p in patterns]
+        self.sql = sql
+        self.render = render
+        self.tool = tool
+        self.params = tuple(params)
+        self.llm_calls = llm_calls
+
+
+def _count(noun):
+    def render(rows, params):
+        return f"There are {rows[0][0]} {noun}."
+    return render
+
+
+def _department_head(rows, params):
+    if not rows:
+        return None
+    return f"The Head of the {params['department'].title()} department is {rows[0][0]} {rows[0][1]}."
+
+
+def _student_grades(rows, params):
+    if not rows:
+        return None
+    lines = "\n".join(f"- {course}: {grade}" for course, grade in rows)
+    return f"Courses and grades for {params['email']}:\n{lines}"
+
+
+def _per_department(rows, params):
+    if not rows:
+        return None
+    return "Students per department:\n" + "\n".join(f"- {name}: {count}" for name, count in rows)
+
+
+def _top_courses(rows, params):
+    if not rows:
+        return None
+    return f"Top {len(rows)} courses by enrollment:\n" + "\n".join(f"{i}. {name} ({count} students)"
+                                                                  for i, (name, count) in enumerate(rows, 1))
+
+
+_DEPARTMENT = r"(?P<department>[a-z][a-z &-]*?)"
+_EMAIL = r"(?P<email>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)"
+
+INTENTS = [
+    Intent("count_students",
+           ["How many students are there?", "What is the total number of students?", "How many students does the university have?",
+            "Count all students", "How many students are enrolled at the university?", "Total student count"],
+           patterns=[r"^(?:how many|what is the (?:total )?number of|count(?: all| the)?) students"
+                     r"(?: are there| do we have| in total| does the university have| are enrolled)?$"],
+           sql="SELECT count(*) FROM students", render=_count("students")),
+    Intent("count_teachers",
+           ["How many teachers are there?", "What is the total number of teachers?", "How many faculty members do we have?",
+            "Count all teachers"],
+           patterns=[r"^(?:how many|what is the (?:total )?number of|count(?: all| the)?) (?:teachers|faculty members|instructors)"
+                     r"(?: are there| do we have| in total| does the university have)?$"],
+           sql="SELECT count(*) FROM teachers", render=_count("teachers")),
+    Intent("count_courses",
+           ["How many courses are there?", "What is the total number of courses?", "How many courses are offered?"],
+           patterns=[r"^(?:how many|what is the (?:total )?number of|count(?: all| the)?) courses"
+                     r"(?: are there| do we have| in total| are offered| does the university offer)?$"],
+           sql="SELECT count(*) FROM courses", render=_count("courses")),
+    Intent("count_departments",
+           ["How many departments are there?", "What is the number of departments?"],
+           patterns=[r"^(?:how many|what is the (?:total )?number of) departments(?: are there| do we have)?$"],
+           sql="SELECT count(*) FROM departments", render=_count("departments")),
+    Intent("department_head",
+           ["Who is the Head of the Computer Science department?", "Who is the HOD of Mathematics?",
+            "Who heads the Physics department?"],
+           patterns=[rf"^who is (?:the )?(?:head|hod|chair)(?: of)? (?:the )?(?:department of )?{_DEPARTMENT}(?: department)?$",
+                     rf"^who heads (?:the )?{_DEPARTMENT}(?: department)?$"],
+           sql="SELECT t.first_name, t.last_name FROM teachers t JOIN departments d ON t.teacher_id = d.hod_id "
+               "WHERE lower(d.name) = lower(:department)",
+           render=_department_head, params=["department"]),
+    Intent("student_grades",
+           ["What are the courses and grades for the student with email ayesha.malik@student.edu?",
+            "Show the grades of student ali.khan@student.edu"],
+           patterns=[rf"^(?:what are|show|list)(?: me)? the (?:courses and )?grades (?:for|of) (?:the )?student (?:with email )?{_EMAIL}$"],
+           sql="SELECT c.course_name, g.grade_value FROM students s JOIN enrollments e ON s.student_id = e.student_id "
+               "JOIN courses c ON e.course_id = c.course_id JOIN grades g ON e.enrollment_id = g.enrollment_id "
+               "WHERE lower(s.email) = lower(:email)",
+           render=_student_grades, params=["email"]),
+    Intent("students_per_department",
+           ["How many students are in each department?", "Number of students per department",
+            "Show the student count for every department"],
+           patterns=[r"^(?:how many students are (?:there )?in each department|(?:number of|count of) students (?:per|by|in each) department)$"],
+           sql="SELECT d.name, count(s.student_id) AS number_of_students FROM students s "
+               "JOIN departments d ON s.department_id = d.department_id GROUP BY d.name ORDER BY d.name",
+           render=_per_department),
+    Intent("top_courses",
+           ["What are the top 3 courses with the most students?", "Top 5 courses by enrollment"],
+           patterns=[r"^(?:what are )?(?:the )?top (?P<limit>\d{1,2}) courses (?:with the most (?:students|enrollments)|by enrollment)$"],
+           sql="SELECT c.course_name, count(e.student_id) AS enrollment_count FROM enrollments e "
+               "JOIN courses c ON e.course_id = c.course_id GROUP BY c.course_name ORDER BY enrollment_count DESC LIMIT :limit",
+           render=_top_courses, params=["limit"]),
+    Intent("policy",
+           ["What is the attendance policy?", "What happens on a second plagiarism offense?", "What is the grading scale?",
+            "Is there a curve on grades?", "What are the prerequisites for CS210?", "What is covered in SE350?",
+            "When must a medical certificate be submitted?", "What is the minimum attendance requirement?",
+            "What does the department policy say about late submissions?"],
+           patterns=[r"^what (?:is|are) the [a-z ]+ polic(?:y|ies)$", r"^what are the prerequisites (?:for|of) [a-z]{2,4} ?\d{3}$"],
+           tool="policy_and_course_retriever", llm_calls=2),
+]
+
+# Questions that look like the ones above but need the agent (writes, filters, follow-ups)
+AGENT_EXAMPLES = [
+    "How many students are in the Computer Science department?", "How many students failed Databases last semester?",
+    "How many students got an A in CS101?", "Which students have a grade below C?", "What is the average grade in each course?",
+    "Send a WhatsApp message to the students of CS101 that class is cancelled", "Submit grades for course 5",
+    "Generate the timetable for Fall 2025 for Computer Science", "Create a PDF of the Computer Science schedule",
+    "What about his grades?", "And how many of them are in Physics?", "Who teaches Data Structures?",
+    "Which teachers are in the Mathematics department?", "Move the Monday 9am lecture of course 12 to Tuesday",
+]
+
+INTENTS_BY_NAME = {intent.name: intent for intent in INTENTS}
+
+# SQL intents run as named, prepared templates of the query library
+ROUTER_QUERIES = query_libraries["intent_router"]
+for _intent in INTENTS:
+    if _intent.sql:
+        ROUTER_QUERIES.add(_intent.name, _intent.sql, _intent.params, question=_intent.examples[0])
+
+
+@resource("intent_index")
+def get_intent_index():
+    """Unit-length embeddings of every example question and the intent (or None) each one votes for."""
+    labels, examples = [], []
+    for intent in INTENTS:
+        labels += [intent.name] * len(intent.examples)
+        examples += intent.examples
+    labels += [None] * len(AGENT_EXAMPLES)
+    examples += AGENT_EXAMPLES
+    vectors = np.asarray(get_embedding_model().embed_documents(examples), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    return vectors, labels
+
+
+class IntentRouter:
+    """Classifies a question into an Intent and answers it directly when confident."""
+
+    def __init__(self, intents=INTENTS, min_similarity=ROUTER_MIN_SIMILARITY, min_confidence=ROUTER_MIN_CONFIDENCE,
+                 neighbours=ROUTER_NEIGHBOURS, enabled=ROUTER_ENABLED):
+        self.intents = {intent.name: intent for intent in intents}
+        self.min_similarity = min_similarity
+        self.min_confidence = min_confidence
+        self.neighbours = neighbours
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.routed = Counter()     # intent -> questions answered on the fast path
+        self.fallbacks = Counter()  # reason -> questions handed to the agent
+        self.llm_calls_skipped = 0
+
+    # --- CLASSIFICATION ---
+
+    def _match_patterns(self, text):
+        for intent in self.intents.values():
+            for pattern in intent.patterns:
+                match = pattern.match(text)
+                if match:
+                    params = {k: v.strip() for k, v in match.groupdict().items() if v}
+                    if "limit" in params:
+                        params["limit"] = int(params["limit"])
+                    return Route(intent.name, params, 1.0, "pattern")
+        return None
+
+    def _nearest(self, question):
+        vectors, labels = get_intent_index()
+        query = np.asarray(get_embedding_model().embed_query(question), dtype=np.float32)
+        query /= np.linalg.norm(query) + 1e-12
+        similarities = vectors @ query
+        top = np.argsort(-similarities)[:self.neighbours]
+        votes = Counter()
+        for i in top:
+            votes[labels[i]] += max(float(similarities[i]), 0.0)
+        label, weight = votes.most_common(1)[0]
+        total = sum(votes.values()) or 1.0
+        return label, weight / total, float(similarities[top[0]])
+
+    def classify(self, question):
+        """Returns a Route, or None when the question should go to the agent."""
+        text = normalize(question)
+        route = self._match_patterns(text)
+        if route is not None:
+            return route
+        label, confidence, best = self._nearest(question)
+        if label is None or best < self.min_similarity or confidence < self.min_confidence:
+            return None
+        intent = self.intents[label]
+        # k-NN cannot fill parameters, and a question naming things (a department, a
+        # course code, an email) is rarely the unfiltered template it resembles
+        if intent.params or (intent.sql and literals(question)):
+            return None
+        return Route(intent.name, {}, round(confidence, 3), "knn")
+
+    # --- EXECUTION ---
+
+    def _classify_safely(self, question):
+        try:
+            return self.classify(question)
+        except Exception as e:
+            # The router is an optimisation: a broken index or model only means the agent answers
+            log.warning("Intent router disabled for this question: %s", e)
+            return None
+
+    def _record(self, route, answer, start):
+        metrics.observe("router_seconds", time.perf_counter() - start)
+        with self._lock:
+            if answer is None:
+                self.fallbacks[route.intent if route else "no_match"] += 1
+            else:
+                self.routed[route.intent] += 1
+                self.llm_calls_skipped += self.intents[route.intent].llm_calls
+
+    def answer(self, question, tools):
+        """The fast-path answer to `question`, or None to hand it to the agent."""
+        start = time.perf_counter()
+        route = self._classify_safely(question) if self.enabled else None
+        answer = None
+        if route is not None:
+            intent = self.intents[route.intent]
+            try:
+                if intent.tool:
+                    answer = tools[intent.tool].invoke(question)
+                else:
+                    answer = intent.render(ROUTER_QUERIES.execute(intent.name, route.params), route.params)
+            except Exception as e:
+                log.warning("Fast path '%s' failed, falling back to the agent: %s", intent.name, e)
+        self._record(route, answer, start)
+        return answer
+
+    async def aanswer(self, question, tools):
+        start = time.perf_counter()
+        # Encoding the question (and loading the index the first time) is blocking work
+        route = await run_blocking(self._classify_safely, question) if self.enabled else None
+        answer = None
+        if route is not None:
+            intent = self.intents[route.intent]
+            try:
+                if intent.tool:
+                    answer = await tools[intent.tool].ainvoke(question)
+                else:
+                    answer = intent.render(await ROUTER_QUERIES.aexecute(intent.name, route.params), route.params)
+            except Exception as e:
+                log.warning("Fast path '%s' failed, falling back to the agent: %s", intent.name, e)
+        self._record(route, answer, start)
+        return answer
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "routed": dict(self.routed), "fallbacks": dict(self.fallbacks),
+                    "llm_calls_skipped": self.llm_calls_skipped, "router_seconds": metrics.recorder("router_seconds").summary()}
+
+
+def make_router_node(router, tools):
+    """Returns (sync, async) graph nodes: a fast-path answer becomes the turn's final AIMessage."""
+    tools_by_name = {tool.name: tool for tool in tools}
+
+    def _question(state):
+        last = state["messages"][-1]
+        return last.content if isinstance(last, HumanMessage) and isinstance(last.content, str) else None
+
+    def router_node(state):
+        question = _question(state)
+        answer = router.answer(question, tools_by_name) if question else None
+        return {"messages": [AIMessage(content=answer)]} if answer else {}
+
+    async def arouter_node(state):
+        question = _question(state)
+        answer = await router.aanswer(question, tools_by_name) if question else None
+        return {"messages": [AIMessage(content=answer)]} if answer else {}
+
+    return router_node, arouter_node
+
+
+def after_router(state):
+    """The router answered if the last message is now an AIMessage."""
+    return "end" if isinstance(state["messages"][-1], AIMessage) else "agent"
@@ -0,0 +1,375 @@
+# job_queue.py (Background jobs for the long-running tools)
+#
+# Timetable generation and PDF export used to run inside the agent turn, holding
+# the turn (and the WebSocket) for as long as they took. Their tools now submit a
+# job and return its ID at once; a small worker pool runs the job and every status
+# or progress change is pushed to the sessions waiting on it (api_server forwards
+# them over /ws as {"type": "job"} frames). Jobs are idempotent by key: asking for
+# the same semester and department again while a job is queued or running joins
+# that job instead of starting a second one.
+#
+# The workers are threads: the CPU-heavy part (solving several departments) already
+# fans out to a process pool inside scheduler._schedule, and the rest is database
+# and reportlab work that releases the GIL or is short.
+#
+# With several API worker processes a job runs (and pushes frames) in the process
+# whose session submitted it, but every status change is also written to
+# JOB_STORE_PATH, so job_status and /jobs/{id} answer from any worker. The store
+# also holds the idempotency keys of active jobs: a worker claims the key in a
+# transaction before it runs the job, and a request for the same key in another
+# worker joins that job instead of running a second one next to it.
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+import shared_state
+import tracing
+from tool_registry import run_blocking
+
+log = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))                       # jobs running at once
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "86400"))  # finished jobs kept for job_status
+JOB_RESULT_PREVIEW_CHARS = 1000
+JOB_STORE_EXPIRY_SECONDS = 300  # how often submit purges expired jobs from the store
+# Status of every job, readable by all worker processes; unset = memory only (one worker)
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH") or ("./job_store.sqlite3" if shared_state.WEB_CONCURRENCY > 1 else "")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+# The session whose turn is running; api_server sets it so tools know who to notify
+current_session = ContextVar("current_session", default=None)
+
+_worker = threading.local()
+
+
+def job_key(kind, *args):
+    """Idempotency key: the job kind plus its arguments, case- and whitespace-insensitive."""
+    def norm(value):
+        if isinstance(value, str):
+            return " ".join(value.split()).lower()
+        if isinstance(value, (list, tuple, set)):
+            return tuple(sorted(norm(v) for v in value))
+        return value
+    return (kind,) + tuple(norm(arg) for arg in args)
+
+
+class Job:
+    def __init__(self, kind, key, description):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.description = description
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Waiting for a free worker"
+        self.result = None
+        self.error = None
+        self.sessions = set()
+        self.created = time.time()
+        self.started = self.finished = None
+
+    def to_dict(self):
+        result = self.result
+        if isinstance(result, str) and len(result) > JOB_RESULT_PREVIEW_CHARS:
+            result = result[:JOB_RESULT_PREVIEW_CHARS] + "..."
+        return {"id": self.id, "kind": self.kind, "description": self.description, "status": self.status,
+                "progress": round(self.progress, 3), "message": self.message, "result": result, "error": self.error,
+                "seconds": round((self.finished or time.time()) - (self.started or time.time()), 2) if self.started else None}
+
+    def summary(self):
+        """The one-line status the job_status tool gives the agent."""
+        if self.status == SUCCEEDED:
+            return f"Job {self.id} ({self.description}) finished: {self.result}"
+        if self.status == FAILED:
+            return f"Job {self.id} ({self.description}) failed: {self.error}"
+        return f"Job {self.id} ({self.description}) is {self.status}, {self.progress:.0%} done: {self.message}"
+
+
+class StoredJob:
+    """A job of another worker process, as it was last written to the job store."""
+
+    def __init__(self, data, summary, created):
+        self.id = data["id"]
+        self.status = data["status"]
+        self.created = created
+        self._data, self._summary = data, summary
+
+    def to_dict(self):
+        return self._data
+
+    def summary(self):
+        return self._summary
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, retention=JOB_RETENTION_SECONDS, store_path=JOB_STORE_PATH):
+        self.workers = max(1, workers)
+        self.retention = retention
+        self.store_path = store_path
+        self._store_local = threading.local()
+        self._jobs = {}
+        self._active = {}       # idempotency key -> queued/running job
+        self._listeners = {}    # session_id -> [(loop, asyncio.Queue)]
+        self._lock = threading.Lock()
+        # Serialises submissions (the claim may wait on other processes); jobs and stats() only take
+        # self._lock, which is never held across job store I/O
+        self._submit_lock = threading.Lock()
+        self._next_store_expiry = 0.0
+        self._executor = None
+        self.submitted = self.joined = 0
+
+    # --- SUBMISSION ---
+
+    def submit(self, kind, key, description, func, *args, session_id=None, **kwargs):
+        """Queues `func(*args, **kwargs)` unless a job with the same key is active; returns (job, joined)."""
+        with self._submit_lock:
+            with self._lock:
+                purge_store = self._expire()
+                job = self._active.get(key)
+            if purge_store:
+                self._store_write("DELETE FROM jobs WHERE finished < ?", (time.time() - self.retention,))
+            if job is None:
+                job = Job(kind, key, description)
+                job.sessions.update([session_id] if session_id else [])
+                running_elsewhere = self._claim(job) if self.store_path else None
+                if running_elsewhere is not None:
+                    with self._lock:
+                        self.joined += 1
+                    return running_elsewhere, True
+            with self._lock:
+                joined = job.id in self._jobs
+                if joined:
+                    self.joined += 1
+                else:
+                    self._jobs[job.id] = job
+                    self._active[key] = job
+                    self.submitted += 1
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+                    self._executor.submit(self._run, job, func, args, kwargs)
+                notify = not joined or (session_id and session_id not in job.sessions)
+                if session_id:
+                    job.sessions.add(session_id)
+        if notify:
+            self._publish(job)
+        return job, joined
+
+    def _run(self, job, func, args, kwargs):
+        job.status, job.started, job.message = RUNNING, time.time(), "Started"
+        self._publish(job)
+        _worker.job = job
+        try:
+            # Its own trace: the job outlives the turn that submitted it
+            with tracing.span("job", job.kind, job=job.id):
+                job.result = func(*args, **kwargs)
+            job.status, job.progress, job.message = SUCCEEDED, 1.0, "Done"
+        except Exception as e:
+            log.exception("Job %s (%s) failed", job.id, job.description)
+            job.status, job.error, job.message = FAILED, repr(e), "Failed"
+        finally:
+            _worker.job = None
+            job.finished = time.time()
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+        self._publish(job)
+        if self.store_path:
+            self._store_write("DELETE FROM active_jobs WHERE key = ? AND job_id = ?", (self._key_text(job.key), job.id))
+
+    def _expire(self):
+        """Drops expired jobs from memory (under self._lock); True when the store is due the same purge."""
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished < now - self.retention]:
+            del self._jobs[job_id]
+        if not self.store_path or now < self._next_store_expiry:
+            return False
+        self._next_store_expiry = now + JOB_STORE_EXPIRY_SECONDS
+        return True
+
+    # --- SHARED STORE ---
+
+    def _store(self):
+        conn = getattr(self._store_local, "conn", None)
+        if conn is None:
+            conn = self._store_local.conn = shared_state.connect(self.store_path)
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, sessions TEXT, created REAL, "
+                         "finished REAL, data TEXT, summary TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS active_jobs (key TEXT PRIMARY KEY, job_id TEXT, pid INTEGER)")
+        return conn
+
+    def _store_write(self, statement, params):
+        try:
+            with self._store() as conn:
+                conn.execute(statement, params)
+        except sqlite3.Error as e:
+            # Only lookups from other workers depend on it; the job itself carries on
+            log.warning("Could not write the job store: %s", e)
+
+    # Sessions of other workers may have joined the job: its stored sessions are merged, never replaced
+    SAVE = """INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET
+        sessions = (SELECT json_group_array(value) FROM (SELECT value FROM json_each(jobs.sessions)
+                                                         UNION SELECT value FROM json_each(excluded.sessions))),
+        finished = excluded.finished, data = excluded.data, summary = excluded.summary"""
+
+    def _save_params(self, job):
+        return (job.id, json.dumps(sorted(job.sessions)), job.created, job.finished,
+                json.dumps(job.to_dict(), default=str), job.summary())
+
+    def _save(self, job):
+        self._store_write(self.SAVE, self._save_params(job))
+
+    @staticmethod
+    def _key_text(key):
+        return json.dumps(key, default=str)
+
+    def _claim(self, job):
+        """Makes `job` the active job for its key in the shared store, unless a live process already runs
+        one: that job is returned instead, with the new job's session added to it."""
+        key = self._key_text(job.key)
+        try:
+            with self._store() as conn:
+                conn.execute("BEGIN IMMEDIATE")  # no other process between the check and the claim
+                row = conn.execute("SELECT job_id, pid FROM active_jobs WHERE key = ?", (key,)).fetchone()
+                if row and row[1] != os.getpid() and _alive(row[1]):
+                    for session_id in job.sessions:
+                        conn.execute("UPDATE jobs SET sessions = json_insert(sessions, '$[#]', ?) WHERE id = ? AND NOT "
+                                     "EXISTS (SELECT 1 FROM json_each(jobs.sessions) WHERE value = ?)",
+                                     (session_id, row[0], session_id))
+                    stored = conn.execute("SELECT data, summary, created FROM jobs WHERE id = ?", (row[0],)).fetchone()
+                    if stored is not None:
+                        return StoredJob(json.loads(stored[0]), stored[1], stored[2])
+                # Free, or left behind by a process that has exited
+                conn.execute("INSERT OR REPLACE INTO active_jobs VALUES (?, ?, ?)", (key, job.id, os.getpid()))
+                conn.execute(self.SAVE, self._save_params(job))
+        except sqlite3.Error as e:
+            log.warning("Could not claim job %s in the job store, running it here: %s", job.description, e)
+        return None
+
+    def _stored(self, where, params, limit):
+        if not self.store_path:
+            return []
+        rows = self._store().execute(f"SELECT data, summary, created FROM jobs WHERE {where} "
+                                     f"ORDER BY created DESC LIMIT {int(limit)}", params).fetchall()
+        return [StoredJob(json.loads(data), summary, created) for data, summary, created in rows]
+
+    # --- LOOKUP ---
+
+    def get(self, job_id):
+        job_id = (job_id or "").strip()
+        job = self._jobs.get(job_id)
+        if job is None:
+            stored = self._stored("id = ?", (job_id,), 1)
+            job = stored[0] if stored else None
+        return job
+
+    def jobs_for(self, session_id, limit=5):
+        """The session's most recent jobs, newest first (including those run by other worker processes)."""
+        with self._lock:
+            jobs = {job.id: job for job in self._jobs.values() if session_id is None or session_id in job.sessions}
+        if session_id is not None:
+            for job in self._stored("EXISTS (SELECT 1 FROM json_each(jobs.sessions) WHERE value = ?)", (session_id,), limit):
+                jobs.setdefault(job.id, job)
+        return sorted(jobs.values(), key=lambda job: job.created, reverse=True)[:limit]
+
+    # --- NOTIFICATION ---
+
+    def subscribe(self, session_id):
+        """An asyncio.Queue (of the calling event loop) that receives the session's job updates."""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._listeners.setdefault(session_id, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, session_id, queue):
+        with self._lock:
+            listeners = [entry for entry in self._listeners.get(session_id, []) if entry[1] is not queue]
+            if listeners:
+                self._listeners[session_id] = listeners
+            else:
+                self._listeners.pop(session_id, None)
+
+    def _publish(self, job):
+        # Writes the job store: called from job threads, and from submit, which the
+        # async tools call through run_blocking, never on the event loop
+        event = job.to_dict()
+        if self.store_path:
+            self._save(job)
+        with self._lock:
+            targets = [entry for session_id in job.sessions for entry in self._listeners.get(session_id, [])]
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass  # the listener's loop has closed
+
+    def stats(self):
+        counts = {status: 0 for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        for status in statuses:
+            counts[status] += 1
+        return {"workers": self.workers, "submitted": self.submitted, "joined": self.joined, **counts}
+
+
+def _alive(pid):
+    if os.name == "nt":
+        return True  # os.kill would terminate it; several workers only run on POSIX anyway
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def report_progress(fraction, message=None):
+    """Called from inside a job to update its progress; a no-op when the code is not running as a job."""
+    job = getattr(_worker, "job", None)
+    if job is None:
+        return
+    job.progress = max(job.progress, min(1.0, float(fraction)))
+    if message:
+        job.message = message
+    job_queue._publish(job)
+
+
+# Shared by every tool in the process
+job_queue = JobQueue()
+
+
+def submit_job(kind, description, func, *args, **kwargs):
+    """Submits a tool's work as a job keyed by (kind, args) and returns the message the agent sees."""
+    job, joined = job_queue.submit(kind, job_key(kind, *args), description, func, *args,
+                                   session_id=current_session.get(), **kwargs)
+    if joined:
+        return (f"The same request is already {job.status} as job {job.id} ({description}); joined it instead of "
+                "starting another. Progress is shown to the user; use job_status with this ID for the result.")
+    return (f"Started background job {job.id} ({description}). Progress is shown to the user as it runs; "
+            "use job_status with this ID to get the result.")
+
+
+def job_status(job_id: str = "") -> str:
+    """Status (and result, once finished) of a job, or of the current session's recent jobs."""
+    if job_id:
+        job = job_queue.get(job_id)
+        return job.summary() if job else f"No job with ID {job_id} (finished jobs are kept for {JOB_RETENTION_SECONDS / 3600:g}h)."
+    jobs = job_queue.jobs_for(current_session.get())
+    if not jobs:
+        return "There are no background jobs for this conversation."
+    return "\n".join(job.summary() for job in jobs)
+
+
+async def ajob_status(job_id: str = "") -> str:
+    # Jobs of other worker processes are read from the job store
+    return await run_blocking(job_status, job_id)
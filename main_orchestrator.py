@@ -1,70 +1,136 @@
 # main_orchestrator.py (Final Version)
 
+import logging
+import os
+import uuid
 from typing import List, TypedDict, Annotated
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
-import operator
 from dotenv import load_dotenv
 
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
-from langchain_openai import ChatOpenAI
+from langgraph.graph.message import add_messages
 from langchain_core.tools import StructuredTool
+from langchain_core.runnables import RunnableLambda
 from langchain.pydantic_v1 import BaseModel, Field
 
 # Import all our tool creation and logic functions
 from query_agent_with_rag_and_sql import (
-    create_sql_tool, create_rag_tool, create_notification_tool,
-    create_results_tool, create_analytics_tool, create_timetable_tool
+    create_sql_tool, create_rag_tool, create_notification_tool, create_bulk_notification_tool,
+    create_results_tool, create_analytics_tool, create_timetable_tool, create_batch_timetable_tool,
+    create_replan_tool, create_job_status_tool
 )
-from generate_timetable_pdf import create_timetable_pdf
+from generate_timetable_pdf import create_timetable_pdf, create_timetable_export
+from job_queue import submit_job
 from scheduler import generate_schedule_logic
+from tool_registry import get_llm, run_blocking
+from tool_executor import ParallelToolNode
+from conversation_memory import make_memory_node, with_summary, sqlite_checkpointer, prune_checkpoints
+from intent_router import IntentRouter, make_router_node, after_router
+from tracing import configure_logging, traced
 
 # --- CONFIGURATION ---
 load_dotenv()
-llm = ChatOpenAI(model_name="gpt-4o", temperature=0)
+configure_logging()
+log = logging.getLogger(__name__)
+llm = get_llm()
 
 # --- 1. INSTANTIATE ALL TOOLS ---
+# Tool creation is cheap: the embedding model, vector store and DB engine behind
+# them are built once, on first use, and shared through the tool registry.
 sql_tool = create_sql_tool()
 policy_tool = create_rag_tool()
 notification_tool = create_notification_tool()
+bulk_notification_tool = create_bulk_notification_tool()
 results_tool = create_results_tool()
 analytics_tool = create_analytics_tool()
 timetable_tool = create_timetable_tool()
+batch_timetable_tool = create_batch_timetable_tool()
+replan_tool = create_replan_tool()
+job_status_tool = create_job_status_tool()
 
 # The PDF tool needs a Pydantic model for its arguments to work correctly in the graph
 class PdfInput(BaseModel):
     semester_name: str = Field(description="The name of the semester, e.g., 'Fall 2025'.")
     department_name: str = Field(description="The name of the department, e.g., 'Computer Science'.")
 
+# Rendering runs as a background job; the tool returns the job ID straight away
+def start_pdf(semester_name: str, department_name: str) -> str:
+    return submit_job("timetable_pdf", f"timetable PDF for {department_name}, {semester_name}",
+                      create_timetable_pdf, semester_name, department_name)
+
+async def astart_pdf(semester_name: str, department_name: str) -> str:
+    # Submitting writes the job store: off the event loop
+    return await run_blocking(start_pdf, semester_name, department_name)
+
 pdf_tool = StructuredTool.from_function(
-    func=create_timetable_pdf,
+    func=start_pdf,
+    coroutine=astart_pdf,
     name="timetable_pdf_generator",
-    description="Generates a formatted PDF of the class schedule.",
+    description="Generates a formatted PDF of the class schedule. Runs in the background and returns a job ID immediately.",
     args_schema=PdfInput
 )
 
-all_tools = [sql_tool, policy_tool, notification_tool, results_tool, analytics_tool, timetable_tool, pdf_tool]
+class ExportInput(BaseModel):
+    semester_name: str = Field(description="The name of the semester, e.g., 'Fall 2025'.")
+    by: str = Field(default="department", description="'department' for one timetable per department, 'teacher' for one per teacher.")
+    fmt: str = Field(default="pdf", description="'pdf' for one multi-page PDF, 'zip' for a ZIP with one PDF per timetable.")
+
+def start_export(semester_name: str, by: str = "department", fmt: str = "pdf") -> str:
+    return submit_job("timetable_export", f"{by} timetables of {semester_name} as {fmt}",
+                      create_timetable_export, semester_name, by, fmt)
+
+async def astart_export(semester_name: str, by: str = "department", fmt: str = "pdf") -> str:
+    return await run_blocking(start_export, semester_name, by, fmt)
+
+export_tool = StructuredTool.from_function(
+    func=start_export,
+    coroutine=astart_export,
+    name="timetable_bulk_export",
+    description="Exports the timetable of every department (or every teacher) for a semester as one multi-page PDF or a ZIP of PDFs. Runs in the background and returns a job ID immediately.",
+    args_schema=ExportInput
+)
+
+all_tools = [sql_tool, policy_tool, notification_tool, bulk_notification_tool, results_tool, analytics_tool, timetable_tool, batch_timetable_tool, replan_tool, pdf_tool, export_tool, job_status_tool]
 
 # --- 2. BIND TOOLS TO THE LLM ---
 # This tells the LLM what functions it can call.
 llm_with_tools = llm.bind_tools(all_tools)
 
 # --- 3. DEFINE THE STATE ---
+# add_messages (rather than operator.add) lets the memory node replace and remove
+# stored messages; `summary` holds the turns that were folded away.
 class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], operator.add]
+    messages: Annotated[List[BaseMessage], add_messages]
+    summary: str
 
 # --- 4. DEFINE THE NODES ---
 
+# Runs once per turn, before the agent: trims old tool output and summarizes the
+# oldest turns so the session's history stays within CONTEXT_TOKEN_BUDGET.
+memory_node, amemory_node = make_memory_node(llm)
+
+# Answers common questions (counts, department heads, policy lookups) from a SQL
+# template or the retriever without the agent; everything else goes on to the agent.
+router = IntentRouter()
+router_node, arouter_node = make_router_node(router, all_tools)
+
 # The primary agent node. It calls the LLM to decide on an action.
+# LOG_LEVEL=DEBUG shows the messages sent to the LLM; at any other level they are never formatted.
 def agent_node(state: AgentState):
-    print("---AGENT NODE---")
-    # ADD THIS LINE TO SEE THE AGENT'S THOUGHTS
-    print(f"Messages sent to LLM: {state['messages']}")
-    response = llm_with_tools.invoke(state['messages'])
+    log.debug("Agent node, messages sent to LLM: %s", state['messages'])
+    response = llm_with_tools.invoke(with_summary(state))
+    return {"messages": [response]}
+
+# Async twin used by the API server's astream loop, so waiting on OpenAI never blocks other sessions.
+async def aagent_node(state: AgentState):
+    log.debug("Agent node, messages sent to LLM: %s", state['messages'])
+    response = await llm_with_tools.ainvoke(with_summary(state))
     return {"messages": [response]}
 
-# The node that executes any chosen tool. We use the pre-built ToolNode.
-tool_node = ToolNode(all_tools)
+# The node that executes the chosen tools. Independent calls from one AIMessage
+# run concurrently (TOOL_FANOUT_LIMIT at a time, each with its own timeout) and
+# their ToolMessages come back in call order. TOOL_TRACE=1 prints the overlap.
+tool_node = ParallelToolNode(all_tools)
 
 # --- 5. DEFINE THE ROUTER (CONDITIONAL EDGE) ---
 # This function decides whether to continue using tools or to finish.
@@ -80,11 +146,19 @@ def should_continue(state: AgentState):
 # --- 6. ASSEMBLE THE GRAPH ---
 workflow = StateGraph(AgentState)
 
-workflow.add_node("agent", agent_node)
-workflow.add_node("action", tool_node)
+# Each node runs in a "node" span; tool, LLM, DB and embedding spans nest under it.
+def node(name, func, afunc):
+    return RunnableLambda(traced("node", name)(func), afunc=traced("node", name)(afunc))
 
-# The entry point is the agent node.
-workflow.set_entry_point("agent")
+workflow.add_node("memory", node("memory", memory_node, amemory_node))
+workflow.add_node("router", node("router", router_node, arouter_node))
+workflow.add_node("agent", node("agent", agent_node, aagent_node))
+workflow.add_node("action", node("action", tool_node.invoke, tool_node.ainvoke))
+
+# Every turn enters through the memory node; the router either answers it or hands it to the agent.
+workflow.set_entry_point("memory")
+workflow.add_edge("memory", "router")
+workflow.add_conditional_edges("router", after_router, {"agent": "agent", "end": END})
 
 # Define the conditional routing
 workflow.add_conditional_edges(
@@ -97,21 +171,30 @@ workflow.add_conditional_edges(
 # process the tool's result.
 workflow.add_edge("action", "agent")
 
-# Compile the graph
-app = workflow.compile()
-print("Orchestrator is ready.")
+# Compile the graph. `app` has no memory; sessions use compile_app(checkpointer),
+# with the thread_id in the config naming the session.
+def compile_app(checkpointer=None):
+    return workflow.compile(checkpointer=checkpointer)
+
+app = compile_app()
+log.info("Orchestrator is ready.")
 
 # --- 7. RUN THE ORCHESTRATOR ---
 if __name__ == "__main__":
-    print("Starting a new conversation. Type 'exit' to quit.")
+    # CLI_SESSION_ID resumes an earlier conversation from the memory store
+    session_id = os.getenv("CLI_SESSION_ID") or f"cli-{uuid.uuid4().hex[:8]}"
+    prune_checkpoints()
+    cli_app = compile_app(sqlite_checkpointer())
+    config = {"configurable": {"thread_id": session_id}}
+    print(f"Starting conversation {session_id}. Type 'exit' to quit.")
     while True:
         user_input = input("You: ")
         if user_input.lower() == 'exit':
             break
 
-        events = app.stream({
+        events = cli_app.stream({
             "messages": [HumanMessage(content=user_input)]
-        })
+        }, config)
 
         print("\n---AGENT RESPONSE---")
         final_response = None
@@ -0,0 +1,193 @@
+# metrics.py (In-process latency metrics for the API server)
+
+import threading
+import time
+from collections import deque
+
+# Samples kept per metric; percentiles are over this sliding window
+METRICS_WINDOW = 1000
+
+
+class LatencyRecorder:
+    """Keeps the last `window` samples of one latency and reports count, mean and percentiles."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self.count, self.total
+        if not samples:
+            return {"count": 0}
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))], 4)
+
+        return {"count": count, "mean": round(total / count, 4),
+                "p50": percentile(50), "p95": percentile(95), "p99": percentile(99), "max": round(samples[-1], 4)}
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def recorder(name):
+    with _recorders_lock:
+        if name not in _recorders:
+            _recorders[name] = LatencyRecorder()
+        return _recorders[name]
+
+
+def observe(name, seconds):
+    recorder(name).observe(seconds)
+
+
+def summary():
+    with _recorders_lock:
+        names = sorted(_recorders)
+    return {name: recorder(name).summary() for name in names}
+
+
+class TurnTimer:
+    """Times one chat turn: time to first byte (first frame sent), first token and the whole turn."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_frame = None
+        self.first_token = None
+
+    def frame(self, kind):
+        now = time.perf_counter() - self.start
+        if self.first_frame is None:
+            self.first_frame = now
+            observe("ttfb_seconds", now)
+        if kind == "token" and self.first_token is None:
+            self.first_token = now
+            observe("first_token_seconds", now)
+
+    def done(self):
+        observe("turn_seconds", time.perf_counter() - self.start)
+
+
+# --- PROMETHEUS ---
+# Labelled histograms and counters (fed by tracing.py), rendered together with the
+# recorders above in the Prometheus text format for api_server's /metrics.
+METRICS_PREFIX = "uniautomate_"
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = METRICS_PREFIX + name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def lines(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in values:
+            yield f"{self.name}{_labels(self.label_names, key)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=HISTOGRAM_BUCKETS):
+        self.name, self.help, self.label_names = METRICS_PREFIX + name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def lines(self):
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, values in series:
+            for bound, count in zip(self.buckets, values):
+                le = 'le="%g"' % bound
+                yield f"{self.name}_bucket{_labels(self.label_names, key, le)} {count}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.label_names, key, le)} {values[-2]}"
+            yield f"{self.name}_count{_labels(self.label_names, key)} {values[-2]}"
+            yield f"{self.name}_sum{_labels(self.label_names, key)} {values[-1]:.6f}"
+
+
+_families = {}
+
+
+def _family(cls, name, help, labels):
+    with _recorders_lock:
+        if name not in _families:
+            _families[name] = cls(name, help, labels)
+        return _families[name]
+
+
+def counter(name, help, labels=()):
+    return _family(Counter, name, help, labels)
+
+
+def histogram(name, help, labels=()):
+    return _family(Histogram, name, help, labels)
+
+
+def prometheus(gauges=None):
+    """Every metric in the Prometheus text format; `gauges` ({name: value}) adds point-in-time values."""
+    lines = []
+    with _recorders_lock:
+        families = [_families[name] for name in sorted(_families)]
+        names = sorted(_recorders)
+    for family in families:
+        lines.extend(family.lines())
+    for name in names:
+        stats = recorder(name).summary()
+        if not stats["count"]:
+            continue
+        metric = METRICS_PREFIX + name
+        lines.append(f"# TYPE {metric} summary")
+        for quantile, label in (("p50", "0.5"), ("p95", "0.95"), ("p99", "0.99")):
+            lines.append(f'{metric}{{quantile="{label}"}} {stats[quantile]}')
+        lines.append(f"{metric}_count {stats['count']}")
+        lines.append(f"{metric}_sum {stats['mean'] * stats['count']:.6f}")
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {METRICS_PREFIX}{name} gauge")
+        lines.append(f"{METRICS_PREFIX}{name} {value:g}")
+    return "\n".join(lines) + "\n"
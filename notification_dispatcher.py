@@ -0,0 +1,360 @@
+# notification_dispatcher.py (Bulk, rate-limited WhatsApp notifications with a delivery log)
+#
+# whatsapp_sender sends one message per tool call, so telling a 400-student course
+# about a room change took 400 agent steps. The bulk_notifier tool instead names an
+# audience ("students of course 12", "teachers of Physics") and a message template;
+# the recipients are read with a fixed query and the messages are sent by a
+# background job (job_queue), which reports progress to the session like the
+# timetable jobs do. Sending goes through:
+#   1. a token bucket shared by every batch (NOTIFY_RATE_PER_SECOND, NOTIFY_BURST),
+#      so a big batch stays under the Twilio sender's rate limit; with several
+#      worker processes (WEB_CONCURRENCY > 1) it is kept in NOTIFY_LOG_PATH and
+#      shared by all of them,
+#   2. retries with exponential backoff and jitter for 429s, 5xx and network errors
+#      (other 4xx, e.g. an invalid number, fail at once),
+#   3. deduplication: a recipient already sent the same text within
+#      NOTIFY_DEDUP_SECONDS is skipped, so re-running a batch after a failure only
+#      sends what is missing,
+#   4. a delivery log (SQLite, NOTIFY_LOG_PATH) with one row per recipient and attempt count.
+# Point TWILIO_API_BASE_URL (tool_registry) at a local stub to run all of it offline.
+
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from string import Template
+
+from sqlalchemy import bindparam, inspect, text
+
+import metrics
+import shared_state
+import tracing
+from db_pool import connection
+from job_queue import report_progress
+from tool_registry import get_twilio_client
+
+log = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+NOTIFY_RATE_PER_SECOND = float(os.getenv("NOTIFY_RATE_PER_SECOND", "10"))  # sustained sends per second
+NOTIFY_BURST = int(os.getenv("NOTIFY_BURST", "10"))                        # sends allowed at once after an idle spell
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "8"))             # API calls in flight per batch
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_BACKOFF_SECONDS = float(os.getenv("NOTIFY_BACKOFF_SECONDS", "1"))   # first retry delay; doubles per attempt
+NOTIFY_BACKOFF_MAX_SECONDS = 60
+NOTIFY_DEDUP_SECONDS = float(os.getenv("NOTIFY_DEDUP_SECONDS", "86400"))
+NOTIFY_LOG_PATH = os.getenv("NOTIFY_LOG_PATH", "./notification_log.sqlite3")
+NOTIFY_PHONE_COLUMN = os.getenv("NOTIFY_PHONE_COLUMN", "phone_number")     # WhatsApp number column of students / teachers
+NOTIFY_MAX_RECIPIENTS = int(os.getenv("NOTIFY_MAX_RECIPIENTS", "5000"))
+
+SENT, FAILED, DUPLICATE, NO_NUMBER = "sent", "failed", "duplicate", "no_number"
+
+notifications = metrics.counter("notifications_total", "Bulk notification deliveries by outcome.", ("status",))
+notification_retries = metrics.counter("notification_retries_total", "Twilio sends retried after a 429, 5xx or network error.")
+
+
+# --- AUDIENCES ---
+# Fixed, parameterised queries only: the agent picks an audience, never SQL.
+# Each row gives id, first_name, last_name, phone, course_name and department_name for the template.
+AUDIENCES = {
+    "course": ("students", """
+        SELECT s.student_id, s.first_name, s.last_name, s.{phone}, c.course_name, d.name
+        FROM enrollments e
+        JOIN students s ON e.student_id = s.student_id
+        JOIN courses c ON e.course_id = c.course_id
+        JOIN departments d ON c.department_id = d.department_id
+        WHERE e.course_id = :course_id
+        ORDER BY s.student_id"""),
+    "department": ("students", """
+        SELECT s.student_id, s.first_name, s.last_name, s.{phone}, '' AS course_name, d.name
+        FROM students s JOIN departments d ON s.department_id = d.department_id
+        WHERE d.name = :department_name
+        ORDER BY s.student_id"""),
+    "department_teachers": ("teachers", """
+        SELECT t.teacher_id, t.first_name, t.last_name, t.{phone}, '' AS course_name, d.name
+        FROM teachers t JOIN departments d ON t.department_id = d.department_id
+        WHERE d.name = :department_name
+        ORDER BY t.teacher_id"""),
+    "students": ("students", """
+        SELECT s.student_id, s.first_name, s.last_name, s.{phone}, '' AS course_name, d.name
+        FROM students s LEFT JOIN departments d ON s.department_id = d.department_id
+        WHERE s.student_id IN :student_ids
+        ORDER BY s.student_id"""),
+}
+FIELDS = ("id", "first_name", "last_name", "phone", "course_name", "department_name")
+
+
+def fetch_recipients(audience, course_id=None, department_name=None, student_ids=None):
+    """The audience's rows as dicts of FIELDS."""
+    if audience not in AUDIENCES:
+        raise ValueError(f"Unknown audience '{audience}'; use one of {', '.join(AUDIENCES)}.")
+    table, query = AUDIENCES[audience]
+    params = {"course_id": course_id, "department_name": department_name, "student_ids": list(student_ids or [])}
+    needed = {"course": "course_id", "department": "department_name", "department_teachers": "department_name",
+              "students": "student_ids"}[audience]
+    if not params[needed]:
+        raise ValueError(f"The '{audience}' audience needs {needed}.")
+    statement = text(query.format(phone=NOTIFY_PHONE_COLUMN))
+    if audience == "students":
+        statement = statement.bindparams(bindparam("student_ids", expanding=True))
+    with connection() as conn:
+        if NOTIFY_PHONE_COLUMN not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            raise ValueError(f"The {table} table has no {NOTIFY_PHONE_COLUMN} column; "
+                             "set NOTIFY_PHONE_COLUMN to the column holding WhatsApp numbers.")
+        rows = conn.execute(statement, {k: v for k, v in params.items() if f":{k}" in query}).fetchall()
+    if len(rows) > NOTIFY_MAX_RECIPIENTS:
+        raise ValueError(f"{len(rows)} recipients is more than NOTIFY_MAX_RECIPIENTS ({NOTIFY_MAX_RECIPIENTS}).")
+    return [dict(zip(FIELDS, row)) for row in rows]
+
+
+def whatsapp_address(number):
+    number = "".join(str(number or "").split())
+    if not number:
+        return None
+    return number if number.startswith("whatsapp:") else f"whatsapp:{number}"
+
+
+def render(template, recipient):
+    """$first_name-style placeholders (string.Template: no attribute or index access from agent-written text)."""
+    return Template(template).substitute({k: "" if v is None else v for k, v in recipient.items()})
+
+
+# --- RATE LIMITING ---
+
+class TokenBucket:
+    """`rate` tokens per second, at most `burst` saved up; acquire() blocks until the caller's token is due.
+
+    With a `path` the bucket lives in that SQLite file, so every worker process of the machine
+    draws from the same bucket and the combined send rate stays at `rate`.
+    """
+
+    def __init__(self, rate=NOTIFY_RATE_PER_SECOND, burst=NOTIFY_BURST, path=None, name="twilio"):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.path = path
+        self.name = name
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _take(self, tokens, updated, now):
+        # Take the token now (possibly going negative) so waiting callers are served in order
+        tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+        return tokens, -tokens / self.rate if tokens < 0 else 0.0
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: the read-modify-write below runs in an explicit BEGIN IMMEDIATE
+            conn = self._local.conn = shared_state.connect(self.path, isolation_level=None)
+            conn.execute("CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        return conn
+
+    def _take_shared(self):
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")  # one process at a time between the read and the write
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+            tokens, wait = self._take(*(row or (float(self.burst), now)), now)
+            conn.execute("INSERT OR REPLACE INTO token_buckets VALUES (?, ?, ?)", (self.name, tokens, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self):
+        if self.rate <= 0:
+            return 0.0
+        if self.path:
+            wait = self._take_shared()
+        else:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens, wait = self._take(self._tokens, self._updated, now)
+                self._updated = now
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+# --- DELIVERY LOG ---
+
+class DeliveryLog:
+    """One row per recipient of every batch; also answers "was this exact message already sent?"."""
+
+    def __init__(self, path=NOTIFY_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db().close()
+
+    def _db(self):
+        conn = shared_state.connect(self.path)
+        conn.execute("""CREATE TABLE IF NOT EXISTS deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, batch TEXT, recipient TEXT, dedup_key TEXT, status TEXT,
+            attempts INTEGER, sid TEXT, error TEXT, created REAL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS deliveries_dedup ON deliveries (dedup_key, status, created)")
+        conn.execute("CREATE INDEX IF NOT EXISTS deliveries_batch ON deliveries (batch)")
+        return conn
+
+    def record(self, rows):
+        """rows: (batch, recipient, dedup_key, status, attempts, sid, error)."""
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.executemany("INSERT INTO deliveries (batch, recipient, dedup_key, status, attempts, sid, error, created) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [row + (now,) for row in rows])
+            conn.close()
+
+    def already_sent(self, keys, within=NOTIFY_DEDUP_SECONDS):
+        """The subset of `keys` with a successful delivery in the last `within` seconds."""
+        found, keys = set(), list(keys)
+        with self._lock:
+            conn = self._db()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                found.update(k for (k,) in conn.execute(
+                    f"SELECT DISTINCT dedup_key FROM deliveries WHERE status = ? AND created >= ? "
+                    f"AND dedup_key IN ({', '.join('?' * len(chunk))})", [SENT, time.time() - within, *chunk]))
+            conn.close()
+        return found
+
+    def batch(self, batch):
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute("SELECT recipient, status, attempts, sid, error FROM deliveries WHERE batch = ? ORDER BY id",
+                                (batch,)).fetchall()
+            conn.close()
+        return [dict(zip(("recipient", "status", "attempts", "sid", "error"), row)) for row in rows]
+
+    def counts(self):
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute("SELECT status, count(*) FROM deliveries GROUP BY status").fetchall()
+            conn.close()
+        return dict(rows)
+
+
+# --- DISPATCHER ---
+
+def dedup_key(to, body):
+    return hashlib.sha256(f"{to}\n{body}".encode()).hexdigest()
+
+
+def retryable(error):
+    """429s, 5xx and network errors are worth another attempt; other API errors are not."""
+    from twilio.base.exceptions import TwilioRestException
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, OSError)
+
+
+class NotificationDispatcher:
+    def __init__(self, bucket=None, delivery_log=None, concurrency=NOTIFY_CONCURRENCY, max_attempts=NOTIFY_MAX_ATTEMPTS,
+                 backoff=NOTIFY_BACKOFF_SECONDS, dedup_seconds=NOTIFY_DEDUP_SECONDS):
+        # Several worker processes share one bucket in the delivery log file (see shared_state)
+        self.bucket = bucket or TokenBucket(path=NOTIFY_LOG_PATH if shared_state.WEB_CONCURRENCY > 1 else None)
+        self._log = delivery_log
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.dedup_seconds = dedup_seconds
+        self.batches = 0
+        self.retries = 0
+
+    @property
+    def log(self):
+        # Opened on first use, so importing the module creates no file
+        if self._log is None:
+            self._log = DeliveryLog()
+        return self._log
+
+    def backoff_delay(self, attempt):
+        return min(NOTIFY_BACKOFF_MAX_SECONDS, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def deliver(self, to, body):
+        """One message, rate limited and retried; returns (status, attempts, sid, error)."""
+        from_number = os.getenv("TWILIO_FROM_NUMBER")
+        for attempt in range(1, self.max_attempts + 1):
+            self.bucket.acquire()
+            try:
+                with tracing.span("notification", "send", attempt=attempt):
+                    message = get_twilio_client().messages.create(from_=from_number, body=body, to=to)
+                return SENT, attempt, message.sid, None
+            except Exception as e:
+                if attempt == self.max_attempts or not retryable(e):
+                    return FAILED, attempt, None, str(e)[:500]
+                self.retries += 1
+                notification_retries.inc()
+                time.sleep(self.backoff_delay(attempt))
+
+    def send_bulk(self, messages, batch=None):
+        """Sends [(to, body)] (to may be None: no number) and returns a summary; every outcome goes to the log."""
+        batch = batch or uuid.uuid4().hex[:12]
+        self.batches += 1
+        start = time.perf_counter()
+        rows, pending, seen = [], [], set()
+        already = self.log.already_sent({dedup_key(to, body) for to, body in messages if to}, self.dedup_seconds)
+        for to, body in messages:
+            key = dedup_key(to, body) if to else None
+            if to is None:
+                rows.append((batch, None, None, NO_NUMBER, 0, None, None))
+            elif key in already or key in seen:
+                rows.append((batch, to, key, DUPLICATE, 0, None, None))
+            else:
+                seen.add(key)
+                pending.append((to, body, key))
+        self.log.record(rows)
+        outcomes = {status: 0 for status in (SENT, FAILED, DUPLICATE, NO_NUMBER)}
+        for row in rows:
+            outcomes[row[3]] += 1
+
+        done, total = 0, len(pending)
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, total or 1), thread_name_prefix="notify") as pool:
+            futures = {pool.submit(tracing.in_context(self.deliver), to, body): (to, key) for to, body, key in pending}
+            for future in as_completed(futures):
+                to, key = futures[future]
+                status, attempts, sid, error = future.result()
+                self.log.record([(batch, to, key, status, attempts, sid, error)])
+                outcomes[status] += 1
+                done += 1
+                if done % 10 == 0 or done == total:
+                    report_progress(done / total, f"{outcomes[SENT]} of {total} sent, {outcomes[FAILED]} failed")
+        for status, count in outcomes.items():
+            if count:
+                notifications.inc(count, status=status)
+        summary = {"batch": batch, "recipients": len(messages), **outcomes, "seconds": round(time.perf_counter() - start, 2)}
+        log.info("Notification batch %s: %s", batch, summary)
+        return summary
+
+    def stats(self):
+        return {"rate_per_second": self.bucket.rate, "burst": self.bucket.burst, "concurrency": self.concurrency,
+                "batches": self.batches, "retries": self.retries, "deliveries": self.log.counts()}
+
+
+# Shared by every batch in the process, so they all draw from one rate limit
+dispatcher = NotificationDispatcher()
+
+
+def notify_audience(audience, template, course_id=None, department_name=None, student_ids=None):
+    """Job body of bulk_notifier: resolve the audience, render the template per recipient and send."""
+    recipients = fetch_recipients(audience, course_id, department_name, student_ids)
+    if not recipients:
+        return f"No recipients found for audience '{audience}'."
+    try:
+        messages = [(whatsapp_address(r["phone"]), render(template, r)) for r in recipients]
+    except (KeyError, ValueError) as e:
+        return f"The template has an unknown or malformed placeholder ({e}); use ${', $'.join(FIELDS)}."
+    report_progress(0.0, f"Sending to {len(messages)} recipients")
+    summary = dispatcher.send_bulk(messages)
+    return (f"Batch {summary['batch']}: sent {summary[SENT]} of {summary['recipients']} messages in {summary['seconds']}s "
+            f"({summary[FAILED]} failed, {summary[DUPLICATE]} already sent, {summary[NO_NUMBER]} without a WhatsApp number).")
@@ -0,0 +1,348 @@
+# query_library.py (Named, parameterized and prepared SQL templates for the SQL tools)
+#
+# The SQL tools used to ask the LLM for a fresh query on every question and run
+# it as an unprepared string. A QueryLibrary keeps named templates instead:
+#   - the few-shot examples of each tool's prompt,
+#   - queries learned from successful generations: literals that came from the
+#     question (emails, numbers, quoted text, capitalised names) become bind
+#     parameters and the question becomes a pattern with one slot per parameter.
+# A new question that fits a pattern runs the stored template with its own
+# values, without an LLM call and without new query text reaching the database.
+# On PostgreSQL every template is PREPAREd once per pooled connection (tracked
+# in Connection.info); asyncpg prepares and caches statements by itself. Hit
+# counts and mean execution times are kept per template and persisted to SQLite.
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import text
+
+import shared_state
+from db_pool import async_connection, connection
+from sql_executor import is_read_only, with_limit
+
+log = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+QUERY_LIBRARY_PATH = os.getenv("QUERY_LIBRARY_PATH", "./query_library.sqlite3")  # empty = memory only
+QUERY_LIBRARY_SIZE = int(os.getenv("QUERY_LIBRARY_SIZE", "500"))                  # learned templates kept per library
+QUERY_LIBRARY_FLUSH_SECONDS = float(os.getenv("QUERY_LIBRARY_FLUSH_SECONDS", "30"))
+QUERY_LIBRARY_PREPARE = os.getenv("QUERY_LIBRARY_PREPARE", "1") not in ("0", "false", "False")
+
+# Values in a question that may be parameters, in the order they appear
+_QUESTION_LITERAL_RE = re.compile(
+    r"(?P<email>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)"
+    r"|'(?P<quoted>[^']+)'|\"(?P<dquoted>[^\"]+)\""
+    r"|(?<![\w.])(?P<number>\d+(?:\.\d+)?)(?![\w.])"
+    r"|(?<!^)(?<![.?!] )\b(?P<name>[A-Z][\w-]*(?: [A-Z][\w-]*)*)"
+)
+# String and numeric literals of a SQL statement
+_SQL_LITERAL_RE = re.compile(r"'(?P<string>(?:[^']|'')*)'|(?<![\w.:$])(?P<number>\d+(?:\.\d+)?)(?![\w.])")
+# SQLAlchemy-style :name binds (not :: casts)
+_BIND_RE = re.compile(r"(?<![:\w\\]):(\w+)(?!:)")
+_EXAMPLE_RE = re.compile(r"User Question:\s*(.+?)\s*\n\s*SQL Query:\s*(.+?)\s*(?:\n|$)")
+
+# Regex for each kind of slot; names stay case-sensitive so a slot cannot swallow ordinary words
+SLOT_PATTERNS = {"email": r"(?P<{}>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)", "quoted": r"'(?P<{}>[^']+)'", "dquoted": r'"(?P<{}>[^"]+)"',
+                 "number": r"(?P<{}>\d+(?:\.\d+)?)", "name": r"(?P<{}>[A-Z][\w-]*(?: [A-Z][\w-]*)*)"}
+
+
+def normalize_question(question):
+    return re.sub(r"\s+", " ", str(question)).strip().rstrip("?.! ")
+
+
+def question_literals(question):
+    """[(kind, value, start, end)] for the candidate parameters of a normalised question."""
+    found = []
+    for match in _QUESTION_LITERAL_RE.finditer(question):
+        kind = match.lastgroup
+        found.append((kind, match.group(kind), match.start(), match.end()))
+    return found
+
+
+def parse_examples(examples):
+    """(question, sql) pairs from a few-shot block of "User Question: ... / SQL Query: ..." lines."""
+    return _EXAMPLE_RE.findall(examples)
+
+
+def _value(kind, raw):
+    if kind == "number":
+        return float(raw) if "." in raw else int(raw)
+    return raw
+
+
+def parameterize(question, sql):
+    """Turns a (question, SQL) pair into (pattern, template SQL, {param: kind}), or None if it cannot be reused.
+
+    Only SQL literals equal to a value from the question become parameters; every
+    other literal, and every question value the SQL does not use, stays fixed.
+    """
+    question = normalize_question(question)
+    sql = sql.strip().rstrip(";").strip()
+    if not is_read_only(sql):
+        return None
+    candidates = question_literals(question)
+    values = [value for _, value, _, _ in candidates]
+    used = {}
+
+    def replace(match):
+        raw = match.group("string").replace("''", "'") if match.group("string") is not None else match.group("number")
+        if values.count(raw) != 1:
+            return match.group(0)  # not from the question (or ambiguous): a constant of the template
+        index = values.index(raw)
+        used[index] = f"p{index}"
+        return f":p{index}"
+
+    template = _SQL_LITERAL_RE.sub(replace, sql)
+    pattern, fixed, position = [], [], 0
+
+    def literal_text(part):
+        fixed.append(part)
+        escaped = re.sub(r"(?:\\ )+", r"\\s+", re.escape(part))
+        return f"(?i:{escaped})" if part else ""
+
+    for index, (kind, value, start, end) in enumerate(candidates):
+        if index not in used:
+            continue
+        pattern.append(literal_text(question[position:start]))
+        pattern.append(SLOT_PATTERNS[kind].format(f"p{index}"))
+        position = end
+    pattern.append(literal_text(question[position:]))
+    if len(re.findall(r"\w+", " ".join(fixed))) < 2:
+        return None  # a question that is little more than its values would match almost anything
+    return "".join(pattern), template, {used[i]: candidates[i][0] for i in sorted(used)}
+
+
+def _prepared_on(conn):
+    """Names of the statements PREPAREd on this pooled DBAPI connection."""
+    dbapi_connection = conn.connection.dbapi_connection
+    state = conn.info.get("prepared_statements")
+    if state is None or state[0] is not dbapi_connection:
+        state = conn.info["prepared_statements"] = (dbapi_connection, set())
+    return state[1]
+
+
+class QueryLibrary:
+    """Named SQL templates for one tool, matched against questions and executed as prepared statements."""
+
+    def __init__(self, name, path=QUERY_LIBRARY_PATH, max_learned=QUERY_LIBRARY_SIZE):
+        self.name = name
+        self.path = path
+        self.max_learned = max_learned
+        self._lock = threading.RLock()
+        self._templates = {}  # template name -> dict
+        self._patterns = {}   # template name -> compiled pattern
+        self._dirty = set()
+        self._flushed_at = time.monotonic()
+        self.matches = 0
+        self.misses = 0
+        if self.path:
+            self._load()
+
+    # --- PERSISTENCE ---
+
+    def _db(self):
+        conn = shared_state.connect(self.path)
+        conn.execute("""CREATE TABLE IF NOT EXISTS query_library (
+            library TEXT, name TEXT, question TEXT, pattern TEXT, sql TEXT, params TEXT, source TEXT,
+            hits INTEGER, total_seconds REAL, last_used REAL, PRIMARY KEY (library, name))""")
+        return conn
+
+    def _load(self, only_new=False):
+        with self._db() as conn:
+            rows = conn.execute("SELECT name, question, pattern, sql, params, source, hits, total_seconds, last_used "
+                                "FROM query_library WHERE library = ?", (self.name,)).fetchall()
+        for name, question, pattern, sql, params, source, hits, total_seconds, last_used in rows:
+            if only_new and name in self._templates:
+                continue
+            self._put({"name": name, "question": question, "pattern": pattern, "sql": sql, "params": json.loads(params),
+                       "source": source, "hits": hits, "total_seconds": total_seconds, "last_used": last_used})
+
+    def flush(self, force=False):
+        """Writes new templates and changed stats, then picks up templates learned by other worker
+        processes sharing the file (at most every QUERY_LIBRARY_FLUSH_SECONDS unless forced)."""
+        with self._lock:
+            if not self.path or (not force and time.monotonic() - self._flushed_at < QUERY_LIBRARY_FLUSH_SECONDS):
+                return
+            rows = [(self.name, t["name"], t["question"], t["pattern"], t["sql"], json.dumps(t["params"]), t["source"],
+                     t["hits"], t["total_seconds"], t["last_used"])
+                    for t in (self._templates.get(name) for name in self._dirty) if t is not None]
+            gone = [(self.name, name) for name in self._dirty if name not in self._templates]
+            self._dirty.clear()
+            self._flushed_at = time.monotonic()
+        with self._db() as conn:
+            conn.executemany("INSERT OR REPLACE INTO query_library VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("DELETE FROM query_library WHERE library = ? AND name = ?", gone)
+        if shared_state.WEB_CONCURRENCY > 1:
+            with self._lock:
+                self._load(only_new=True)
+
+    # --- TEMPLATES ---
+
+    def _put(self, template):
+        self._templates[template["name"]] = template
+        if template["pattern"] is not None:
+            self._patterns[template["name"]] = re.compile(template["pattern"])
+
+    def add(self, name, sql, params=(), question=None, pattern=None, source="builtin"):
+        """Registers a template under a fixed name (kept stats survive restarts)."""
+        params = {p: "value" for p in params} if not isinstance(params, dict) else params
+        with self._lock:
+            if name in self._templates:
+                template = self._templates[name]
+                if template["sql"] != sql:
+                    # The built-in query changed since the stats were stored
+                    template.update(sql=sql, params=params)
+                    self._dirty.add(name)
+                return template
+            template = {"name": name, "question": question, "pattern": pattern, "sql": sql,
+                        "params": params,
+                        "source": source, "hits": 0, "total_seconds": 0.0, "last_used": 0.0}
+            self._put(template)
+            self._dirty.add(name)
+            return template
+
+    def learn(self, question, sql, source="learned"):
+        """Stores a successful (question, SQL) pair as a template; returns it, or None if it cannot be reused."""
+        parameterized = parameterize(question, sql)
+        if parameterized is None:
+            return None
+        pattern, template_sql, params = parameterized
+        name = f"{self.name}_{hashlib.sha1((pattern + chr(0) + template_sql).encode()).hexdigest()[:12]}"
+        with self._lock:
+            if name in self._templates:
+                return self._templates[name]
+            template = self.add(name, template_sql, params, question=normalize_question(question), pattern=pattern, source=source)
+            learned = sorted((t for t in self._templates.values() if t["source"] == "learned"), key=lambda t: t["last_used"])
+            for stale in learned[:max(0, len(learned) - self.max_learned)]:
+                self.forget(stale["name"])
+        self.flush(force=True)
+        return template
+
+    def seed(self, examples):
+        """Adds the pairs of a few-shot example block."""
+        for question, sql in parse_examples(examples):
+            self.learn(question, sql, source="example")
+
+    def forget(self, name):
+        with self._lock:
+            self._templates.pop(name, None)
+            self._patterns.pop(name, None)
+            self._dirty.add(name)
+
+    def match(self, question):
+        """Returns (template, params) for the first template whose pattern fits the question, or None."""
+        question = normalize_question(question)
+        with self._lock:
+            candidates = list(self._patterns.items())
+        for name, pattern in candidates:
+            found = pattern.fullmatch(question)
+            if found:
+                template = self._templates.get(name)
+                if template is None:
+                    continue
+                with self._lock:
+                    self.matches += 1
+                return template, {p: _value(kind, found.group(p)) for p, kind in template["params"].items()}
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, name):
+        return self._templates[name]
+
+    # --- EXECUTION ---
+
+    def record(self, template, seconds):
+        with self._lock:
+            template["hits"] += 1
+            template["total_seconds"] += seconds
+            template["last_used"] = time.time()
+            self._dirty.add(template["name"])
+        self.flush()
+
+    def _execute_prepared(self, conn, template, params):
+        statement = f"qlib_{template['name']}"
+        order = list(dict.fromkeys(_BIND_RE.findall(template["sql"])))
+        prepared = _prepared_on(conn)
+        if statement not in prepared:
+            positional = _BIND_RE.sub(lambda m: f"${order.index(m.group(1)) + 1}", with_limit(template["sql"]))
+            try:
+                with conn.begin_nested():  # a failed PREPARE must not abort the caller's transaction
+                    conn.exec_driver_sql(f"PREPARE {statement} AS {positional}")
+            except Exception as e:
+                log.warning("Could not prepare %s, running it unprepared: %s", template['name'], e)
+                template["unpreparable"] = True
+                return conn.execute(text(with_limit(template["sql"])), params)
+            prepared.add(statement)
+        arguments = f"({', '.join(':' + name for name in order)})" if order else ""
+        return conn.execute(text(f"EXECUTE {statement}{arguments}"), params)
+
+    def execute(self, template, params=None, conn=None):
+        """Runs a template (or template name) and returns its rows."""
+        template = self.get(template) if isinstance(template, str) else template
+        params = params or {}
+        start = time.perf_counter()
+        if conn is None:
+            with connection() as conn:
+                rows = self._run(conn, template, params)
+        else:
+            rows = self._run(conn, template, params)
+        self.record(template, time.perf_counter() - start)
+        return rows
+
+    def _run(self, conn, template, params):
+        return self.result(conn, template, params).fetchall()
+
+    def result(self, conn, template, params):
+        """Executes a template on `conn` (capped at SQL_ROW_LIMIT rows) and returns the SQLAlchemy result."""
+        if QUERY_LIBRARY_PREPARE and conn.dialect.name == "postgresql" and not template.get("unpreparable"):
+            return self._execute_prepared(conn, template, params)
+        # SQLite caches compiled statements per connection on its own
+        return conn.execute(text(with_limit(template["sql"])), params)
+
+    async def aexecute(self, template, params=None):
+        """Async counterpart of `execute`; asyncpg prepares (and caches) every statement it runs."""
+        template = self.get(template) if isinstance(template, str) else template
+        start = time.perf_counter()
+        async with async_connection() as conn:
+            rows = (await conn.execute(text(with_limit(template["sql"])), params or {})).fetchall()
+        self.record(template, time.perf_counter() - start)
+        return rows
+
+    def stats(self):
+        with self._lock:
+            templates = sorted(self._templates.values(), key=lambda t: -t["hits"])
+            return {
+                "templates": len(templates),
+                "learned": sum(t["source"] == "learned" for t in templates),
+                "matches": self.matches,
+                "misses": self.misses,
+                "top": [{"name": t["name"], "question": t["question"], "source": t["source"], "hits": t["hits"],
+                         "mean_ms": round(1000 * t["total_seconds"] / t["hits"], 2) if t["hits"] else None}
+                        for t in templates[:10]],
+            }
+
+
+# --- SHARED LIBRARIES ---
+libraries = {
+    "student_database_query": QueryLibrary("student_database_query"),
+    "database_analyzer": QueryLibrary("database_analyzer"),
+    "intent_router": QueryLibrary("intent_router"),
+}
+
+
+def stats():
+    return {name: library.stats() for name, library in libraries.items()}
+
+
+@atexit.register
+def flush_all():
+    for library in libraries.values():
+        library.flush(force=True)
@@ -0,0 +1,270 @@
+# response_cache.py (Exact + semantic answer cache in front of the LLM-backed chains)
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import shared_state
+
+# --- CONFIGURATION ---
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") not in ("0", "false", "False")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))               # entries per cache (LRU)
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))  # cosine threshold for a semantic hit
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")                            # e.g. ./response_cache.sqlite3; unset = memory only
+RESPONSE_CACHE_SYNC_SECONDS = float(os.getenv("RESPONSE_CACHE_SYNC_SECONDS", "5"))  # how often entries stored by other workers are picked up
+# Documents change rarely; live data answers must not be served for long
+RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "86400"))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "300"))
+
+_TABLE_RE = re.compile(r"\b(?:from|join|into|update)\s+([a-z_][\w.]*)", re.IGNORECASE)
+# Numbers, e-mails, quoted strings and capitalised names: two questions that differ
+# in any of these ("students in Physics" vs "in Chemistry") must never share an answer.
+_LITERAL_RE = re.compile(r"[\w.+-]+@[\w.-]+|\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"|(?<!^)(?<![.?!] )\b[A-Z][a-zA-Z]+")
+
+
+def normalize(question):
+    return re.sub(r"\s+", " ", str(question)).strip().strip("?.! ").lower()
+
+
+def literals(question):
+    return sorted(set(_LITERAL_RE.findall(str(question).strip())))
+
+
+def tables_in_sql(sql):
+    """Base tables a statement reads or writes, used to tie cached answers to table writes."""
+    return sorted({name.split(".")[-1].lower() for name in _TABLE_RE.findall(sql)})
+
+
+class ResponseCache:
+    """Two-level cache: exact match on the normalised question, then nearest neighbour on its
+    embedding (the shared all-MiniLM-L6-v2 model). Entries expire by TTL, are evicted LRU,
+    can be tied to tables for invalidation and can be persisted to a local SQLite file.
+
+    With a file, the file is the source of truth and memory is a copy: every hit is checked
+    against the file (so an invalidation in another worker process takes effect at once) and
+    entries stored by other workers are loaded every RESPONSE_CACHE_SYNC_SECONDS."""
+
+    def __init__(self, name, ttl, max_entries=RESPONSE_CACHE_SIZE, threshold=RESPONSE_CACHE_SIMILARITY,
+                 path=RESPONSE_CACHE_PATH, semantic=True):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.semantic = semantic
+        self.path = path
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._entries = OrderedDict()  # normalised question -> entry dict
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.seconds_saved = 0.0
+        self._synced_at = 0.0    # created_at of the newest entry read from the file
+        self._next_sync = 0.0
+        if self.path:
+            self._load()
+
+    # --- PERSISTENCE ---
+
+    def _db(self):
+        # One connection per thread: every lookup reads the file, so it is not reopened each time
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = shared_state.connect(self.path)
+            conn.execute("""CREATE TABLE IF NOT EXISTS response_cache (
+                cache TEXT, key TEXT, question TEXT, answer TEXT, vector BLOB,
+                tables TEXT, created_at REAL, cost REAL, PRIMARY KEY (cache, key))""")
+        return conn
+
+    def _load(self, since=0.0):
+        with self._db() as conn:
+            rows = conn.execute("SELECT key, question, answer, vector, tables, created_at, cost FROM response_cache "
+                                "WHERE cache = ? AND created_at > ? ORDER BY created_at", (self.name, since)).fetchall()
+        for key, *row in rows[-self.max_entries:]:
+            self._entries[key] = self._entry(*row)
+            self._entries.move_to_end(key)
+            self._synced_at = max(self._synced_at, self._entries[key]["created_at"])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _entry(question, answer, vector, tables, created_at, cost):
+        return {"question": question, "answer": answer, "tables": set(json.loads(tables)),
+                "vector": np.frombuffer(vector, dtype=np.float32) if vector else None,
+                "literals": literals(question), "created_at": created_at, "cost": cost}
+
+    def _sync(self):
+        """Picks up entries other workers stored since the last sync."""
+        now = time.monotonic()
+        if not self.path or now < self._next_sync:
+            return
+        self._next_sync = now + RESPONSE_CACHE_SYNC_SECONDS
+        with self._lock:
+            self._load(self._synced_at)
+
+    def _stored(self, key):
+        """The file's copy of an entry, dropping the memory copy when another worker invalidated it."""
+        with self._db() as conn:
+            row = conn.execute("SELECT question, answer, vector, tables, created_at, cost FROM response_cache "
+                               "WHERE cache = ? AND key = ?", (self.name, key)).fetchone()
+        with self._lock:
+            if row is None:
+                self._entries.pop(key, None)
+                return None
+            entry = self._entries[key] = self._entry(*row)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def _persist(self, key, entry):
+        vector = entry["vector"].astype(np.float32).tobytes() if entry["vector"] is not None else None
+        with self._db() as conn:
+            conn.execute("INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (self.name, key, entry["question"], entry["answer"], vector,
+                          json.dumps(sorted(entry["tables"])), entry["created_at"], entry["cost"]))
+
+    def _forget(self, keys):
+        if self.path and keys:
+            with self._db() as conn:
+                conn.executemany("DELETE FROM response_cache WHERE cache = ? AND key = ?",
+                                 [(self.name, key) for key in keys])
+
+    # --- LOOKUP ---
+
+    def _embed(self, question):
+        from tool_registry import get_embedding_model
+        vector = np.asarray(get_embedding_model().embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry, now):
+        return now - entry["created_at"] > self.ttl
+
+    def lookup(self, question):
+        """Returns (answer or None, embedding). Pass the embedding back to `store` to avoid encoding twice."""
+        if not RESPONSE_CACHE_ENABLED:
+            return None, None
+        key, now = normalize(question), time.time()
+        self._sync()
+        entry = self._stored(key) if self.path else self._entries.get(key)
+        with self._lock:
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.seconds_saved += entry["cost"]
+                return entry["answer"], entry["vector"]
+        if not self.semantic:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        vector = self._embed(question)
+        question_literals = literals(question)
+        with self._lock:
+            best_key, best_score = None, self.threshold
+            for other_key, entry in self._entries.items():
+                if entry["vector"] is None or self._expired(entry, now) or entry["literals"] != question_literals:
+                    continue
+                score = float(np.dot(vector, entry["vector"]))
+                if score >= best_score:
+                    best_key, best_score = other_key, score
+            if best_key is None:
+                self.misses += 1
+                return None, vector
+        entry = self._stored(best_key) if self.path else self._entries[best_key]
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None, vector
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            self.seconds_saved += entry["cost"]
+            return entry["answer"], vector
+
+    def store(self, question, answer, tables=(), cost=0.0, vector=None):
+        if not RESPONSE_CACHE_ENABLED:
+            return
+        key = normalize(question)
+        entry = {"question": str(question), "answer": answer, "tables": {t.lower() for t in tables},
+                 "vector": vector, "literals": literals(question), "created_at": time.time(), "cost": cost}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            if self.path:
+                self._persist(key, entry)
+                self._forget(evicted)
+
+    # --- INVALIDATION ---
+
+    def invalidate_tables(self, tables):
+        """Drops every answer that was computed from any of `tables`, including the ones other workers stored."""
+        tables = {t.lower() for t in tables}
+        with self._lock:
+            stale = {key for key, entry in self._entries.items() if entry["tables"] & tables}
+            if self.path and tables:
+                stale.update(self._forget_tables(tables))
+            for key in stale:
+                self._entries.pop(key, None)
+            self.invalidated += len(stale)
+        return len(stale)
+
+    def _forget_tables(self, tables):
+        # Matched in the file, not in memory: memory only holds what this worker has seen
+        placeholders = ", ".join("?" * len(tables))
+        where = (f"cache = ? AND EXISTS (SELECT 1 FROM json_each(response_cache.tables) "
+                 f"WHERE value IN ({placeholders}))")
+        params = (self.name, *sorted(tables))
+        with self._db() as conn:
+            keys = [key for (key,) in conn.execute(f"SELECT key FROM response_cache WHERE {where}", params)]
+            conn.execute(f"DELETE FROM response_cache WHERE {where}", params)
+        return keys
+
+    def clear(self):
+        with self._lock:
+            stale = set(self._entries)
+            self._entries.clear()
+            if self.path:
+                with self._db() as conn:
+                    stale.update(key for (key,) in conn.execute("SELECT key FROM response_cache WHERE cache = ?",
+                                                                (self.name,)))
+                    conn.execute("DELETE FROM response_cache WHERE cache = ?", (self.name,))
+            self.invalidated += len(stale)
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+            "invalidated": self.invalidated,
+            # Sum of the original LLM/DB latency of every answer served from cache
+            "seconds_saved": round(self.seconds_saved, 3),
+        }
+
+
+# --- SHARED CACHES ---
+caches = {
+    "policy_and_course_retriever": ResponseCache("policy_and_course_retriever", ttl=RAG_CACHE_TTL),
+    "student_database_query": ResponseCache("student_database_query", ttl=SQL_CACHE_TTL),
+    "database_analyzer": ResponseCache("database_analyzer", ttl=SQL_CACHE_TTL),
+}
+
+
+def invalidate_tables(tables):
+    """Call after writing to `tables` (grades, timetable, ...) so no cache serves stale data."""
+    return sum(cache.invalidate_tables(tables) for cache in caches.values())
+
+
+def stats():
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -1,11 +1,26 @@
 # scheduler.py (Definitive and Final Version 2.0)
-import psycopg2
+import logging
+import os
 import random
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import time
+from dataclasses import replace
+from time import perf_counter
 
-# --- CONFIGURATION ---
-DB_CONNECTION_STRING = "dbname='university' user='postgres' password='password' host='localhost'"
+from sqlalchemy import inspect, text
+
+# Connections come from the shared pool in db_pool
+from db_pool import connection, run_query
+from schema_cache import schema_cache
+from response_cache import invalidate_tables
+from tool_registry import run_blocking
+from job_queue import report_progress
+from timetable_engine import Lecture, Room, TimetableEngine
+
+log = logging.getLogger(__name__)
 
+# --- CONFIGURATION ---
 TIME_SLOTS = [
     {'start': time(9, 0), 'end': time(10, 30)},
     {'start': time(10, 30), 'end': time(12, 0)},
@@ -14,114 +29,525 @@ TIME_SLOTS = [
     {'start': time(15, 0), 'end': time(16, 30)},
 ]
 DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+LECTURES_PER_COURSE = 2
+# Same seed + same data = same timetable
+SCHEDULER_SEED = int(os.getenv("SCHEDULER_SEED", "42"))
+# Processes used by batch scheduling (0 = one per CPU)
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "0"))
+
+
+def slot_to_time(slot):
+    """Engine slot index -> (day, start, end)."""
+    period = TIME_SLOTS[slot % len(TIME_SLOTS)]
+    return DAYS_OF_WEEK[slot // len(TIME_SLOTS)], period['start'], period['end']
+
+
+def fetch_rooms(conn):
+    """All rooms, with their capacity when the rooms table has one."""
+    columns = {c["name"] for c in inspect(conn).get_columns("rooms")}
+    if "capacity" in columns:
+        rows = run_query("SELECT room_id, capacity FROM rooms ORDER BY room_id;", fetch="all", conn=conn)
+        return [Room(room_id, capacity or 0) for room_id, capacity in rows]
+    return [Room(r[0]) for r in run_query("SELECT room_id FROM rooms ORDER BY room_id;", fetch="all", conn=conn)]
+
+
+def fetch_department(conn, department_name):
+    """Courses, teachers and (student_id, course_id) enrollments of one department."""
+    params = {"department_name": department_name}
+    department = "(SELECT department_id FROM departments WHERE name = :department_name)"
+    courses = [c[0] for c in run_query(f"SELECT course_id FROM courses WHERE department_id = {department} ORDER BY course_id;", params, fetch="all", conn=conn)]
+    teachers = [t[0] for t in run_query(f"SELECT teacher_id FROM teachers WHERE department_id = {department} ORDER BY teacher_id;", params, fetch="all", conn=conn)]
+    enrollments = run_query(f"SELECT e.student_id, e.course_id FROM enrollments e JOIN courses c ON e.course_id = c.course_id WHERE c.department_id = {department};", params, fetch="all", conn=conn)
+    return courses, teachers, [tuple(e) for e in enrollments]
+
+
+def course_cohorts(courses, enrollments):
+    """({course_id: cohort ids}, {course_id: enrolled students}) derived from enrollments.
+
+    Students taking exactly the same set of courses form one cohort; a lecture
+    belongs to every cohort that takes its course, so no student has a clash.
+    Without enrollment data the whole department is one cohort (the old behaviour).
+    """
+    courses_of_student = {}
+    for student_id, course_id in enrollments:
+        courses_of_student.setdefault(student_id, set()).add(course_id)
+    course_size = {}
+    for taken in courses_of_student.values():
+        for course_id in taken:
+            course_size[course_id] = course_size.get(course_id, 0) + 1
+
+    cohorts = {course_id: [] for course_id in courses}
+    if courses_of_student:
+        # A student with a single course cannot clash with anything
+        groups = sorted({tuple(sorted(taken)) for taken in courses_of_student.values() if len(taken) > 1})
+        for index, group in enumerate(groups):
+            for course_id in group:
+                if course_id in cohorts:
+                    cohorts[course_id].append(f"group{index}")
+    else:
+        cohorts = {course_id: ["department"] for course_id in courses}
+    return {course_id: tuple(c) for course_id, c in cohorts.items()}, course_size
+
+
+def build_lectures(courses, teachers, enrollments, seed=SCHEDULER_SEED):
+    """Turns a department's courses into engine lectures.
+
+    Teachers are dealt out round-robin (in a seeded order) so no one is overloaded;
+    cohorts and sizes come from `course_cohorts`.
+    """
+    rng = random.Random(seed)
+    dealt = list(teachers)
+    rng.shuffle(dealt)
+    course_teacher_map = {course_id: dealt[i % len(dealt)] for i, course_id in enumerate(courses)}
+    cohorts, course_size = course_cohorts(courses, enrollments)
+
+    lectures = []
+    for course_id in courses:
+        for _ in range(LECTURES_PER_COURSE):
+            lectures.append(Lecture(len(lectures), course_id, course_teacher_map[course_id],
+                                    cohorts[course_id], course_size.get(course_id, 0)))
+    return lectures
+
+
+def _as_time(value):
+    # TIME columns come back as datetime.time from Postgres but as text from SQLite
+    return time.fromisoformat(value) if isinstance(value, str) else value
+
+
+def normalize_day(day):
+    """'monday ', 'Mon' -> 'Monday'; None if `day` is not a weekday of the grid."""
+    # Stored day_of_week values come back space-padded
+    day = str(day or "").strip().lower()
+    if len(day) < 3:
+        return None
+    return next((name for name in DAYS_OF_WEEK if name.lower().startswith(day)), None)
+
+
+def time_to_slot(day, start_time):
+    """(day, start) of a stored timetable row -> engine slot index, or None if it is off the grid."""
+    day = normalize_day(day)
+    start_time = _as_time(start_time)
+    starts = [period['start'] for period in TIME_SLOTS]
+    if day is None or start_time not in starts:
+        return None
+    return DAYS_OF_WEEK.index(day) * len(TIME_SLOTS) + starts.index(start_time)
+
+
+def fetch_shared_students(conn):
+    """{student_id: {course_ids}} of the students enrolled in courses of more than one department."""
+    rows = run_query("SELECT e.student_id, e.course_id, c.department_id FROM enrollments e "
+                     "JOIN courses c ON e.course_id = c.course_id;", fetch="all", conn=conn)
+    courses, departments = {}, {}
+    for student_id, course_id, department_id in rows:
+        courses.setdefault(student_id, set()).add(course_id)
+        departments.setdefault(student_id, set()).add(department_id)
+    return {student_id: taken for student_id, taken in courses.items() if len(departments[student_id]) > 1}
+
+
+def fetch_booked_courses(conn, semester_id, exclude_courses=()):
+    """{course_id: {slots}} of the lectures already scheduled this semester outside `exclude_courses`."""
+    exclude_courses = set(exclude_courses)
+    rows = run_query("SELECT course_id, day_of_week, start_time FROM timetable WHERE semester_id = :semester_id;",
+                     {"semester_id": semester_id}, fetch="all", conn=conn)
+    booked = {}
+    for course_id, day, start_time in rows:
+        slot = time_to_slot(day, start_time)
+        if course_id not in exclude_courses and slot is not None:
+            booked.setdefault(course_id, set()).add(slot)
+    return booked
+
+
+def fetch_booked_rooms(conn, semester_id, exclude_courses=()):
+    """{room_id: {slots}} already used this semester by courses outside `exclude_courses`."""
+    exclude_courses = set(exclude_courses)
+    rows = run_query("SELECT course_id, room_id, day_of_week, start_time FROM timetable WHERE semester_id = :semester_id;",
+                     {"semester_id": semester_id}, fetch="all", conn=conn)
+    booked = {}
+    for course_id, room_id, day, start_time in rows:
+        slot = time_to_slot(day, start_time)
+        if course_id not in exclude_courses and slot is not None:
+            booked.setdefault(room_id, set()).add(slot)
+    return booked
+
+
+def plan_department(courses, teachers, enrollments, rooms, booked=None, seed=SCHEDULER_SEED, blocked_courses=None):
+    """Solves one department against the rooms left free by `booked`, keeping each course of
+    `blocked_courses` ({course_id: slots}) out of its slots.
+
+    Pure function of its arguments (no database access), so it can run in a worker process.
+    Returns (rows, unplaced) where rows are dicts with course_id, teacher_id, room_id, slot and size.
+    """
+    lectures = build_lectures(courses, teachers, enrollments, seed=seed)
+    engine = TimetableEngine(len(DAYS_OF_WEEK), len(TIME_SLOTS), rooms, seed=seed)
+    for room_id, slots in (booked or {}).items():
+        engine.block_room(room_id, slots)
+    if blocked_courses:
+        # A course-wide cohort carries the block (a course's lectures never share a slot anyway)
+        lectures = [replace(lecture, cohort_ids=lecture.cohort_ids + (f"course{lecture.course_id}",))
+                    if lecture.course_id in blocked_courses else lecture for lecture in lectures]
+        for course_id, slots in blocked_courses.items():
+            engine.block_cohort(f"course{course_id}", slots)
+    result = engine.solve(lectures)
+
+    rows = []
+    for lecture in lectures:
+        if lecture.lecture_id in result.placements:
+            slot, room_id = result.placements[lecture.lecture_id]
+            rows.append({'course_id': lecture.course_id, 'teacher_id': lecture.teacher_id,
+                         'room_id': room_id, 'slot': slot, 'size': lecture.size})
+    return rows, [lecture.course_id for lecture in result.unplaced]
+
+
+def department_seed(seed, department_name):
+    """Per-department seed: stable across runs, but departments stop preferring the same slots (and so the same rooms)."""
+    return seed + zlib.crc32(department_name.encode())
+
+
+def _plan_task(task):
+    return plan_department(*task)
+
 
-def get_db_connection():
-    # This helper function remains the same
-    conn = psycopg2.connect(DB_CONNECTION_STRING)
-    return conn
-
-def run_query(query, params=None, fetch=None, conn=None):
-    # This helper function remains the same
-    close_conn = False
-    if conn is None:
-        conn = get_db_connection()
-        close_conn = True
-    
-    cur = conn.cursor()
-    cur.execute(query, params or ())
-    result = None
-    if fetch == "all": result = cur.fetchall()
-    elif fetch == "one": result = cur.fetchone()
-    conn.commit()
-    cur.close()
-    if close_conn:
-        conn.close()
-    return result
-
-def generate_schedule_logic(semester_name: str, department_name: str) -> str:
-    """Generates a truly clash-free timetable using a simple assignment model."""
-    print(f"--- Running DEFINITIVE Scheduling Logic v2.0 for {semester_name} ---")
-
-    conn = get_db_connection()
+def reconcile_rooms(plans, tasks, rooms, booked, shared_students=None, booked_courses=None):
+    """Makes independently solved departments agree on rooms and on the students they share.
+
+    Departments are solved without seeing each other, so plans are accepted in order:
+    a lecture whose room was already taken in its slot moves to another free room that
+    fits, and a lecture in a slot where one of its students (`shared_students`, enrolled
+    in courses of several departments) already has a lecture of an accepted department,
+    or of `booked_courses` outside the batch, is a clash. A department with a clash is
+    solved again against the rooms that are still free, with those slots blocked for the
+    courses concerned.
+    Returns the number of lectures that changed room and the departments that were re-solved.
+    """
+    by_size = sorted(rooms, key=lambda r: (r.capacity <= 0, r.capacity, r.room_id))
+    used = {}
+    for room_id, slots in booked.items():
+        for slot in slots:
+            used.setdefault(slot, set()).add(room_id)
+    students_of_course = {}
+    for student_id, courses in (shared_students or {}).items():
+        for course_id in courses:
+            students_of_course.setdefault(course_id, []).append(student_id)
+    student_slots = {}
+
+    def attend(course_id, slots):
+        for student_id in students_of_course.get(course_id, ()):
+            student_slots.setdefault(student_id, set()).update(slots)
+
+    for course_id, slots in (booked_courses or {}).items():
+        attend(course_id, slots)
+
+    moved, resolved = 0, []
+    for name in plans:
+        rows, unplaced = plans[name]
+        blocked = {}
+        for course_id in tasks[name][0]:
+            slots = set().union(*(student_slots.get(s, ()) for s in students_of_course.get(course_id, ())))
+            if slots:
+                blocked[course_id] = slots
+        taken = {slot: set(room_ids) for slot, room_ids in used.items()}
+        changes = 0
+        clash = any(row['slot'] in blocked.get(row['course_id'], ()) for row in rows)
+        for row in [] if clash else rows:
+            busy = taken.setdefault(row['slot'], set())
+            if row['room_id'] in busy:
+                spare = next((r.room_id for r in by_size if r.room_id not in busy
+                              and (r.capacity <= 0 or row['size'] <= r.capacity)), None)
+                if spare is None:
+                    clash = True
+                    break
+                row['room_id'] = spare
+                changes += 1
+            busy.add(row['room_id'])
+        if clash:
+            remaining = {}
+            for slot, room_ids in used.items():
+                for room_id in room_ids:
+                    remaining.setdefault(room_id, set()).add(slot)
+            rows, unplaced = plan_department(*tasks[name][:4], remaining, tasks[name][5], blocked)
+            plans[name] = (rows, unplaced)
+            resolved.append(name)
+            taken = {slot: set(room_ids) for slot, room_ids in used.items()}
+            for row in rows:
+                taken.setdefault(row['slot'], set()).add(row['room_id'])
+        else:
+            moved += changes
+        used = taken
+        for row in rows:
+            attend(row['course_id'], [row['slot']])
+    return moved, resolved
+
+
+def generate_schedule_batch(semester_name: str, department_names=None, workers: int = None, seed: int = None) -> str:
+    """Schedules many departments (all of them by default) for a semester in one run.
+
+    Departments are solved in parallel on a process pool, rooms and students enrolled in
+    several departments are then reconciled across departments, and the whole semester
+    is written in a single transaction.
+    Rows of departments outside the batch are kept, and their rooms are treated as booked.
+    """
+    report = _schedule(semester_name, department_names, workers, seed)
+    if isinstance(report, str):
+        return report
+    lines = [f"Scheduled {len(report['departments'])} department(s) for {semester_name}: "
+             f"{report['saved']} clash-free lectures saved in {report['seconds']:.2f}s."]
+    for name, (rows, unplaced) in report['departments'].items():
+        line = f"- {name}: {len(rows)} lectures"
+        if unplaced:
+            line += f", {len(unplaced)} could not be placed (course IDs: {', '.join(map(str, sorted(set(unplaced))))})"
+        lines.append(line)
+    if report['skipped']:
+        lines.append(f"Skipped (no courses or teachers): {', '.join(report['skipped'])}")
+    return "\n".join(lines)
+
+
+def generate_schedule_logic(semester_name: str, department_name: str, seed: int = None) -> str:
+    """Generates a clash-free timetable (teachers, student cohorts, room capacity) for one department."""
+    report = _schedule(semester_name, [department_name], workers=1, seed=seed)
+    if isinstance(report, str):
+        return report
+    if not report['departments']:
+        return "Error: Could not fetch necessary data."
+    rows, unplaced = report['departments'][department_name]
+    message = f"Successfully generated and saved {len(rows)} clash-free lectures to the timetable."
+    if unplaced:
+        message += (f" {len(unplaced)} lecture(s) could not be placed without a clash"
+                    f" (course IDs: {', '.join(map(str, sorted(set(unplaced))))}).")
+    return message
+
+
+def _schedule(semester_name, department_names, workers, seed):
+    log.info("Running constraint-based scheduling for %s, %s", semester_name, department_names or "all departments")
+    start = perf_counter()
+    seed = SCHEDULER_SEED if seed is None else seed
+
+    # Fetch data (one pooled connection for every department)
+    report_progress(0.05, "Loading courses, teachers, enrollments and rooms")
+    with connection() as conn:
+        semester = run_query("SELECT semester_id FROM semesters WHERE name = :semester_name;", {"semester_name": semester_name}, fetch="one", conn=conn)
+        semester_id = semester[0] if semester else None
+        rooms = fetch_rooms(conn)
+        if department_names is None:
+            department_names = [d[0] for d in run_query("SELECT name FROM departments ORDER BY name;", fetch="all", conn=conn)]
+        tasks, skipped = {}, []
+        for name in department_names:
+            courses, teachers, enrollments = fetch_department(conn, name)
+            if courses and teachers:
+                tasks[name] = (courses, teachers, enrollments, rooms, None, department_seed(seed, name))
+            else:
+                skipped.append(name)
+        if not all([rooms, semester_id]):
+            return "Error: Could not fetch necessary data."
+        batch_courses = {c for task in tasks.values() for c in task[0]}
+        booked = fetch_booked_rooms(conn, semester_id, exclude_courses=batch_courses)
+        shared_students = fetch_shared_students(conn)
+        booked_courses = fetch_booked_courses(conn, semester_id, exclude_courses=batch_courses) if shared_students else {}
+
+    # Solve. Departments are solved independently; the rooms and the students they
+    # share are reconciled afterwards.
+    for name in tasks:
+        tasks[name] = tasks[name][:4] + (booked, tasks[name][5])
+    workers = workers or SCHEDULER_WORKERS or os.cpu_count() or 1
+    def solved(results):
+        # Solving is most of the work: it covers progress from 10% to 90%
+        plans = {}
+        for name, plan in zip(tasks, results):
+            plans[name] = plan
+            report_progress(0.1 + 0.8 * len(plans) / len(tasks), f"Scheduled {name} ({len(plans)}/{len(tasks)})")
+        return plans
+
+    report_progress(0.1, f"Solving {len(tasks)} department(s)")
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            plans = solved(pool.map(_plan_task, tasks.values()))
+    else:
+        plans = solved(plan_department(*task) for task in tasks.values())
+    moved, resolved = reconcile_rooms(plans, tasks, rooms, booked, shared_students, booked_courses)
+    if moved or resolved:
+        log.info("Room reconciliation: %d lecture(s) changed room, re-solved: %s", moved, resolved or "none")
+
+    final_timetable = []
+    for rows, _ in plans.values():
+        for row in rows:
+            day, start_time, end_time = slot_to_time(row['slot'])
+            final_timetable.append({'course_id': row['course_id'], 'teacher_id': row['teacher_id'], 'room_id': row['room_id'],
+                                    'semester_id': semester_id, 'day_of_week': day, 'start_time': start_time, 'end_time': end_time})
+
+    # One transaction per semester: the batch's old rows are only replaced if every insert succeeds.
+    if tasks:
+        report_progress(0.9, f"Saving {len(final_timetable)} lectures")
+        with connection() as conn:
+            # Clear only the scheduled departments' rows; other departments keep their timetable
+            delete_query = "DELETE FROM timetable WHERE semester_id = :semester_id AND course_id IN (SELECT course_id FROM courses WHERE department_id = (SELECT department_id FROM departments WHERE name = :department_name));"
+            conn.execute(text(delete_query), [{"semester_id": semester_id, "department_name": name} for name in tasks])
+
+            # Bulk insert all scheduled classes at the end
+            if final_timetable:
+                insert_query = "INSERT INTO timetable (course_id, teacher_id, room_id, semester_id, day_of_week, start_time, end_time) VALUES (:course_id, :teacher_id, :room_id, :semester_id, :day_of_week, :start_time, :end_time)"
+                # A list of parameter sets is sent as batched multi-row INSERTs by SQLAlchemy
+                conn.execute(text(insert_query), final_timetable)
+
+        # The cached schema text embeds sample timetable rows, and cached answers may quote the timetable
+        schema_cache.invalidate()
+        invalidate_tables(["timetable"])
+
+    return {"departments": plans, "skipped": skipped, "saved": len(final_timetable), "seconds": perf_counter() - start}
+
+
+def slots_of(day, start_time=None):
+    """Engine slots of a blocked period: every slot running at `start_time`, or the whole day when it is empty.
+
+    Raises ValueError for a day or time that is not on the grid.
+    """
+    name = normalize_day(day)
+    if name is None:
+        raise ValueError(f"'{day}' is not a weekday ({', '.join(DAYS_OF_WEEK)})")
+    first = DAYS_OF_WEEK.index(name) * len(TIME_SLOTS)
+    if start_time is None or str(start_time).strip() == "":
+        return list(range(first, first + len(TIME_SLOTS)))
+    try:
+        at = _as_time(start_time.strip() if isinstance(start_time, str) else start_time)
+    except ValueError:
+        at = None
+    if not isinstance(at, time):
+        raise ValueError(f"'{start_time}' is not a time of day (HH:MM)")
+    slots = [first + index for index, period in enumerate(TIME_SLOTS) if period['start'] <= at < period['end']]
+    if not slots:
+        raise ValueError(f"{at:%H:%M} is outside the lecture hours "
+                         f"({TIME_SLOTS[0]['start']:%H:%M}-{TIME_SLOTS[-1]['end']:%H:%M})")
+    return slots
+
+
+def replan_schedule(semester_name: str, department_name: str, added_courses=(), removed_courses=(),
+                    blocked_teachers=(), blocked_rooms=(), seed: int = None) -> str:
+    """Applies a change set to a department's existing timetable, moving as few lectures as possible.
+
+    - added_courses: course IDs to schedule (courses that lost one of their lectures are completed too)
+    - removed_courses: course IDs whose lectures are dropped
+    - blocked_teachers / blocked_rooms: (id, day, start_time) periods that became unavailable;
+      every lecture slot running at start_time is blocked, and a start_time of None the whole day
+    Existing lectures stay where they are unless they now clash or are needed to make room.
+    Only rows that differ are written (DELETE / UPDATE / INSERT on course, semester, day and start time).
+    """
+    log.info("Re-planning timetable for %s, %s", semester_name, department_name)
+    start = perf_counter()
+    seed = SCHEDULER_SEED if seed is None else seed
+    added, removed = set(added_courses), set(removed_courses)
+    # Checked before touching the database, so a typo is reported instead of silently blocking nothing
     try:
-        # Fetch data
-        courses = run_query("SELECT course_id FROM courses WHERE department_id = (SELECT department_id FROM departments WHERE name = %s);", (department_name,), fetch="all", conn=conn)
-        teachers = [t[0] for t in run_query("SELECT teacher_id FROM teachers WHERE department_id = (SELECT department_id FROM departments WHERE name = %s);", (department_name,), fetch="all", conn=conn)]
-        rooms = [r[0] for r in run_query("SELECT room_id FROM rooms;", fetch="all", conn=conn)]
-        semester_id = run_query("SELECT semester_id FROM semesters WHERE name = %s;", (semester_name,), fetch="one", conn=conn)[0]
+        teacher_blocks = [(teacher_id, slots_of(day, start_time)) for teacher_id, day, start_time in blocked_teachers]
+        room_blocks = [(room_id, slots_of(day, start_time)) for room_id, day, start_time in blocked_rooms]
+    except ValueError as e:
+        return f"Error: Could not read an unavailable period: {e}."
 
+    with connection() as conn:
+        semester = run_query("SELECT semester_id FROM semesters WHERE name = :semester_name;", {"semester_name": semester_name}, fetch="one", conn=conn)
+        semester_id = semester[0] if semester else None
+        courses, teachers, enrollments = fetch_department(conn, department_name)
+        rooms = fetch_rooms(conn)
         if not all([courses, teachers, rooms, semester_id]):
             return "Error: Could not fetch necessary data."
+        existing = run_query("SELECT course_id, teacher_id, room_id, day_of_week, start_time FROM timetable WHERE semester_id = :semester_id AND course_id IN (SELECT course_id FROM courses WHERE department_id = (SELECT department_id FROM departments WHERE name = :department_name));",
+                             {"semester_id": semester_id, "department_name": department_name}, fetch="all", conn=conn)
+        booked = fetch_booked_rooms(conn, semester_id, exclude_courses=courses)
+
+        engine = TimetableEngine(len(DAYS_OF_WEEK), len(TIME_SLOTS), rooms, seed=department_seed(seed, department_name))
+        for room_id, slots in booked.items():
+            engine.block_room(room_id, slots)
+        for teacher_id, slots in teacher_blocks:
+            engine.block_teacher(teacher_id, slots)
+        for room_id, slots in room_blocks:
+            engine.block_room(room_id, slots)
+
+        # Keep every existing lecture that is still valid where it is (movable, so repair can still shift it)
+        cohorts, course_size = course_cohorts(courses, enrollments)
+        old_rows, lectures, displaced = {}, [], []
+        lectures_of_course, teacher_of_course = {}, {}
+        for course_id, teacher_id, room_id, raw_day, raw_start in existing:
+            # Keyed like new_rows; the stored values are kept to match the row in the WHERE clause
+            day, start_time = normalize_day(raw_day), _as_time(raw_start)
+            old_rows[(course_id, day, start_time)] = (teacher_id, room_id, raw_day, raw_start)
+            if course_id in removed or course_id not in cohorts:
+                continue
+            lecture = Lecture(len(lectures), course_id, teacher_id, cohorts[course_id], course_size.get(course_id, 0))
+            lectures.append(lecture)
+            lectures_of_course[course_id] = lectures_of_course.get(course_id, 0) + 1
+            teacher_of_course.setdefault(course_id, teacher_id)
+            slot = time_to_slot(day, start_time)
+            if slot is not None and engine.is_free(lecture, slot, room_id):
+                engine.pin(lecture, slot, room_id)
+            else:
+                displaced.append(lecture)
+
+        # New lectures: added courses and courses missing lectures, taught by their current
+        # teacher or else by the department's least-loaded teacher
+        unknown = sorted(added - set(courses))
+        teacher_load = {teacher_id: 0 for teacher_id in teachers}
+        for teacher_id in teacher_of_course.values():
+            teacher_load[teacher_id] = teacher_load.get(teacher_id, 0) + 1
+        new_lectures = []
+        for course_id in courses:
+            missing = LECTURES_PER_COURSE - lectures_of_course.get(course_id, 0)
+            # Courses without any lecture are only scheduled when asked, so a removed course stays removed
+            if course_id in removed or missing <= 0 or (course_id not in lectures_of_course and course_id not in added):
+                continue
+            if course_id not in teacher_of_course:
+                teacher_of_course[course_id] = min(teachers, key=lambda t: (teacher_load[t], t))
+                teacher_load[teacher_of_course[course_id]] += 1
+            for _ in range(missing):
+                lecture = Lecture(len(lectures), course_id, teacher_of_course[course_id], cohorts[course_id], course_size.get(course_id, 0))
+                lectures.append(lecture)
+                new_lectures.append(lecture)
+
+        result = engine.solve(displaced + new_lectures)
+
+        new_rows = {}
+        for lecture in lectures:
+            if lecture.lecture_id in result.placements:
+                slot, room_id = result.placements[lecture.lecture_id]
+                day, start_time, end_time = slot_to_time(slot)
+                new_rows[(lecture.course_id, day, start_time)] = (lecture.teacher_id, room_id, end_time)
+
+        # Diff against what is stored and write only the difference
+        def key_params(key):
+            _, _, raw_day, raw_start = old_rows[key]
+            return {"semester_id": semester_id, "course_id": key[0], "day_of_week": raw_day, "start_time": raw_start}
+
+        deletes = [key_params(key) for key in old_rows if key not in new_rows]
+        updates = [dict(key_params(key), teacher_id=new[0], room_id=new[1])
+                   for key, new in new_rows.items() if key in old_rows and old_rows[key][:2] != new[:2]]
+        inserts = [{'course_id': key[0], 'teacher_id': new[0], 'room_id': new[1], 'semester_id': semester_id,
+                    'day_of_week': key[1], 'start_time': key[2], 'end_time': new[2]}
+                   for key, new in new_rows.items() if key not in old_rows]
+        where = "semester_id = :semester_id AND course_id = :course_id AND day_of_week = :day_of_week AND start_time = :start_time"
+        if deletes:
+            conn.execute(text(f"DELETE FROM timetable WHERE {where}"), deletes)
+        if updates:
+            conn.execute(text(f"UPDATE timetable SET teacher_id = :teacher_id, room_id = :room_id WHERE {where}"), updates)
+        if inserts:
+            insert_query = "INSERT INTO timetable (course_id, teacher_id, room_id, semester_id, day_of_week, start_time, end_time) VALUES (:course_id, :teacher_id, :room_id, :semester_id, :day_of_week, :start_time, :end_time)"
+            conn.execute(text(insert_query), inserts)
+
+    if deletes or updates or inserts:
+        schema_cache.invalidate()
+        invalidate_tables(["timetable"])
+
+    def placed(group):
+        return sum(1 for lecture in group if lecture.lecture_id in result.placements)
+
+    message = (f"Re-planned {department_name} for {semester_name} in {perf_counter() - start:.2f}s: "
+               f"{placed(new_lectures)} new lecture(s) placed, {placed(displaced) + len(result.moved)} existing lecture(s) moved. "
+               f"Rows written: {len(deletes)} deleted, {len(updates)} updated, {len(inserts)} inserted.")
+    if result.unplaced:
+        missing = sorted({lecture.course_id for lecture in result.unplaced})
+        message += (f" {len(result.unplaced)} lecture(s) could not be placed without a clash"
+                    f" (course IDs: {', '.join(map(str, missing))}).")
+    if unknown:
+        message += f" Ignored course IDs that are not in {department_name}: {', '.join(map(str, unknown))}."
+    return message
+
 
-        # --- THE NEW FOOLPROOF LOGIC ---
-
-        # 1. Assign a consistent teacher to each course
-        course_teacher_map = {course[0]: random.choice(teachers) for course in courses}
-
-        # 2. Create the full list of lectures to be scheduled (2 per course)
-        lectures_to_schedule = []
-        for course_id, in courses:
-            lectures_to_schedule.append({'course_id': course_id, 'teacher_id': course_teacher_map[course_id]})
-            lectures_to_schedule.append({'course_id': course_id, 'teacher_id': course_teacher_map[course_id]})
-        
-        random.shuffle(lectures_to_schedule)
-
-        # 3. Create a master list of all possible time/room slots and shuffle it
-        available_slots = []
-        for day in DAYS_OF_WEEK:
-            for slot in TIME_SLOTS:
-                for room_id in rooms:
-                    available_slots.append({'day': day, 'start': slot['start'], 'end': slot['end'], 'room_id': room_id})
-        random.shuffle(available_slots)
-
-        # 4. Use simple tracking dictionaries
-        teacher_bookings = {} # {(day, start_time): [list of busy teachers]}
-        student_group_bookings = {} # {(day, start_time): True} - Simplified to one main group
-
-        # Clear existing timetable
-        run_query("DELETE FROM timetable WHERE semester_id = %s;", (semester_id,), conn=conn)
-
-        scheduled_count = 0
-        final_timetable = []
-
-        # 5. Assign each lecture to the first truly available slot
-        for lecture in lectures_to_schedule:
-            slot_found = False
-            for i, slot in enumerate(available_slots):
-                day, start_time, room_id = slot['day'], slot['start'], slot['room_id']
-                teacher_id = lecture['teacher_id']
-
-                # Check for clashes
-                is_teacher_busy = teacher_id in teacher_bookings.get((day, start_time), [])
-                is_student_group_busy = (day, start_time) in student_group_bookings
-                
-                if not is_teacher_busy and not is_student_group_busy:
-                    # If the slot is free, book it!
-                    final_timetable.append((lecture['course_id'], teacher_id, room_id, semester_id, day, start_time, slot['end']))
-                    
-                    # Mark as booked
-                    teacher_bookings.setdefault((day, start_time), []).append(teacher_id)
-                    student_group_bookings[(day, start_time)] = True
-                    
-                    # Remove the used slot from the pool
-                    available_slots.pop(i)
-                    slot_found = True
-                    break # Move to the next lecture
-            
-            if slot_found:
-                scheduled_count += 1
-        
-        # 6. Bulk insert all scheduled classes at the end
-        if final_timetable:
-            cur = conn.cursor()
-            insert_query = "INSERT INTO timetable (course_id, teacher_id, room_id, semester_id, day_of_week, start_time, end_time) VALUES %s"
-            # Use execute_values for efficient bulk insert
-            from psycopg2.extras import execute_values
-            execute_values(cur, insert_query, final_timetable)
-            conn.commit()
-            cur.close()
-
-        return f"Successfully generated and saved {scheduled_count} clash-free lectures to the timetable."
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+async def areplan_schedule(semester_name: str, department_name: str, added_courses=(), removed_courses=(),
+                           blocked_teachers=(), blocked_rooms=()) -> str:
+    return await run_blocking(replan_schedule, semester_name, department_name, added_courses, removed_courses,
+                              blocked_teachers, blocked_rooms)
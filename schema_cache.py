@@ -0,0 +1,164 @@
+# schema_cache.py (Cached schema introspection for the SQL-generating tools)
+
+import os
+import re
+import threading
+import time
+from collections import deque
+
+# --- CONFIGURATION ---
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "600"))         # seconds a snapshot stays fresh
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "1") not in ("0", "false", "False")
+
+# Words people use for a table without naming it
+TABLE_SYNONYMS = {
+    "teachers": ["teacher", "professor", "prof", "lecturer", "instructor", "faculty", "hod", "head"],
+    "students": ["student", "pupil", "learner"],
+    "departments": ["department", "dept", "hod", "head"],
+    "courses": ["course", "subject", "class", "classes"],
+    "enrollments": ["enrollment", "enrolment", "enrolled", "enrolledin", "registered"],
+    "grades": ["grade", "gpa", "result", "results", "marks", "score"],
+    "timetable": ["timetable", "schedule", "lecture", "lectures", "slot"],
+    "rooms": ["room", "location", "venue", "hall"],
+    "semesters": ["semester", "term", "fall", "spring", "summer"],
+}
+
+# Column names too generic to say anything about which table a question needs
+GENERIC_COLUMNS = {"id", "name", "first_name", "last_name", "created_at", "updated_at"}
+
+
+def _words(text):
+    return set(re.findall(r"[a-z0-9_]+", text.lower()))
+
+
+class SchemaCache:
+    """Caches `SQLDatabase.get_table_info()` per table and serves it (optionally pruned) until the TTL expires."""
+
+    def __init__(self, ttl=SCHEMA_CACHE_TTL, prune=SCHEMA_PRUNING):
+        self.ttl = ttl
+        self.prune = prune
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._built_at = 0.0
+        self._build_seconds = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.full_chars = 0
+        self.served_chars = 0
+
+    # --- SNAPSHOT ---
+
+    def _build(self):
+        from sqlalchemy import inspect
+        from db_pool import get_engine
+        from tool_registry import get_sql_database
+
+        db = get_sql_database()
+        inspector = inspect(get_engine())
+        tables = sorted(db.get_usable_table_names())
+        info, columns, neighbours = {}, {}, {t: set() for t in tables}
+        for table in tables:
+            info[table] = db.get_table_info(table_names=[table])
+            columns[table] = {c["name"].lower() for c in inspector.get_columns(table)}
+            for fk in inspector.get_foreign_keys(table):
+                other = fk.get("referred_table")
+                if other in neighbours and other != table:
+                    neighbours[table].add(other)
+                    neighbours[other].add(table)
+        return {"tables": tables, "info": info, "columns": columns, "neighbours": neighbours}
+
+    def snapshot(self):
+        """Returns the current snapshot, rebuilding it if it is missing or older than the TTL."""
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._built_at < self.ttl:
+                self.hits += 1
+                return self._snapshot
+            self.misses += 1
+            start = time.perf_counter()
+            self._snapshot = self._build()
+            self._build_seconds = time.perf_counter() - start
+            self._built_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self, reflect=False):
+        """Drops the snapshot. Pass reflect=True after DDL so SQLDatabase re-reads the table list too."""
+        with self._lock:
+            self._snapshot = None
+            self.invalidations += 1
+        if reflect:
+            import tool_registry
+            tool_registry.reset("sql_database")
+
+    # --- PRUNING ---
+
+    def relevant_tables(self, question, snapshot):
+        """Tables named (directly, by synonym or by a distinctive column) in the question, plus join paths between them."""
+        words = _words(question)
+        if "@" in question:
+            words.add("email")  # an address in the question means an email column is needed
+        selected = set()
+        for table in snapshot["tables"]:
+            names = {table, table.rstrip("s")} | set(TABLE_SYNONYMS.get(table, []))
+            distinctive = snapshot["columns"][table] - GENERIC_COLUMNS
+            if words & names or words & distinctive:
+                selected.add(table)
+        if not selected:
+            return list(snapshot["tables"])
+
+        # Pull in the tables needed to JOIN the selected ones (e.g. students -> enrollments -> courses)
+        selected_list = sorted(selected)
+        for target in selected_list[1:]:
+            selected |= self._path(selected_list[0], target, snapshot["neighbours"])
+        return [t for t in snapshot["tables"] if t in selected]
+
+    @staticmethod
+    def _path(source, target, neighbours):
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            table = queue.popleft()
+            if table == target:
+                path = set()
+                while table is not None:
+                    path.add(table)
+                    table = previous[table]
+                return path
+            for other in sorted(neighbours.get(table, ())):
+                if other not in previous:
+                    previous[other] = table
+                    queue.append(other)
+        return {target}
+
+    # --- PUBLIC API ---
+
+    def get_table_info(self, question=None):
+        """Schema text for the prompt: every table, or only those relevant to `question` when pruning is on."""
+        snapshot = self.snapshot()
+        tables = snapshot["tables"]
+        if self.prune and question:
+            tables = self.relevant_tables(str(question), snapshot)
+        text = "\n\n".join(snapshot["info"][t] for t in tables)
+        with self._lock:
+            self.full_chars += sum(len(v) for v in snapshot["info"].values())
+            self.served_chars += len(text)
+        return text
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "ttl_seconds": self.ttl,
+            "last_build_seconds": round(self._build_seconds, 4),
+            # Every hit skips one full reflection + sample-row pass
+            "seconds_saved": round(self.hits * self._build_seconds, 3),
+            "seconds_saved_per_question": round(self.hits * self._build_seconds / lookups, 4) if lookups else 0.0,
+            "prompt_chars_pruned": self.full_chars - self.served_chars,
+        }
+
+
+# Shared by the SQL and analytics tools (and invalidated by the scheduler)
+schema_cache = SchemaCache()
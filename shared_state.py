@@ -0,0 +1,68 @@
+# shared_state.py (What several API worker processes on one machine share)
+#
+# With WEB_CONCURRENCY > 1 (gunicorn.conf.py) every worker imports the app on its
+# own, so anything kept in process memory is per worker. State that must be the
+# same for all of them lives in local SQLite files opened through `connect`:
+# session memory (MEMORY_DB_PATH), the response caches (RESPONSE_CACHE_PATH), the
+# query library (QUERY_LIBRARY_PATH), job status (JOB_STORE_PATH) and the
+# notification delivery log and send-rate bucket (NOTIFY_LOG_PATH). The embedding
+# model is shared by running it once in embedding_server.py (EMBEDDING_SERVICE_URL).
+# Housekeeping that must run once per machine (pruning checkpoints, refreshing the
+# analytics rollups) runs only in the worker holding the leader lock.
+
+import logging
+import os
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", "./uniautomate.leader.lock")
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))  # seconds a writer waits for another process
+
+
+def connect(path, **kwargs):
+    """A SQLite connection that other processes can read and write at the same time (WAL journal)."""
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, **kwargs)
+    if path != ":memory:":
+        # Readers never block the writer and vice versa; the setting is stored in the file
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class LeaderLock:
+    """An exclusive, non-blocking file lock: held by one process per machine until it exits.
+
+    Without fcntl (Windows) every process is the leader, which is right for the single-process setup used there.
+    """
+
+    def __init__(self, path=LEADER_LOCK_PATH):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        try:
+            import fcntl
+        except ImportError:
+            return True
+        handle = open(self.path, "a+")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._file = handle
+        log.info("Process %s is the leader (%s)", os.getpid(), self.path)
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+leader = LeaderLock()
@@ -0,0 +1,272 @@
+# sql_executor.py (Guarded, streaming execution of generated SQL)
+#
+# Generated SQL used to go through `SQLDatabase.run`, which fetches every row
+# and stringifies all of them into the agent's prompt. Here a statement:
+#   - must be a single read-only SELECT/WITH and runs in a read-only
+#     transaction with a statement timeout (PostgreSQL),
+#   - is checked with EXPLAIN before running; plans costlier than SQL_MAX_COST
+#     are rejected so the agent can narrow the query,
+#   - is wrapped in a LIMIT of SQL_ROW_LIMIT + 1 rows and streamed through a
+#     server-side cursor, SQL_FETCH_SIZE rows at a time.
+# Small results come back exactly as before. Larger ones come back as a compact
+# summary (row count, per-column stats, the first SQL_PREVIEW_ROWS rows), and
+# the full result is written to a CSV artifact served by api_server at
+# /artifacts/{id} (as Parquet on request when pyarrow is installed).
+
+import csv
+import json
+import os
+import re
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from db_pool import async_connection, connection
+
+# --- CONFIGURATION ---
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "15000"))
+SQL_MAX_COST = float(os.getenv("SQL_MAX_COST", "5000000"))    # EXPLAIN total cost above which a query is rejected
+SQL_ROW_LIMIT = int(os.getenv("SQL_ROW_LIMIT", "100000"))     # rows read at most (and written to the artifact)
+SQL_PREVIEW_ROWS = int(os.getenv("SQL_PREVIEW_ROWS", "20"))   # rows shown to the agent
+SQL_FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "1000"))
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "./artifacts")
+ARTIFACT_TTL_SECONDS = float(os.getenv("ARTIFACT_TTL_SECONDS", "86400"))
+DISTINCT_CAP = 1000  # distinct values counted per column before reporting "1000+"
+
+_ARTIFACT_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class QueryRejected(ValueError):
+    """A statement the guardrails refuse to run; the message tells the agent how to fix it."""
+
+
+def is_read_only(sql):
+    return bool(re.match(r"^\s*(?:select|with)\b", sql, re.IGNORECASE)) and ";" not in sql
+
+
+def clean(sql):
+    return sql.strip().rstrip(";").strip()
+
+
+def with_limit(sql, limit=SQL_ROW_LIMIT):
+    """Caps the rows a statement can return, one more than `limit` so truncation can be detected."""
+    return f"SELECT * FROM ({clean(sql)}) AS limited_result LIMIT {int(limit) + 1}"
+
+
+def guard(sql):
+    sql = clean(sql)
+    if not is_read_only(sql):
+        raise QueryRejected("Only a single read-only SELECT (or WITH ... SELECT) statement can be run by this tool.")
+    return sql
+
+
+# --- ARTIFACTS ---
+
+def artifact_path(artifact_id, fmt="csv"):
+    if not _ARTIFACT_ID_RE.match(artifact_id or "") or fmt not in ("csv", "parquet"):
+        return None
+    return os.path.join(ARTIFACT_DIR, f"{artifact_id}.{fmt}")
+
+
+def to_parquet(artifact_id):
+    """Converts a CSV artifact to Parquet (once) and returns the path; needs pyarrow."""
+    import pyarrow.csv
+    import pyarrow.parquet
+    source, target = artifact_path(artifact_id, "csv"), artifact_path(artifact_id, "parquet")
+    if not os.path.exists(target):
+        tmp = target + ".tmp"
+        pyarrow.parquet.write_table(pyarrow.csv.read_csv(source), tmp)
+        os.replace(tmp, target)
+    return target
+
+
+def cleanup_artifacts(ttl=ARTIFACT_TTL_SECONDS):
+    if not os.path.isdir(ARTIFACT_DIR):
+        return 0
+    removed, cutoff = 0, time.time() - ttl
+    for name in os.listdir(ARTIFACT_DIR):
+        path = os.path.join(ARTIFACT_DIR, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+# --- RESULT SUMMARY ---
+
+class ResultCollector:
+    """Consumes rows in batches: keeps a preview, per-column stats and (for large results) a CSV artifact."""
+
+    def __init__(self, columns, preview=SQL_PREVIEW_ROWS, limit=SQL_ROW_LIMIT):
+        self.columns = list(columns)
+        self.preview_size = preview
+        self.limit = limit
+        self.preview = []
+        self.count = 0
+        self.truncated = False
+        self.nulls = [0] * len(self.columns)
+        self.numeric = [None] * len(self.columns)  # [min, max, sum, n] while every value is a number
+        self.distinct = [set() for _ in self.columns]
+        self.artifact_id = None
+        self._file = self._writer = None
+
+    def _open_artifact(self):
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        cleanup_artifacts()
+        self.artifact_id = uuid.uuid4().hex
+        self._file = open(artifact_path(self.artifact_id), "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+        self._writer.writerows(self.preview)
+
+    def add(self, rows):
+        for row in rows:
+            if self.count >= self.limit:
+                self.truncated = True
+                return
+            self.count += 1
+            row = tuple(row)
+            if len(self.preview) < self.preview_size:
+                self.preview.append(row)
+            elif self._writer is None:
+                self._open_artifact()
+            if self._writer is not None and self.count > self.preview_size:
+                self._writer.writerow(row)
+            self._observe(row)
+
+    def _observe(self, row):
+        for i, value in enumerate(row):
+            if value is None:
+                self.nulls[i] += 1
+                continue
+            if len(self.distinct[i]) <= DISTINCT_CAP:
+                self.distinct[i].add(value if isinstance(value, (str, int, float, Decimal)) else str(value))
+            stats = self.numeric[i]
+            if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool) and stats is not False:
+                number = float(value)
+                self.numeric[i] = [number, number, number, 1] if stats is None else \
+                    [min(stats[0], number), max(stats[1], number), stats[2] + number, stats[3] + 1]
+            else:
+                self.numeric[i] = False
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self, format_rows):
+        """The small result as `format_rows` renders it, or a compact summary of a large one."""
+        self.close()
+        if self.count <= self.preview_size and not self.truncated:
+            return format_rows(self.preview)
+        lines = [f"Query returned {self.count} rows" + (f" (stopped at the {self.limit}-row limit)" if self.truncated else "")
+                 + f" with columns: {', '.join(self.columns)}.", "Column stats:"]
+        for i, column in enumerate(self.columns):
+            distinct = len(self.distinct[i])
+            described = f"{DISTINCT_CAP}+" if distinct > DISTINCT_CAP else str(distinct)
+            stats = self.numeric[i]
+            if stats:
+                lines.append(f"- {column}: min {stats[0]:g}, max {stats[1]:g}, mean {stats[2] / stats[3]:.4g}, "
+                             f"{described} distinct, {self.nulls[i]} null")
+            else:
+                lines.append(f"- {column}: {described} distinct, {self.nulls[i]} null")
+        lines.append(f"First {len(self.preview)} rows: {format_rows(self.preview)}")
+        lines.append(f"Full result (CSV, or ?format=parquet): /artifacts/{self.artifact_id}")
+        return "\n".join(lines)
+
+
+# --- EXECUTION ---
+
+def _plan_cost(plan):
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Total Cost"], plan[0]["Plan"]["Plan Rows"]
+
+
+def _reject_costly(cost, rows):
+    if cost > SQL_MAX_COST:
+        raise QueryRejected(f"The query is too expensive to run (estimated cost {cost:.0f}, ~{rows} rows). "
+                            "Add filters (a department, course or student) or aggregate instead of listing rows.")
+
+
+def _setup(conn):
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SET TRANSACTION READ ONLY"))
+        conn.execute(text(f"SET LOCAL statement_timeout = {SQL_STATEMENT_TIMEOUT_MS}"))
+
+
+async def _asetup(conn):
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SET TRANSACTION READ ONLY"))
+        await conn.execute(text(f"SET LOCAL statement_timeout = {SQL_STATEMENT_TIMEOUT_MS}"))
+
+
+def run(sql, format_rows, params=None):
+    """Runs generated SQL under the guardrails; returns the result string for the agent."""
+    limited = with_limit(guard(sql))
+    with connection() as conn:
+        _setup(conn)
+        if conn.dialect.name == "postgresql":
+            _reject_costly(*_plan_cost(conn.execute(text("EXPLAIN (FORMAT JSON) " + limited), params or {}).scalar()))
+        # stream_results: a server-side cursor, so only SQL_FETCH_SIZE rows are in memory at once
+        result = conn.execution_options(stream_results=True, max_row_buffer=SQL_FETCH_SIZE).execute(text(limited), params or {})
+        collector = ResultCollector(result.keys())
+        try:
+            for rows in result.partitions(SQL_FETCH_SIZE):
+                collector.add(rows)
+        finally:
+            collector.close()
+            result.close()
+    return collector.summary(format_rows)
+
+
+async def arun(sql, format_rows, params=None):
+    """Async counterpart of `run` (asyncpg streams through a server-side cursor as well)."""
+    limited = with_limit(guard(sql))
+    async with async_connection() as conn:
+        await _asetup(conn)
+        if conn.dialect.name == "postgresql":
+            _reject_costly(*_plan_cost((await conn.execute(text("EXPLAIN (FORMAT JSON) " + limited), params or {})).scalar()))
+        result = await conn.stream(text(limited), params or {})
+        collector = ResultCollector(result.keys())
+        try:
+            async for rows in result.partitions(SQL_FETCH_SIZE):
+                collector.add(rows)
+        finally:
+            collector.close()
+            await result.close()
+    return collector.summary(format_rows)
+
+
+def run_template(library, template, params, format_rows):
+    """Runs a query-library template (prepared on PostgreSQL) in the same read-only, time-limited transaction."""
+    start = time.perf_counter()
+    with connection() as conn:
+        _setup(conn)
+        result = library.result(conn, template, params)
+        collector = ResultCollector(result.keys())
+        try:
+            for rows in result.partitions(SQL_FETCH_SIZE):
+                collector.add(rows)
+        finally:
+            collector.close()
+    library.record(template, time.perf_counter() - start)
+    return collector.summary(format_rows)
+
+
+async def arun_template(library, template, params, format_rows):
+    start = time.perf_counter()
+    async with async_connection() as conn:
+        await _asetup(conn)
+        result = await conn.stream(text(with_limit(template["sql"])), params or {})
+        collector = ResultCollector(result.keys())
+        try:
+            async for rows in result.partitions(SQL_FETCH_SIZE):
+                collector.add(rows)
+        finally:
+            collector.close()
+            await result.close()
+    library.record(template, time.perf_counter() - start)
+    return collector.summary(format_rows)
@@ -0,0 +1,300 @@
+# timetable_engine.py (Constraint-based timetable engine used by the scheduler)
+#
+# Time is a list of slot indices (day * periods_per_day + period). Availability
+# is kept as bitsets: one int per teacher and per cohort with a bit per busy
+# slot, and one int per slot with a bit per busy room. Rooms are indexed in
+# ascending capacity, so "smallest free room that fits" is a single mask
+# operation. Lectures are placed most-constrained first, and any that do not
+# fit are repaired with bounded ejection chains (move a blocking lecture
+# elsewhere, recursively, up to `max_repair_depth`).
+
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+
+@dataclass(frozen=True)
+class Lecture:
+    lecture_id: int
+    course_id: int
+    teacher_id: int
+    cohort_ids: Tuple = ()  # student groups that must not have two lectures at once
+    size: int = 0           # enrolled students; 0 = unknown, fits any room
+
+
+@dataclass(frozen=True)
+class Room:
+    room_id: int
+    capacity: int = 0       # 0 = unknown, treated as unlimited
+
+
+@dataclass
+class ScheduleResult:
+    placements: Dict[int, Tuple[int, int]] = field(default_factory=dict)  # lecture_id -> (slot, room_id)
+    unplaced: List[Lecture] = field(default_factory=list)
+    moved: List[int] = field(default_factory=list)  # pinned lectures that had to move
+    repaired: int = 0                                # lectures placed by the repair phase
+
+
+def _bits(mask):
+    """Yields the indices of the set bits of `mask`, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class TimetableEngine:
+    def __init__(self, num_days, periods_per_day, rooms, seed=0, max_repair_depth=2, repair_budget=20000):
+        self.num_days = num_days
+        self.periods_per_day = periods_per_day
+        self.num_slots = num_days * periods_per_day
+        self.all_slots = (1 << self.num_slots) - 1
+        self.rng = random.Random(seed)
+        self.max_repair_depth = max_repair_depth
+        self.repair_budget = repair_budget
+
+        # Rooms sorted by capacity (unknown capacity last) so the lowest free bit is the best fit
+        self.rooms = sorted(rooms, key=lambda r: (r.capacity <= 0, r.capacity, r.room_id))
+        self.room_index = {room.room_id: i for i, room in enumerate(self.rooms)}
+        self.all_rooms = (1 << len(self.rooms)) - 1
+
+        # Busy bitsets
+        self.teacher_busy = {}
+        self.cohort_busy = {}
+        self.slot_rooms_busy = [0] * self.num_slots
+        # Who occupies what, so a blocking lecture can be found and moved
+        self.teacher_at = {}
+        self.cohort_at = {}
+        self.room_at = {}
+        self.lectures = {}
+        self.placements = {}
+        self.movable = set()
+        self.pinned = {}
+        self.course_days = Counter()  # (course_id, day) -> lectures of that course on that day
+
+        # A fixed, seeded preference order over slots breaks ties deterministically
+        order = list(range(self.num_slots))
+        self.rng.shuffle(order)
+        self.slot_rank = {slot: rank for rank, slot in enumerate(order)}
+        self._rooms_for_size = {}
+
+    # --- SETUP ---
+
+    def block_teacher(self, teacher_id, slots):
+        for slot in slots:
+            self.teacher_busy[teacher_id] = self.teacher_busy.get(teacher_id, 0) | (1 << slot)
+
+    def block_cohort(self, cohort_id, slots):
+        for slot in slots:
+            self.cohort_busy[cohort_id] = self.cohort_busy.get(cohort_id, 0) | (1 << slot)
+
+    def block_room(self, room_id, slots):
+        """Marks a room as unavailable (e.g. booked by another department)."""
+        index = self.room_index.get(room_id)
+        if index is None:
+            return
+        for slot in slots:
+            self.slot_rooms_busy[slot] |= 1 << index
+
+    def is_free(self, lecture, slot, room_id):
+        """True if `lecture` can sit in `room_id` at `slot` without any clash or capacity problem."""
+        index = self.room_index.get(room_id)
+        if index is None or not 0 <= slot < self.num_slots or not self._rooms_that_fit(lecture.size) >> index & 1:
+            return False
+        return bool(self._free_slots(lecture) >> slot & 1) and not self.slot_rooms_busy[slot] >> index & 1
+
+    def pin(self, lecture, slot, room_id, movable=True):
+        """Places an existing lecture. Movable pins may be relocated by the repair phase (and are reported in `moved`)."""
+        self.lectures[lecture.lecture_id] = lecture
+        self.pinned[lecture.lecture_id] = (slot, room_id)
+        if movable:
+            self.movable.add(lecture.lecture_id)
+        self._place(lecture, slot, self.room_index[room_id])
+
+    # --- BOOKKEEPING ---
+
+    def _place(self, lecture, slot, room):
+        bit = 1 << slot
+        self.teacher_busy[lecture.teacher_id] = self.teacher_busy.get(lecture.teacher_id, 0) | bit
+        self.teacher_at[(lecture.teacher_id, slot)] = lecture.lecture_id
+        for cohort in lecture.cohort_ids:
+            self.cohort_busy[cohort] = self.cohort_busy.get(cohort, 0) | bit
+            self.cohort_at[(cohort, slot)] = lecture.lecture_id
+        self.slot_rooms_busy[slot] |= 1 << room
+        self.room_at[(room, slot)] = lecture.lecture_id
+        self.course_days[(lecture.course_id, slot // self.periods_per_day)] += 1
+        self.placements[lecture.lecture_id] = (slot, room)
+
+    def _unplace(self, lecture):
+        slot, room = self.placements.pop(lecture.lecture_id)
+        bit = 1 << slot
+        self.teacher_busy[lecture.teacher_id] &= ~bit
+        del self.teacher_at[(lecture.teacher_id, slot)]
+        for cohort in lecture.cohort_ids:
+            self.cohort_busy[cohort] &= ~bit
+            del self.cohort_at[(cohort, slot)]
+        self.slot_rooms_busy[slot] &= ~(1 << room)
+        del self.room_at[(room, slot)]
+        self.course_days[(lecture.course_id, slot // self.periods_per_day)] -= 1
+        return slot, room
+
+    def _rooms_that_fit(self, size):
+        mask = self._rooms_for_size.get(size)
+        if mask is None:
+            mask = 0
+            for i, room in enumerate(self.rooms):
+                if room.capacity <= 0 or size <= 0 or room.capacity >= size:
+                    mask |= 1 << i
+            self._rooms_for_size[size] = mask
+        return mask
+
+    def _free_slots(self, lecture):
+        busy = self.teacher_busy.get(lecture.teacher_id, 0)
+        for cohort in lecture.cohort_ids:
+            busy |= self.cohort_busy.get(cohort, 0)
+        return self.all_slots & ~busy
+
+    def _score(self, lecture, slot):
+        # Prefer days on which the course has no lecture yet, then the seeded slot order
+        return (self.course_days[(lecture.course_id, slot // self.periods_per_day)], self.slot_rank[slot])
+
+    def _best_slot(self, lecture, exclude=0):
+        fits = self._rooms_that_fit(lecture.size)
+        best = None
+        for slot in _bits(self._free_slots(lecture) & ~exclude):
+            free_rooms = fits & ~self.slot_rooms_busy[slot]
+            if not free_rooms:
+                continue
+            score = self._score(lecture, slot)
+            if best is None or score < best[0]:
+                best = (score, slot, (free_rooms & -free_rooms).bit_length() - 1)
+        return None if best is None else best[1:]
+
+    # --- REPAIR ---
+
+    def _blockers(self, lecture, slot, tabu):
+        """(blocking lecture or None if the slot is free, room to use) at `slot`, or None if
+        more than one lecture or an availability constraint is in the way."""
+        blockers = set()
+        teacher_owner = self.teacher_at.get((lecture.teacher_id, slot))
+        if self.teacher_busy.get(lecture.teacher_id, 0) >> slot & 1:
+            if teacher_owner is None:
+                return None  # blocked by an availability constraint, not by a lecture
+            blockers.add(teacher_owner)
+        for cohort in lecture.cohort_ids:
+            if self.cohort_busy.get(cohort, 0) >> slot & 1:
+                owner = self.cohort_at.get((cohort, slot))
+                if owner is None:
+                    return None
+                blockers.add(owner)
+        if len(blockers) > 1:
+            return None
+
+        fits = self._rooms_that_fit(lecture.size)
+        free_rooms = fits & ~self.slot_rooms_busy[slot]
+        if blockers:
+            blocker = next(iter(blockers))
+            blocker_room = self.placements[blocker][1]
+            if free_rooms:
+                room = (free_rooms & -free_rooms).bit_length() - 1
+            elif fits >> blocker_room & 1:
+                room = blocker_room
+            else:
+                return None
+        elif free_rooms:
+            return None, (free_rooms & -free_rooms).bit_length() - 1
+        else:
+            # Only the rooms are full: evict the occupant of the best-fitting room we may move
+            for room in _bits(fits):
+                blocker = self.room_at.get((room, slot))
+                if blocker is not None and blocker in self.movable and blocker not in tabu:
+                    break
+            else:
+                return None
+        if blocker not in self.movable or blocker in tabu:
+            return None
+        return blocker, room
+
+    def _repair(self, lecture, depth, tabu):
+        """Places `lecture` by moving one blocking lecture, recursively, up to `depth` levels."""
+        candidates = sorted(range(self.num_slots), key=lambda s: self._score(lecture, s))
+        for slot in candidates:
+            if self.repair_budget <= 0:
+                return False
+            self.repair_budget -= 1
+            found = self._blockers(lecture, slot, tabu)
+            if found is None:
+                continue
+            blocker_id, room = found
+            if blocker_id is None:
+                self._place(lecture, slot, room)
+                return True
+            blocker = self.lectures[blocker_id]
+            old_slot, old_room = self._unplace(blocker)
+            self._place(lecture, slot, room)
+            target = self._best_slot(blocker, exclude=1 << old_slot)
+            if target is not None:
+                self._place(blocker, *target)
+                return True
+            if depth > 1 and self._repair(blocker, depth - 1, tabu | {blocker_id}):
+                return True
+            self._unplace(lecture)
+            self._place(blocker, old_slot, old_room)
+        return False
+
+    # --- SOLVE ---
+
+    def solve(self, lectures):
+        """Places `lectures` around any pinned ones. Deterministic for a given seed and input."""
+        teacher_load = Counter(l.teacher_id for l in lectures)
+        cohort_load = Counter(c for l in lectures for c in l.cohort_ids)
+        tie_break = {l.lecture_id: self.rng.random() for l in lectures}
+        order = sorted(lectures, key=lambda l: (
+            -(teacher_load[l.teacher_id] + sum(cohort_load[c] for c in l.cohort_ids)),
+            -l.size,
+            tie_break[l.lecture_id],
+        ))
+
+        result = ScheduleResult()
+        pending = []
+        for lecture in order:
+            self.lectures[lecture.lecture_id] = lecture
+            self.movable.add(lecture.lecture_id)
+            target = self._best_slot(lecture)
+            if target is None:
+                pending.append(lecture)
+            else:
+                self._place(lecture, *target)
+
+        for lecture in pending:
+            if self._repair(lecture, self.max_repair_depth, frozenset({lecture.lecture_id})):
+                result.repaired += 1
+            else:
+                result.unplaced.append(lecture)
+
+        for lecture_id, (slot, room) in self.placements.items():
+            result.placements[lecture_id] = (slot, self.rooms[room].room_id)
+        result.moved = sorted(lecture_id for lecture_id, placed in self.pinned.items()
+                              if result.placements.get(lecture_id) != placed)
+        return result
+
+
+def validate(result, lectures, rooms):
+    """Returns a list of hard-constraint violations in a result (empty when clash-free)."""
+    by_id = {l.lecture_id: l for l in lectures}
+    capacity = {r.room_id: r.capacity for r in rooms}
+    seen, problems = {}, []
+    for lecture_id, (slot, room_id) in result.placements.items():
+        lecture = by_id.get(lecture_id)
+        if lecture is None:
+            continue
+        keys = [("teacher", lecture.teacher_id), ("room", room_id)] + [("cohort", c) for c in lecture.cohort_ids]
+        for key in keys:
+            other = seen.setdefault((key, slot), lecture_id)
+            if other != lecture_id:
+                problems.append(f"{key[0]} {key[1]} double-booked at slot {slot} by lectures {other} and {lecture_id}")
+        if capacity.get(room_id, 0) > 0 and lecture.size > capacity[room_id]:
+            problems.append(f"lecture {lecture_id} ({lecture.size} students) does not fit room {room_id}")
+    return problems
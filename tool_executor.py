@@ -0,0 +1,160 @@
+# tool_executor.py (Runs all tool calls of one agent turn concurrently)
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from langchain_core.messages import ToolMessage
+
+import tracing
+
+# --- CONFIGURATION ---
+TOOL_FANOUT_LIMIT = int(os.getenv("TOOL_FANOUT_LIMIT", "4"))           # tool calls running at once per turn
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "60"))  # default per-call timeout
+# Per-tool overrides, e.g. TOOL_TIMEOUTS='{"timetable_replanner": 180}'. Schedule generation and PDF
+# export need none: they run as background jobs and their tools return a job ID at once.
+TOOL_TIMEOUTS = json.loads(os.getenv("TOOL_TIMEOUTS", "{}"))
+TOOL_TRACE = os.getenv("TOOL_TRACE", "0") not in ("0", "false", "False")
+
+log = logging.getLogger(__name__)
+
+
+class ParallelToolNode:
+    """Drop-in replacement for LangGraph's ToolNode that fans out the tool calls of one
+    AIMessage with a concurrency limit and per-tool timeouts.
+
+    ToolMessages are always returned in the order of the AIMessage's tool_calls.
+    """
+
+    def __init__(self, tools, max_concurrency=TOOL_FANOUT_LIMIT, timeout=TOOL_TIMEOUT_SECONDS,
+                 timeouts=None, trace=TOOL_TRACE):
+        self.tools_by_name = {tool.name: tool for tool in tools}
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.timeouts = dict(TOOL_TIMEOUTS if timeouts is None else timeouts)
+        self.trace = trace
+
+    def timeout_for(self, tool_name):
+        return self.timeouts.get(tool_name, self.timeout)
+
+    # --- HELPERS ---
+
+    @staticmethod
+    def _tool_calls(state):
+        return state["messages"][-1].tool_calls
+
+    def _message(self, call, content, status="success"):
+        if not isinstance(content, str):
+            content = str(content)
+        return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status=status)
+
+    def _error(self, call, error):
+        return self._message(call, f"Error: {error!r}\n Please fix your mistakes.", status="error")
+
+    def _unknown(self, call):
+        names = ", ".join(self.tools_by_name)
+        return self._message(call, f"Error: {call['name']} is not a valid tool, try one of [{names}].", status="error")
+
+    # --- SYNC PATH (CLI) ---
+
+    def invoke(self, state):
+        calls = self._tool_calls(state)
+        node_start = time.perf_counter()
+        spans = [None] * len(calls)
+        start_times = [None] * len(calls)
+        started = [threading.Event() for _ in calls]
+
+        def run(i, call):
+            start = start_times[i] = time.perf_counter()
+            started[i].set()
+            try:
+                with tracing.span("tool", call["name"]):
+                    return self.tools_by_name[call["name"]].invoke(call["args"])
+            finally:
+                spans[i] = (start - node_start, time.perf_counter() - node_start)
+
+        results = []
+        # Threads cannot be cancelled: a call that times out keeps running in the
+        # background, but the turn moves on without waiting for it.
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(calls)) or 1,
+                                      thread_name_prefix="tool-call")
+        try:
+            # Each call runs in a copy of this context, so its span nests under the "action" node
+            futures = [executor.submit(tracing.in_context(run), i, call) if call["name"] in self.tools_by_name else None
+                       for i, call in enumerate(calls)]
+            for i, (call, future) in enumerate(zip(calls, futures)):
+                if future is None:
+                    results.append((self._unknown(call), "unknown"))
+                    continue
+                # The timeout counts from when the call starts running, not from when it was queued. Calls that
+                # timed out keep their threads busy, so a queued call may never start: that wait is bounded too.
+                if not started[i].wait(self.timeout_for(call["name"])):
+                    future.cancel()
+                    results.append((self._timeout(call), "timeout"))
+                    continue
+                remaining = self.timeout_for(call["name"]) - (time.perf_counter() - start_times[i])
+                try:
+                    results.append((self._message(call, future.result(timeout=max(0.0, remaining))), "ok"))
+                except FutureTimeoutError:
+                    results.append((self._timeout(call), "timeout"))
+                except Exception as e:
+                    results.append((self._error(call, e), "error"))
+        finally:
+            executor.shutdown(wait=False)
+        self._print_trace(calls, spans, results, node_start)
+        return {"messages": [message for message, _ in results]}
+
+    def _timeout(self, call):
+        return self._message(call, f"Error: {call['name']} timed out after {self.timeout_for(call['name']):g}s.",
+                             status="error")
+
+    # --- ASYNC PATH (API server) ---
+
+    async def ainvoke(self, state):
+        calls = self._tool_calls(state)
+        node_start = time.perf_counter()
+        spans = [None] * len(calls)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(i, call):
+            tool = self.tools_by_name.get(call["name"])
+            if tool is None:
+                return self._unknown(call), "unknown"
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    with tracing.span("tool", call["name"]):
+                        output = await asyncio.wait_for(tool.ainvoke(call["args"]), self.timeout_for(call["name"]))
+                    return self._message(call, output), "ok"
+                except asyncio.TimeoutError:
+                    return self._timeout(call), "timeout"
+                except Exception as e:
+                    return self._error(call, e), "error"
+                finally:
+                    spans[i] = (start - node_start, time.perf_counter() - node_start)
+
+        results = await asyncio.gather(*(run(i, call) for i, call in enumerate(calls)))
+        self._print_trace(calls, spans, results, node_start)
+        return {"messages": [message for message, _ in results]}
+
+    # --- TRACE ---
+
+    def _print_trace(self, calls, spans, results, node_start, width=40):
+        if not self.trace:
+            return
+        wall = time.perf_counter() - node_start
+        summed = sum(end - start for start, end in filter(None, spans))
+        log.info("Tool trace: %d call(s), wall %.2fs, summed %.2fs (overlap %.2fx, fan-out limit %d)",
+                 len(calls), wall, summed, summed / wall if wall else 0, self.max_concurrency)
+        for call, span, (_, status) in zip(calls, spans, results):
+            if span is None:
+                log.info(f"  {call['name']:<30} {'':<{width}}  {status}")
+                continue
+            start, end = span
+            left = int(width * start / wall) if wall else 0
+            bar = " " * left + "#" * max(1, int(width * end / wall) - left if wall else 1)
+            log.info(f"  {call['name']:<30} |{bar:<{width}}| {start:6.2f}s -> {end:6.2f}s  {status}")
@@ -0,0 +1,172 @@
+# tool_registry.py (Lazy, shared resources for all tools)
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+# --- CONFIGURATION ---
+load_dotenv()
+CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# An embedding_server.py sidecar (e.g. http://127.0.0.1:8001) shared by all worker processes; unset = load the model here
+EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL")
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gpt-4o")
+# Upper bound on blocking tool calls (Chroma, reportlab, scheduling) running at once
+TOOL_THREAD_POOL_SIZE = int(os.getenv("TOOL_THREAD_POOL_SIZE", "8"))
+# Where the Twilio clients send API calls, e.g. http://127.0.0.1:8081 for a local stub; unset = api.twilio.com
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL")
+
+# Every heavy resource is built by a factory the first time someone asks for it,
+# then shared by every tool in the process. Importing this module is cheap.
+_factories = {}
+_instances = {}
+_lock = threading.RLock()
+
+# {resource_name: seconds spent inside its factory}
+INIT_TIMINGS = {}
+
+
+def resource(name):
+    """Registers the decorated function as the lazy factory for `name`."""
+    def decorator(factory):
+        _factories[name] = factory
+
+        def getter():
+            return get(name)
+
+        getter.__name__ = factory.__name__
+        getter.__doc__ = factory.__doc__
+        return getter
+    return decorator
+
+
+def get(name):
+    """Returns the shared instance of a resource, building it on first use."""
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+    # An RLock lets one factory depend on another (the vector store needs the embeddings).
+    with _lock:
+        if name not in _instances:
+            start = time.perf_counter()
+            _instances[name] = _factories[name]()
+            INIT_TIMINGS[name] = time.perf_counter() - start
+        return _instances[name]
+
+
+def override(name, factory):
+    """Replaces a factory (e.g. with a local stand-in) and drops any built instance."""
+    with _lock:
+        _factories[name] = factory
+        _instances.pop(name, None)
+        INIT_TIMINGS.pop(name, None)
+
+
+def reset(name=None):
+    """Forgets built instances so they are rebuilt on next use."""
+    with _lock:
+        if name is None:
+            _instances.clear()
+            INIT_TIMINGS.clear()
+        else:
+            _instances.pop(name, None)
+            INIT_TIMINGS.pop(name, None)
+
+
+def is_initialized(name):
+    return name in _instances
+
+
+# --- RESOURCES ---
+# Heavy libraries are imported inside the factories so that importing the tools
+# (and therefore the API server) does not pay for torch, chromadb or SQLAlchemy reflection.
+# The database engine itself is registered by db_pool.py.
+
+@resource("llm")
+def get_llm():
+    """The shared chat model used by the agent and by every LLM-backed chain."""
+    from langchain_openai import ChatOpenAI
+    from tracing import llm_tracer
+    # stream_usage: token counts are reported for streamed answers too
+    return ChatOpenAI(model_name=LLM_MODEL_NAME, temperature=0, stream_usage=True, callbacks=[llm_tracer])
+
+
+@resource("embedding_model")
+def get_embedding_model():
+    """The sentence-transformers model used for retrieval, behind the cached, batched query encoder.
+
+    With EMBEDDING_SERVICE_URL set the model runs once in embedding_server.py and every worker process calls it.
+    """
+    from embedding_service import EmbeddingService, RemoteEmbeddings
+    if EMBEDDING_SERVICE_URL:
+        return EmbeddingService(RemoteEmbeddings(EMBEDDING_SERVICE_URL))
+    return EmbeddingService(load_local_embeddings())
+
+
+def load_local_embeddings():
+    """The model itself, loaded into this process."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from embedding_service import configure_torch_threads
+    configure_torch_threads()
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+@resource("vectorstore")
+def get_vectorstore():
+    """The persisted Chroma store holding the knowledge base."""
+    from langchain_community.vectorstores import Chroma
+    return Chroma(persist_directory=CHROMA_PERSIST_DIRECTORY, embedding_function=get_embedding_model())
+
+
+@resource("sql_database")
+def get_sql_database():
+    """One SQLDatabase (and so one schema reflection) for all SQL tools, on the shared pool."""
+    from langchain_community.utilities import SQLDatabase
+    from db_pool import get_engine
+    return SQLDatabase(get_engine())
+
+
+@resource("twilio_client")
+def get_twilio_client():
+    """The Twilio REST client used for WhatsApp notifications."""
+    from twilio.rest import Client
+    return _with_base_url(Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN")))
+
+
+@resource("async_twilio_client")
+def get_async_twilio_client():
+    """A Twilio client on aiohttp, for `messages.create_async` from the event loop."""
+    from twilio.rest import Client
+    from twilio.http.async_http_client import AsyncTwilioHttpClient
+    return _with_base_url(Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"),
+                                 http_client=AsyncTwilioHttpClient()))
+
+
+def _with_base_url(client):
+    if TWILIO_API_BASE_URL:
+        client.api.base_url = TWILIO_API_BASE_URL
+    return client
+
+
+@resource("tool_thread_pool")
+def get_tool_thread_pool():
+    """The bounded pool that blocking tool work is pushed onto when called from async code."""
+    return ThreadPoolExecutor(max_workers=TOOL_THREAD_POOL_SIZE, thread_name_prefix="tool")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs a blocking call on the tool thread pool without stalling the event loop.
+
+    The call runs in a copy of the caller's context (like asyncio.to_thread), so tracing
+    spans opened inside it nest under the caller's span.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_tool_thread_pool(), call)
@@ -0,0 +1,212 @@
+# tracing.py (Spans, per-stage latency metrics and level-gated logging)
+#
+# A span times one stage of a request: the turn in api_server, each LangGraph
+# node, each tool call, and the DB, LLM and embedding calls underneath them.
+# Spans nest through a context variable (so they follow asyncio tasks), feed the
+# Prometheus histograms served at /metrics, and are appended as JSON lines to
+# TRACE_FILE when it is set:
+#   {"trace": ..., "span": ..., "parent": ..., "kind": "tool", "name": "database_analyzer",
+#    "start": <unix time>, "seconds": 0.84, "status": "ok", ...attributes}
+# LLM spans carry prompt/completion token counts. Nothing is formatted or
+# written for a disabled log level or an unset TRACE_FILE.
+
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import metrics
+
+# --- CONFIGURATION ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+TRACE_FILE = os.getenv("TRACE_FILE")  # e.g. ./traces.jsonl; unset = metrics only
+TRACE_SQL_CHARS = 200                  # statement text kept in DB spans of the trace file
+
+log = logging.getLogger(__name__)
+
+span_seconds = metrics.histogram("span_seconds", "Time spent per stage (request, node, tool, db, llm, embedding).",
+                                 ("kind", "name"))
+span_errors = metrics.counter("span_errors_total", "Stages that raised an exception.", ("kind", "name"))
+llm_tokens = metrics.counter("llm_tokens_total", "LLM tokens by model and type (prompt / completion).", ("model", "type"))
+
+_current = contextvars.ContextVar("current_span", default=None)
+_file_lock = threading.Lock()
+
+
+def configure_logging(level=LOG_LEVEL):
+    """One handler for every module logger; LOG_LEVEL=DEBUG shows the per-node detail."""
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "kind", "name", "attrs", "start", "started_at", "seconds", "status")
+
+    def __init__(self, kind, name, parent=None, **attrs):
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        self.kind, self.name, self.attrs = kind, name, attrs
+        self.start, self.started_at = time.perf_counter(), time.time()
+        self.seconds, self.status = None, "ok"
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, error=None):
+        self.seconds = time.perf_counter() - self.start
+        if error is not None:
+            self.status = "error"
+            self.attrs["error"] = type(error).__name__
+            span_errors.inc(kind=self.kind, name=self.name)
+        span_seconds.observe(self.seconds, kind=self.kind, name=self.name)
+        if TRACE_FILE:
+            _write(self)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s %s %.3fs %s", self.kind, self.name, self.seconds, self.attrs)
+
+
+def _write(s):
+    line = json.dumps({"trace": s.trace_id, "span": s.span_id, "parent": s.parent_id, "kind": s.kind, "name": s.name,
+                       "start": round(s.started_at, 6), "seconds": round(s.seconds, 6), "status": s.status, **s.attrs},
+                      default=str)
+    with _file_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def span(kind, name, **attrs):
+    """Times the block as a child of the current span (or as a new trace)."""
+    s = Span(kind, name, _current.get(), **attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.finish(e)
+        raise
+    else:
+        s.finish()
+    finally:
+        _current.reset(token)
+
+
+def record(kind, name, seconds, **attrs):
+    """A span that already happened (measured elsewhere, e.g. on a worker thread)."""
+    s = Span(kind, name, _current.get(), **attrs)
+    s.start = time.perf_counter() - seconds
+    s.started_at -= seconds
+    s.finish()
+
+
+def traced(kind, name=None):
+    """Decorator: runs every call of a sync or async function inside a span."""
+    def decorator(func):
+        label = name or func.__name__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(kind, label):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(kind, label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_context(func):
+    """Binds `func` to a copy of the current context, so spans started on a worker thread nest correctly."""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+# --- DATABASE ---
+
+def instrument_engine(engine):
+    """One "db" span per statement executed on `engine` (pass `async_engine.sync_engine` for async engines)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_starts", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("trace_starts")
+        if not starts:
+            return
+        seconds = time.perf_counter() - starts.pop()
+        verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "statement"
+        attrs = {"rows": cursor.rowcount} if cursor.rowcount is not None and cursor.rowcount >= 0 else {}
+        if TRACE_FILE:
+            attrs["sql"] = " ".join(statement.split())[:TRACE_SQL_CHARS]
+        record("db", verb, seconds, **attrs)
+
+
+# --- LLM ---
+
+class LLMTracer(BaseCallbackHandler):
+    """Callback handler: one "llm" span per model call, with prompt and completion token counts."""
+
+    run_inline = True  # called in the caller's context, so the span nests under the node or tool
+
+    def __init__(self):
+        self._spans = {}
+
+    def _start(self, serialized, run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or (serialized or {}).get("name") or "llm"
+        self._spans[run_id] = Span("llm", model, _current.get())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        s = self._spans.pop(run_id, None)
+        if s is None:
+            return
+        prompt, completion = _token_usage(response)
+        if prompt or completion:
+            s.set(prompt_tokens=prompt, completion_tokens=completion)
+            llm_tokens.inc(prompt, model=s.name, type="prompt")
+            llm_tokens.inc(completion, model=s.name, type="completion")
+        s.finish()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        s = self._spans.pop(run_id, None)
+        if s is not None:
+            s.finish(error)
+
+
+def _token_usage(response):
+    """(prompt, completion) tokens from usage_metadata (also set when streaming) or the OpenAI llm_output."""
+    prompt = completion = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt += usage.get("input_tokens", 0)
+                completion += usage.get("output_tokens", 0)
+    if not (prompt or completion):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return prompt, completion
+
+
+llm_tracer = LLMTracer()